@@ -28,7 +28,7 @@ class ShortContextManager:
 
 
 
-    def save_to_shortContextMem(self, inp, ans):
+    def save_to_shortContextMem(self, inp, ans, backup=True):
         # chuẩn hóa inp và ans
         inp, ans = " ".join(inp.split()), " ".join(ans.split())
         
@@ -39,10 +39,12 @@ class ShortContextManager:
         if len(self.context) > self.max_limit_short_mem_contxt:
             self.context = self.context[ len(self.context)-self.max_limit_short_mem_contxt: ]
         
-        # liên tục sao lưu ngữ cảnh
-        self.backup_short_context_writer()
+        # liên tục sao lưu ngữ cảnh (backup=False khi caller tự sao lưu theo batch)
+        if backup:
+            self.backup_short_context_writer()
 
 
     
     def activate_shortContetxMem(self):
-        return None if str(self.context) == "[]" else self.context
\ No newline at end of file
+        # list rỗng -> None (không cần repr cả list để so với "[]")
+        return self.context if self.context else None
\ No newline at end of file
@@ -65,7 +65,7 @@ class WriteNewLocalMemories:
 
 
 
-    def write_newLocalMem(self, inp, ans):
+    def write_newLocalMem(self, inp, ans, backup=True):
         """
         hàm đặc biệt này sẽ giới hạn số lượng ngữ cảnh tối đa trước khi ghi, để ký ức không chỉ là
         những gì đã diễn ra trong một lần, mà nó còn bao gồm ngữ cảnh
@@ -92,4 +92,6 @@ class WriteNewLocalMemories:
             # cập nhật cắt bớt ngữ cảnh lại
             self.CONTEXT = self.CONTEXT[ len(self.CONTEXT)-self.max_mem_context_towrite: ]
     
-        self.backup_contxt_writer()
\ No newline at end of file
+        # backup=False khi caller tự sao lưu theo batch
+        if backup:
+            self.backup_contxt_writer()
\ No newline at end of file
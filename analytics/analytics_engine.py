@@ -1,161 +1,689 @@
 import json
 import os
+import time
 from datetime import datetime, timedelta
-from collections import defaultdict, Counter
+from collections import defaultdict, Counter, deque
+import itertools
+import heapq
+import bisect
 import re
-import statistics
-from textblob import TextBlob
-import matplotlib.pyplot as plt
-import seaborn as sns
+import numpy as np
+import functools
+import pickle
+import sqlite3
+
+try:
+    import orjson
+except ImportError:
+    # orjson chưa cài, dùng json chuẩn (chậm hơn)
+    orjson = None
+
+
+def _json_default(obj):
+    """Chuyển các kiểu không serialize được (set, numpy scalar) sang kiểu JSON"""
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _dump_json_bytes(data):
+    """Serialize data thành JSON bytes (ưu tiên orjson)"""
+    if orjson is not None:
+        return orjson.dumps(data, default=_json_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, default=_json_default, ensure_ascii=False).encode('utf-8')
+
+
+def _load_json_bytes(raw):
+    """Parse JSON bytes (ưu tiên orjson)"""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+# Regex phân loại tin nhắn - mỗi loại là một alternation, thứ tự dict = thứ tự ưu tiên
+_MESSAGE_TYPE_PATTERNS = {
+    'question': (
+        r'\?'
+        r'|^(?:what|how|when|where|why|who|which|can|could|would|should|is|are|do|does|did)'
+        r'|(?:gì|sao|thế nào|khi nào|ở đâu|tại sao|ai|có thể|được không)'
+    ),
+    'greeting': (
+        r'^(?:hi|hello|hey|chào|xin chào|good morning|good afternoon|good evening)'
+        r'|(?:chào bạn|hello|hi there)'
+    ),
+    'command': (
+        r'^(?:help|hướng dẫn|giúp|làm|tạo|generate|create)'
+        r'|(?:làm giúp|tạo cho|generate|create)'
+    ),
+    'complaint': (
+        r'(?:không|chẳng|tệ|dở|lag|lỗi|sai|wrong|bad|terrible|awful)'
+        r'|(?:không hoạt động|not working|broken)'
+    )
+}
+# Gộp tất cả thành một regex duy nhất: mỗi loại là một lookahead từ đầu chuỗi, các nhánh được
+# thử theo thứ tự ưu tiên nên kết quả giống kiểm tra lần lượt từng loại, `lastgroup` cho biết loại khớp
+_MESSAGE_TYPE_RE = re.compile(
+    '|'.join(
+        f'(?P<{message_type}>(?=.*?(?:{pattern})))'
+        for message_type, pattern in _MESSAGE_TYPE_PATTERNS.items()
+    ),
+    re.IGNORECASE | re.DOTALL
+)
+
+# Định nghĩa các chủ đề
+_TOPIC_KEYWORDS = {
+    'technology': ['ai', 'bot', 'computer', 'internet', 'app', 'software', 'code', 'programming'],
+    'personal': ['tôi', 'mình', 'bạn', 'gia đình', 'friend', 'family', 'personal', 'life'],
+    'work': ['work', 'job', 'office', 'business', 'company', 'career', 'làm việc', 'công việc'],
+    'entertainment': ['game', 'movie', 'music', 'fun', 'entertainment', 'phim', 'nhạc', 'vui'],
+    'education': ['học', 'study', 'school', 'university', 'education', 'learn', 'knowledge'],
+    'health': ['health', 'sick', 'doctor', 'medicine', 'sức khỏe', 'bệnh', 'bác sĩ'],
+    'food': ['food', 'eat', 'restaurant', 'cooking', 'ăn', 'thức ăn', 'món ăn', 'nấu ăn'],
+    'travel': ['travel', 'trip', 'vacation', 'du lịch', 'đi chơi', 'nghỉ mát']
+}
+# Bảng tra ngược keyword -> các topic chứa nó, giữ thứ tự khai báo topic khi trả kết quả
+_KEYWORD_TO_TOPICS = {}
+for _topic, _keywords in _TOPIC_KEYWORDS.items():
+    for _keyword in _keywords:
+        _KEYWORD_TO_TOPICS[_keyword] = _KEYWORD_TO_TOPICS.get(_keyword, ()) + (_topic,)
+del _topic, _keywords, _keyword
+_TOPIC_ORDER = {topic: i for i, topic in enumerate(_TOPIC_KEYWORDS)}
+# Keyword dài nhất (tính theo số từ) - dùng để sinh n-gram cho keyword nhiều từ như 'gia đình'
+_MAX_KEYWORD_WORDS = max(len(kw.split()) for kws in _TOPIC_KEYWORDS.values() for kw in kws)
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _tokenize_keywords(message):
+    """Tách từ tin nhắn thành set token + n-gram để so khớp keyword theo từ"""
+    words = _TOKEN_RE.findall(message.lower())
+    tokens = set(words)
+    for n in range(2, _MAX_KEYWORD_WORDS + 1):
+        tokens.update(' '.join(words[i:i + n]) for i in range(len(words) - n + 1))
+    return tokens
+
+
+# Lexicon cảm xúc (word -> polarity [-1, 1]). Bản đầy đủ được build một lần từ
+# en-sentiment.xml của TextBlob rồi cache ra JSON; bảng dưới đây là phần bổ sung
+# tiếng Việt và fallback khi chưa cài textblob. File JSON nằm trong thư mục dữ liệu
+# analytics của từng AnalyticsEngine (cạnh analytics_data.sqlite).
+_SENTIMENT_LEXICON_NAME = 'sentiment_lexicon.json'
+_BASE_SENTIMENT_LEXICON = {
+    'good': 0.7, 'great': 0.8, 'awesome': 1.0, 'perfect': 1.0, 'excellent': 1.0, 'nice': 0.6,
+    'love': 0.5, 'like': 0.2, 'happy': 0.8, 'thanks': 0.2, 'thank': 0.2, 'best': 1.0, 'cool': 0.35,
+    'fun': 0.3, 'wonderful': 1.0, 'amazing': 0.6, 'beautiful': 0.85, 'glad': 0.5, 'helpful': 0.5,
+    'bad': -0.7, 'terrible': -1.0, 'awful': -1.0, 'horrible': -1.0, 'worst': -1.0, 'hate': -0.8,
+    'sad': -0.5, 'wrong': -0.5, 'angry': -0.5, 'annoying': -0.8, 'boring': -1.0, 'stupid': -0.8,
+    'useless': -0.5, 'broken': -0.4, 'poor': -0.4, 'sick': -0.7,
+    'tốt': 0.7, 'hay': 0.6, 'thích': 0.5, 'vui': 0.6, 'tuyệt': 0.9, 'đẹp': 0.8, 'giỏi': 0.7,
+    'cảm': 0.1, 'ơn': 0.3, 'yêu': 0.6, 'ổn': 0.3, 'xịn': 0.7,
+    'tệ': -0.8, 'dở': -0.7, 'buồn': -0.6, 'ghét': -0.8, 'chán': -0.6, 'sai': -0.5, 'lỗi': -0.4,
+    'kém': -0.6, 'tức': -0.6, 'bực': -0.6, 'ngu': -0.8
+}
+_NEGATION_WORDS = frozenset(['not', 'no', 'never', 'không', 'chẳng', 'chả', 'đừng'])
+_NEGATION_ARRAY = np.array(sorted(_NEGATION_WORDS), dtype=str)
+
+
+def _build_textblob_lexicon():
+    """Đọc en-sentiment.xml của TextBlob, lấy polarity trung bình theo từng từ"""
+    import xml.etree.ElementTree as ET
+    from textblob import en
+    
+    polarities = defaultdict(list)
+    xml_path = os.path.join(os.path.dirname(en.__file__), 'en-sentiment.xml')
+    for word in ET.parse(xml_path).getroot().iter('word'):
+        form = word.get('form', '').lower()
+        if form and ' ' not in form:
+            polarities[form].append(float(word.get('polarity', 0.0)))
+    
+    return {form: sum(values) / len(values) for form, values in polarities.items()}
+
+
+@functools.lru_cache(maxsize=None)
+def _get_sentiment_lexicon(lexicon_file):
+    """Load lexicon cảm xúc một lần cho mỗi file cache"""
+    lexicon = {}
+    try:
+        if os.path.exists(lexicon_file):
+            with open(lexicon_file, 'r', encoding='utf-8') as f:
+                lexicon = json.load(f)
+        else:
+            lexicon = _build_textblob_lexicon()
+            os.makedirs(os.path.dirname(lexicon_file) or '.', exist_ok=True)
+            with open(lexicon_file, 'w', encoding='utf-8') as f:
+                json.dump(lexicon, f, ensure_ascii=False)
+    except Exception as e:
+        print(f"[ANALYTICS] ⚠️ Không load được sentiment lexicon đầy đủ, dùng lexicon cơ bản: {str(e)}")
+    
+    lexicon.update(_BASE_SENTIMENT_LEXICON)
+    return lexicon
+
+
+def _iter_token_polarities(text, lexicon):
+    """Duyệt polarity của các từ trong tin nhắn có mặt trong lexicon"""
+    negate = False
+    for token in _TOKEN_RE.findall(text.lower()):
+        if token in _NEGATION_WORDS:
+            negate = True
+            continue
+        score = lexicon.get(token)
+        if score is not None:
+            # Giống TextBlob: từ phủ định đứng trước đảo chiều và giảm một nửa polarity
+            yield score * -0.5 if negate else score
+        negate = False
+
+
+def _polarity_label(polarity):
+    """Chuyển polarity thành nhãn cảm xúc"""
+    if polarity > 0.1:
+        return 'positive'
+    elif polarity < -0.1:
+        return 'negative'
+    else:
+        return 'neutral'
+
+
+# Các hàm NLP là pure function nên cache theo nội dung tin nhắn -
+# chatbot gặp rất nhiều tin lặp lại ("hi", "help", "cảm ơn"...)
+@functools.lru_cache(maxsize=8192)
+def _analyze_sentiment_cached(text, lexicon_file):
+    """Phân tích cảm xúc (có cache) bằng lexicon: trung bình polarity các từ có trong lexicon"""
+    scores = list(_iter_token_polarities(text, _get_sentiment_lexicon(lexicon_file)))
+    return _polarity_label(sum(scores) / len(scores) if scores else 0.0)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_lexicon_arrays(lexicon_file):
+    """Lexicon dạng hai mảng song song (từ đã sắp xếp, polarity) để tra cứu bằng np.searchsorted"""
+    lexicon = _get_sentiment_lexicon(lexicon_file)
+    words = sorted(lexicon)
+    return np.array(words, dtype=str), np.array([lexicon[word] for word in words], dtype=np.float64)
+
+
+def _batch_sentiment(texts, lexicon_file):
+    """Phân tích cảm xúc cho cả batch tin nhắn - tra lexicon và cộng điểm hoàn toàn bằng numpy"""
+    n = len(texts)
+    tokenized = [_TOKEN_RE.findall(text.lower()) for text in texts]
+    tokens = np.array([token for message_tokens in tokenized for token in message_tokens], dtype=str)
+    if not len(tokens):
+        return ['neutral'] * n
+    
+    message_ids = np.repeat(np.arange(n), [len(message_tokens) for message_tokens in tokenized])
+    
+    # Tra lexicon cho mọi token một lần
+    lexicon_words, lexicon_scores = _get_lexicon_arrays(lexicon_file)
+    index = np.minimum(np.searchsorted(lexicon_words, tokens), len(lexicon_words) - 1)
+    negation = np.isin(tokens, _NEGATION_ARRAY)
+    hit = (lexicon_words[index] == tokens) & ~negation
+    scores = np.where(hit, lexicon_scores[index], 0.0)
+    
+    # Giống TextBlob: từ ngay sau từ phủ định (cùng tin nhắn) bị đảo chiều và giảm một nửa polarity
+    negated = np.zeros(len(tokens), dtype=bool)
+    negated[1:] = negation[:-1] & (message_ids[1:] == message_ids[:-1])
+    scores = np.where(negated, scores * -0.5, scores)
+    
+    totals = np.bincount(message_ids, weights=scores, minlength=n)
+    hits = np.bincount(message_ids[hit], minlength=n)
+    polarity = totals / np.maximum(hits, 1)
+    
+    labels = np.select([polarity > 0.1, polarity < -0.1], ['positive', 'negative'], default='neutral')
+    return labels.tolist()
+
+
+@functools.lru_cache(maxsize=8192)
+def _classify_message_type_cached(message):
+    """Phân loại loại tin nhắn (có cache)"""
+    match = _MESSAGE_TYPE_RE.match(message)
+    return match.lastgroup if match else 'general'
+
+
+@functools.lru_cache(maxsize=8192)
+def _extract_topics_cached(message):
+    """Trích xuất chủ đề (có cache) - trả về tuple để kết quả cache không bị sửa"""
+    matched = set()
+    for token in _tokenize_keywords(message):
+        topics = _KEYWORD_TO_TOPICS.get(token)
+        if topics:
+            matched.update(topics)
+    return tuple(sorted(matched, key=_TOPIC_ORDER.__getitem__)) if matched else ('general',)
+
+
+# Mã hoá các giá trị phân loại thành số nguyên nhỏ cho cột numpy
+_SENTIMENT_NAMES = ('positive', 'negative', 'neutral')
+_SENTIMENT_IDS = {name: i for i, name in enumerate(_SENTIMENT_NAMES)}
+_MESSAGE_TYPE_NAMES = ('question', 'greeting', 'command', 'complaint', 'general')
+_MESSAGE_TYPE_IDS = {name: i for i, name in enumerate(_MESSAGE_TYPE_NAMES)}
+# Topics của một conversation mã hoá thành bitmask (mỗi topic một bit)
+_TOPIC_NAMES = tuple(_TOPIC_KEYWORDS) + ('general',)
+_TOPIC_BITS = {name: 1 << i for i, name in enumerate(_TOPIC_NAMES)}
+
+
+def _encode_topics(topics):
+    """Chuyển list topic thành bitmask"""
+    mask = 0
+    for topic in topics:
+        mask |= _TOPIC_BITS.get(topic, 0)
+    return mask
+
+
+def _trend_histograms_numpy(local_ts, sentiments, n_sentiments):
+    """Đếm tin nhắn theo giờ và theo (ngày, sentiment) - bản numpy"""
+    days = (local_ts // 86400).astype(np.int64)
+    hours = ((local_ts // 3600) % 24).astype(np.int64)
+    first_day = days.min()
+    
+    hourly = np.bincount(hours, minlength=24)
+    daily_sentiments = np.zeros((days.max() - first_day + 1, n_sentiments), np.int64)
+    np.add.at(daily_sentiments, (days - first_day, sentiments.astype(np.int64)), 1)
+    return first_day, hourly, daily_sentiments
+
+
+def _trend_histograms_loop(local_ts, sentiments, n_sentiments):
+    """Đếm tin nhắn theo giờ và theo (ngày, sentiment) - một vòng lặp duy nhất, dành cho numba"""
+    n = local_ts.shape[0]
+    first_day = np.int64(local_ts[0] // 86400)
+    last_day = first_day
+    for i in range(n):
+        day = np.int64(local_ts[i] // 86400)
+        if day < first_day:
+            first_day = day
+        if day > last_day:
+            last_day = day
+    
+    hourly = np.zeros(24, np.int64)
+    daily_sentiments = np.zeros((last_day - first_day + 1, n_sentiments), np.int64)
+    for i in range(n):
+        hourly[np.int64(local_ts[i] // 3600) % 24] += 1
+        daily_sentiments[np.int64(local_ts[i] // 86400) - first_day, sentiments[i]] += 1
+    return first_day, hourly, daily_sentiments
+
+
+@functools.lru_cache(maxsize=None)
+def _get_trend_histograms():
+    """Chọn kernel đếm trends - import numba lúc cần (import numba khá nặng, không làm ở module load)"""
+    try:
+        import numba
+    except ImportError:
+        # numba chưa cài, các kernel tổng hợp chạy bằng numpy
+        return _trend_histograms_numpy
+    return numba.njit(cache=True)(_trend_histograms_loop)
+
+
+def _entry_epoch(entry):
+    """Epoch seconds của entry - dùng 'ts_epoch' lưu sẵn, chỉ parse ISO với dữ liệu cũ"""
+    ts_epoch = entry.get('ts_epoch')
+    if ts_epoch is None:
+        ts_epoch = entry['ts_epoch'] = datetime.fromisoformat(entry['timestamp']).timestamp()
+    return ts_epoch
+
+
+class ConversationColumns:
+    """Lưu các trường số của conversations theo cột (structure-of-arrays) bằng numpy"""
+    
+    GROW_CHUNK = 4096
+    DTYPES = {
+        'ts': np.float64,       # Epoch seconds, tăng dần
+        'lts': np.float64,      # Giờ địa phương tính bằng giây (ts + UTC offset) để chia ngày/giờ
+        'rt': np.float64,       # Response time
+        'mlen': np.int32,       # Độ dài tin nhắn user
+        'rlen': np.int32,       # Độ dài response
+        'sent': np.int8,        # Sentiment id
+        'mtype': np.int8,       # Message type id
+        'topics': np.int16      # Bitmask topics
+    }
+
+    def __init__(self):
+        self.size = 0
+        self._arrays = {name: np.empty(0, dtype) for name, dtype in self.DTYPES.items()}
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, name):
+        """View của cột `name` trên phần dữ liệu đang dùng"""
+        return self._arrays[name][:self.size]
+
+    def append(self, entry, ts):
+        """Thêm một conversation entry vào cuối các cột"""
+        if self.size == len(self._arrays['ts']):
+            capacity = self.size + self.GROW_CHUNK
+            for name, array in self._arrays.items():
+                self._arrays[name] = np.resize(array, capacity)
+        
+        i = self.size
+        arrays = self._arrays
+        arrays['ts'][i] = ts
+        arrays['lts'][i] = ts + time.localtime(ts).tm_gmtoff
+        arrays['rt'][i] = entry.get('response_time', 0)
+        arrays['mlen'][i] = entry.get('message_length', 0)
+        arrays['rlen'][i] = entry.get('response_length', 0)
+        arrays['sent'][i] = _SENTIMENT_IDS.get(entry.get('sentiment'), _SENTIMENT_IDS['neutral'])
+        arrays['mtype'][i] = _MESSAGE_TYPE_IDS.get(entry.get('message_type'), _MESSAGE_TYPE_IDS['general'])
+        arrays['topics'][i] = _encode_topics(entry.get('topics', ()))
+        self.size += 1
+
+    def keep_last(self, count):
+        """Chỉ giữ lại `count` dòng cuối cùng"""
+        if self.size <= count:
+            return
+        start = self.size - count
+        for name, array in self._arrays.items():
+            array[:count] = array[start:self.size]
+        self.size = count
+
+    def start_after(self, cutoff):
+        """Vị trí dòng đầu tiên có timestamp > cutoff"""
+        return int(np.searchsorted(self['ts'], cutoff, side='right'))
 
 
 class AnalyticsEngine:
-    def __init__(self, data_file="analytics/analytics_data.json"):
+    MAX_CONVERSATIONS = 10000  # Số conversations gần nhất giữ trong bộ nhớ
+
+    def __init__(self, data_file="analytics/analytics_data.json", batch_size=64):
         self.data_file = data_file
-        self.conversation_data = []
+        self.snapshot_file = os.path.splitext(data_file)[0] + '.pkl'
+        self.db_file = os.path.splitext(data_file)[0] + '.sqlite'
+        self.batch_size = batch_size
+        self.conversation_data = deque(maxlen=self.MAX_CONVERSATIONS)
+        self._columns = ConversationColumns()  # Các trường số song song với conversation_data
+        self._by_user = defaultdict(deque)  # user_id -> conversations của user trong conversation_data (theo thời gian)
+        self._pending = []  # Conversations chờ phân tích NLP theo batch
+        self._version = 0  # Tăng mỗi lần dữ liệu thay đổi, dùng làm key cache
+        self._aggregate_cache = {}
+        self._aggregate_hour = None  # Giờ (epoch // 3600) của các entry đang nằm trong _aggregate_cache
+        self._user_versions = Counter()  # user_id -> số conversations đã ghi, dùng làm key cache theo user
+        self._saved_version = 0  # Version dữ liệu đã được ghi ra file
         self.user_profiles = defaultdict(dict)
         self.daily_stats = defaultdict(dict)
         
         # Tạo thư mục nếu chưa có
         os.makedirs(os.path.dirname(data_file), exist_ok=True)
         
+        # Lexicon cảm xúc cache chung thư mục dữ liệu
+        self.lexicon_file = os.path.join(os.path.dirname(data_file), _SENTIMENT_LEXICON_NAME)
+        
+        # Conversations lưu append-only trong SQLite, file JSON chỉ giữ số liệu tổng hợp
+        self._db = self._init_db()
+        
         # Load existing data
         self.load_data()
         
         print("[ANALYTICS] 📊 Analytics Engine đã khởi tạo")
 
+    def _init_db(self):
+        """Mở database SQLite (WAL mode) chứa bảng conversations"""
+        db = sqlite3.connect(self.db_file, check_same_thread=False)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('PRAGMA synchronous=NORMAL')
+        db.executescript('''
+            CREATE TABLE IF NOT EXISTS conversations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                ts REAL NOT NULL,
+                timestamp TEXT NOT NULL,
+                user_id TEXT,
+                user_message TEXT,
+                bot_response TEXT,
+                response_time REAL,
+                message_length INTEGER,
+                response_length INTEGER,
+                sentiment INTEGER,
+                message_type INTEGER,
+                topics TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_conversations_ts ON conversations(ts);
+            CREATE INDEX IF NOT EXISTS idx_conversations_user ON conversations(user_id);
+        ''')
+        return db
+
+    def _insert_conversations(self, entries):
+        """Ghi các conversation entries vào SQLite"""
+        self._db.executemany(
+            '''INSERT INTO conversations (ts, timestamp, user_id, user_message, bot_response, response_time,
+                                          message_length, response_length, sentiment, message_type, topics)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+            [
+                (
+                    _entry_epoch(entry), entry['timestamp'], entry['user_id'],
+                    entry['user_message'], entry['bot_response'], entry['response_time'],
+                    entry['message_length'], entry['response_length'],
+                    _SENTIMENT_IDS.get(entry['sentiment'], _SENTIMENT_IDS['neutral']),
+                    _MESSAGE_TYPE_IDS.get(entry['message_type'], _MESSAGE_TYPE_IDS['general']),
+                    ','.join(entry['topics'])
+                )
+                for entry in entries
+            ]
+        )
+        self._db.commit()
+
+    def _load_recent_conversations(self):
+        """Đọc MAX_CONVERSATIONS conversations gần nhất từ SQLite"""
+        rows = self._db.execute(
+            '''SELECT ts, timestamp, user_id, user_message, bot_response, response_time,
+                      message_length, response_length, sentiment, message_type, topics
+               FROM conversations ORDER BY id DESC LIMIT ?''',
+            (self.MAX_CONVERSATIONS,)
+        ).fetchall()
+        rows.reverse()
+        
+        self.conversation_data = deque(maxlen=self.MAX_CONVERSATIONS)
+        self._columns = ConversationColumns()
+        self._by_user = defaultdict(deque)
+        for (ts, timestamp, user_id, user_message, bot_response, response_time,
+             message_length, response_length, sentiment, message_type, topics) in rows:
+            entry = {
+                'timestamp': timestamp,
+                'ts_epoch': ts,
+                'user_id': user_id,
+                'user_message': user_message,
+                'bot_response': bot_response,
+                'response_time': response_time,
+                'message_length': message_length,
+                'response_length': response_length,
+                'sentiment': _SENTIMENT_NAMES[sentiment],
+                'message_type': _MESSAGE_TYPE_NAMES[message_type],
+                'topics': tuple(topics.split(',')) if topics else ('general',)
+            }
+            self._append_entry(entry)
+            self._columns.append(entry, ts)
+
+    def _append_entry(self, entry):
+        """Thêm entry vào conversation_data và index theo user, bỏ entry cũ nhất khỏi index khi deque đầy"""
+        if len(self.conversation_data) == self.conversation_data.maxlen:
+            # Entry cũ nhất toàn cục cũng là entry cũ nhất của user đó
+            oldest_user = self.conversation_data[0]['user_id']
+            user_entries = self._by_user[oldest_user]
+            user_entries.popleft()
+            if not user_entries:
+                del self._by_user[oldest_user]
+        self.conversation_data.append(entry)
+        self._by_user[entry['user_id']].append(entry)
+
+    def get_user_conversations(self, user_id, since_epoch=None):
+        """Conversations của user (theo thời gian), chỉ lấy các conversation sau since_epoch nếu có"""
+        self.flush()
+        user_entries = self._by_user.get(user_id)
+        if not user_entries:
+            return []
+        start = 0
+        if since_epoch is not None:
+            start = bisect.bisect_right(user_entries, since_epoch, key=_entry_epoch)
+        return list(itertools.islice(user_entries, start, None))
+
     def load_data(self):
-        """Load dữ liệu analytics từ file"""
+        """Load dữ liệu analytics (conversations từ SQLite, số liệu tổng hợp từ snapshot/JSON)"""
         try:
-            if os.path.exists(self.data_file):
-                with open(self.data_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    self.conversation_data = data.get('conversations', [])
-                    self.user_profiles = defaultdict(dict, data.get('user_profiles', {}))
-                    self.daily_stats = defaultdict(dict, data.get('daily_stats', {}))
-                print(f"[ANALYTICS] 📂 Loaded {len(self.conversation_data)} conversations")
+            data = self._load_snapshot()
+            if data is None and os.path.exists(self.data_file):
+                with open(self.data_file, 'rb') as f:
+                    data = _load_json_bytes(f.read())
+            
+            if data is not None:
+                self._restore_types(data)
+                
+                # File JSON kiểu cũ còn chứa conversations - chuyển sang SQLite một lần
+                legacy_conversations = data.get('conversations')
+                if legacy_conversations and not self._db.execute('SELECT 1 FROM conversations LIMIT 1').fetchone():
+                    self._insert_conversations(legacy_conversations)
+                    self._saved_version = -1  # Ghi lại file JSON không còn conversations
+                
+                self.user_profiles = defaultdict(dict, data.get('user_profiles', {}))
+                self.daily_stats = defaultdict(dict, data.get('daily_stats', {}))
+            
+            self._load_recent_conversations()
+            print(f"[ANALYTICS] 📂 Loaded {len(self.conversation_data)} conversations")
         except Exception as e:
             print(f"[ANALYTICS] ⚠️ Lỗi load data: {str(e)}")
 
+    def _restore_types(self, data):
+        """Khôi phục các kiểu mà JSON làm mất (set, defaultdict, Counter, key giờ dạng int)"""
+        for profile in data.get('user_profiles', {}).values():
+            profile['message_types'] = defaultdict(int, profile.get('message_types', {}))
+            profile['topics'] = Counter(profile.get('topics', {}))
+            if 'hourly_activity' in profile:
+                profile['hourly_activity'] = defaultdict(int, {
+                    int(hour): count for hour, count in profile['hourly_activity'].items()
+                })
+        
+        for stats in data.get('daily_stats', {}).values():
+            stats['unique_users'] = set(stats.get('unique_users', ()))
+            stats['message_types'] = defaultdict(int, stats.get('message_types', {}))
+            stats['topics'] = Counter(stats.get('topics', {}))
+
+    def _load_snapshot(self):
+        """Load snapshot pickle nếu có và không cũ hơn file JSON"""
+        if not os.path.exists(self.snapshot_file):
+            return None
+        if os.path.exists(self.data_file) and os.path.getmtime(self.snapshot_file) < os.path.getmtime(self.data_file):
+            return None
+        
+        try:
+            with open(self.snapshot_file, 'rb') as f:
+                return pickle.load(f)
+        except Exception as e:
+            print(f"[ANALYTICS] ⚠️ Snapshot lỗi, load lại từ JSON: {str(e)}")
+            return None
+
     def save_data(self):
-        """Lưu dữ liệu analytics"""
+        """Lưu dữ liệu analytics (conversations đã được ghi vào SQLite khi flush)"""
+        self.flush()
+        if self._saved_version == self._version:
+            # Không có gì mới kể từ lần lưu trước - bỏ qua việc ghi lại file
+            return
+        
         try:
             data = {
-                'conversations': self.conversation_data,
                 'user_profiles': dict(self.user_profiles),
                 'daily_stats': dict(self.daily_stats),
                 'last_updated': datetime.now().isoformat()
             }
             
-            with open(self.data_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            with open(self.data_file, 'wb') as f:
+                f.write(_dump_json_bytes(data))
             
+            # Snapshot nhị phân để khởi động lại nhanh, JSON vẫn là bản export đọc được
+            with open(self.snapshot_file, 'wb') as f:
+                pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+            
+            self._saved_version = self._version
             print(f"[ANALYTICS] 💾 Saved analytics data")
         except Exception as e:
             print(f"[ANALYTICS] ⚠️ Lỗi save data: {str(e)}")
 
     def record_conversation(self, user_message, bot_response, user_id, response_time=0):
-        """Ghi lại cuộc trò chuyện"""
-        conversation_entry = {
-            'timestamp': datetime.now().isoformat(),
+        """Ghi lại cuộc trò chuyện (đưa vào buffer, phân tích NLP theo batch khi flush)"""
+        now = datetime.now()
+        self._pending.append({
+            'timestamp': now.isoformat(),
+            'ts_epoch': now.timestamp(),
             'user_id': user_id,
             'user_message': user_message,
             'bot_response': bot_response,
             'response_time': response_time,
             'message_length': len(user_message),
-            'response_length': len(bot_response),
-            'sentiment': self.analyze_sentiment(user_message),
-            'message_type': self.classify_message_type(user_message),
-            'topics': self.extract_topics(user_message)
-        }
+            'response_length': len(bot_response)
+        })
         
-        self.conversation_data.append(conversation_entry)
-        self.update_user_profile(user_id, conversation_entry)
-        self.update_daily_stats(conversation_entry)
-        
-        # Giữ chỉ 10000 conversations gần nhất
-        if len(self.conversation_data) > 10000:
-            self.conversation_data = self.conversation_data[-10000:]
+        if len(self._pending) >= self.batch_size:
+            self.flush()
 
-    def analyze_sentiment(self, text):
-        """Phân tích cảm xúc của tin nhắn"""
-        try:
-            blob = TextBlob(text)
-            polarity = blob.sentiment.polarity
-            
-            if polarity > 0.1:
-                return 'positive'
-            elif polarity < -0.1:
-                return 'negative'
-            else:
-                return 'neutral'
-        except:
-            return 'neutral'
-
-    def classify_message_type(self, message):
-        """Phân loại loại tin nhắn"""
-        message_lower = message.lower()
-        
-        # Question patterns
-        question_patterns = [
-            r'\?', r'^(what|how|when|where|why|who|which|can|could|would|should|is|are|do|does|did)',
-            r'(gì|sao|thế nào|khi nào|ở đâu|tại sao|ai|có thể|được không)'
-        ]
+    def record_conversation_batch(self, conversations):
+        """Ghi lại nhiều cuộc trò chuyện một lần.
         
-        if any(re.search(pattern, message_lower) for pattern in question_patterns):
-            return 'question'
+        conversations: list dict gồm 'user_message', 'bot_response', 'user_id' và 'response_time' (tuỳ chọn)
+        """
+        now = datetime.now()
+        timestamp = now.isoformat()
+        ts_epoch = now.timestamp()
+        for conv in conversations:
+            user_message = conv['user_message']
+            bot_response = conv['bot_response']
+            self._pending.append({
+                'timestamp': timestamp,
+                'ts_epoch': ts_epoch,
+                'user_id': conv['user_id'],
+                'user_message': user_message,
+                'bot_response': bot_response,
+                'response_time': conv.get('response_time', 0),
+                'message_length': len(user_message),
+                'response_length': len(bot_response)
+            })
         
-        # Greeting patterns
-        greeting_patterns = [
-            r'^(hi|hello|hey|chào|xin chào|good morning|good afternoon|good evening)',
-            r'(chào bạn|hello|hi there)'
-        ]
+        self.flush()
+
+    def flush(self):
+        """Phân tích NLP cho các conversation đang chờ trong buffer và cập nhật thống kê"""
+        if not self._pending:
+            return
         
-        if any(re.search(pattern, message_lower) for pattern in greeting_patterns):
-            return 'greeting'
+        pending, self._pending = self._pending, []
+        sentiments = _batch_sentiment([entry['user_message'] for entry in pending], self.lexicon_file)
         
-        # Command patterns
-        command_patterns = [
-            r'^(help|hướng dẫn|giúp|làm|tạo|generate|create)',
-            r'(làm giúp|tạo cho|generate|create)'
-        ]
+        for entry, sentiment in zip(pending, sentiments):
+            message = entry['user_message']
+            entry['sentiment'] = sentiment
+            entry['message_type'] = _classify_message_type_cached(message)
+            # Tuple bất biến từ cache - dùng chung, không cần copy cho mỗi entry
+            entry['topics'] = _extract_topics_cached(message)
         
-        if any(re.search(pattern, message_lower) for pattern in command_patterns):
-            return 'command'
+        try:
+            self._insert_conversations(pending)
+        except Exception as e:
+            print(f"[ANALYTICS] ⚠️ Lỗi ghi conversations vào SQLite: {str(e)}")
         
-        # Complaint patterns
-        complaint_patterns = [
-            r'(không|chẳng|tệ|dở|lag|lỗi|sai|wrong|bad|terrible|awful)',
-            r'(không hoạt động|not working|broken)'
-        ]
+        for entry in pending:
+            self._append_entry(entry)
+            self._columns.append(entry, entry['ts_epoch'])
+            self.update_user_profile(entry['user_id'], entry)
+            self.update_daily_stats(entry)
+            self._user_versions[entry['user_id']] += 1
         
-        if any(re.search(pattern, message_lower) for pattern in complaint_patterns):
-            return 'complaint'
+        # deque tự bỏ conversations cũ, các cột numpy cắt theo cùng số lượng
+        self._columns.keep_last(self.MAX_CONVERSATIONS)
         
-        return 'general'
+        self._version += 1
+        self._aggregate_cache.clear()
+
+    def user_version(self, user_id):
+        """Version dữ liệu của user - tăng mỗi khi có conversation mới của user đó"""
+        self.flush()
+        return self._user_versions[user_id]
+
+    def _recent_start(self, days):
+        """Vị trí conversation đầu tiên trong `days` ngày gần nhất (binary search trên cột timestamp)"""
+        return self._columns.start_after(time.time() - days * 86400)
+
+    def analyze_sentiment(self, text):
+        """Phân tích cảm xúc của tin nhắn"""
+        return _analyze_sentiment_cached(text, self.lexicon_file)
+
+    def classify_message_type(self, message):
+        """Phân loại loại tin nhắn"""
+        return _classify_message_type_cached(message)
 
     def extract_topics(self, message):
         """Trích xuất chủ đề từ tin nhắn"""
-        topics = []
-        message_lower = message.lower()
-        
-        # Định nghĩa các chủ đề
-        topic_keywords = {
-            'technology': ['ai', 'bot', 'computer', 'internet', 'app', 'software', 'code', 'programming'],
-            'personal': ['tôi', 'mình', 'bạn', 'gia đình', 'friend', 'family', 'personal', 'life'],
-            'work': ['work', 'job', 'office', 'business', 'company', 'career', 'làm việc', 'công việc'],
-            'entertainment': ['game', 'movie', 'music', 'fun', 'entertainment', 'phim', 'nhạc', 'vui'],
-            'education': ['học', 'study', 'school', 'university', 'education', 'learn', 'knowledge'],
-            'health': ['health', 'sick', 'doctor', 'medicine', 'sức khỏe', 'bệnh', 'bác sĩ'],
-            'food': ['food', 'eat', 'restaurant', 'cooking', 'ăn', 'thức ăn', 'món ăn', 'nấu ăn'],
-            'travel': ['travel', 'trip', 'vacation', 'du lịch', 'đi chơi', 'nghỉ mát']
-        }
-        
-        for topic, keywords in topic_keywords.items():
-            if any(keyword in message_lower for keyword in keywords):
-                topics.append(topic)
-        
-        return topics if topics else ['general']
+        return list(_extract_topics_cached(message))
 
     def update_user_profile(self, user_id, conversation_entry):
         """Cập nhật profile người dùng"""
@@ -166,7 +694,7 @@ class AnalyticsEngine:
                 'total_response_time': 0,
                 'sentiments': {'positive': 0, 'negative': 0, 'neutral': 0},
                 'message_types': defaultdict(int),
-                'topics': defaultdict(int),
+                'topics': Counter(),
                 'avg_message_length': 0,
                 'most_active_hour': None,
                 'conversation_patterns': []
@@ -186,19 +714,24 @@ class AnalyticsEngine:
         profile['message_types'][msg_type] += 1
         
         # Update topics
-        for topic in conversation_entry['topics']:
-            profile['topics'][topic] += 1
+        profile['topics'].update(conversation_entry['topics'])
         
         # Update average message length
         total_length = profile['avg_message_length'] * (profile['message_count'] - 1) + conversation_entry['message_length']
         profile['avg_message_length'] = total_length / profile['message_count']
         
-        # Update most active hour
-        hour = datetime.fromisoformat(conversation_entry['timestamp']).hour
+        # Update most active hour - chỉ so giờ vừa tăng với giờ đang dẫn đầu
+        hour = int(conversation_entry['timestamp'][11:13])
         if 'hourly_activity' not in profile:
             profile['hourly_activity'] = defaultdict(int)
-        profile['hourly_activity'][hour] += 1
-        profile['most_active_hour'] = max(profile['hourly_activity'], key=profile['hourly_activity'].get)
+        hourly_activity = profile['hourly_activity']
+        if 'most_active_hour_count' not in profile:
+            # Profile cũ chưa có bộ đếm - tính lại một lần
+            profile['most_active_hour_count'] = hourly_activity.get(profile['most_active_hour'], 0)
+        hourly_activity[hour] += 1
+        if hourly_activity[hour] > profile['most_active_hour_count']:
+            profile['most_active_hour_count'] = hourly_activity[hour]
+            profile['most_active_hour'] = hour
 
     def update_daily_stats(self, conversation_entry):
         """Cập nhật thống kê hàng ngày"""
@@ -212,7 +745,7 @@ class AnalyticsEngine:
                 'total_response_time': 0,
                 'sentiment_distribution': {'positive': 0, 'negative': 0, 'neutral': 0},
                 'message_types': defaultdict(int),
-                'topics': defaultdict(int)
+                'topics': Counter()
             }
         
         stats = self.daily_stats[date_str]
@@ -230,11 +763,11 @@ class AnalyticsEngine:
         stats['message_types'][msg_type] += 1
         
         # Update topics
-        for topic in conversation_entry['topics']:
-            stats['topics'][topic] += 1
+        stats['topics'].update(conversation_entry['topics'])
 
     def get_user_insights(self, user_id):
         """Lấy insights về user cụ thể"""
+        self.flush()
         if user_id not in self.user_profiles:
             return None
         
@@ -284,48 +817,104 @@ class AnalyticsEngine:
         else:
             return 'casual'
 
-    def get_conversation_trends(self, days=30):
-        """Lấy xu hướng cuộc trò chuyện"""
-        cutoff_date = datetime.now() - timedelta(days=days)
-        
-        recent_conversations = [
-            conv for conv in self.conversation_data
-            if datetime.fromisoformat(conv['timestamp']) > cutoff_date
-        ]
+    def _aggregate_recent(self, days):
+        """Tính mọi số liệu tổng hợp của `days` ngày gần nhất trong một lượt (có cache theo version dữ liệu)"""
+        self.flush()
+        # Cửa sổ `days` trượt theo thời gian dù dữ liệu không đổi -> key gồm cả giờ hiện tại
+        hour = int(time.time() // 3600)
+        if hour != self._aggregate_hour:
+            self._aggregate_cache.clear()
+            self._aggregate_hour = hour
+        cache_key = (days, self._version, hour)
+        if cache_key in self._aggregate_cache:
+            return self._aggregate_cache[cache_key]
         
+        start = self._recent_start(days)
+        recent_conversations = list(itertools.islice(self.conversation_data, start, None))
         if not recent_conversations:
-            return {}
+            self._aggregate_cache[cache_key] = None
+            return None
         
-        # Tính toán trends
-        daily_message_counts = defaultdict(int)
-        hourly_distribution = defaultdict(int)
-        sentiment_trends = defaultdict(lambda: defaultdict(int))
-        topic_trends = defaultdict(lambda: defaultdict(int))
+        columns = self._columns
         
-        for conv in recent_conversations:
-            date = conv['timestamp'][:10]
-            hour = datetime.fromisoformat(conv['timestamp']).hour
-            
-            daily_message_counts[date] += 1
-            hourly_distribution[hour] += 1
-            sentiment_trends[date][conv['sentiment']] += 1
-            
-            for topic in conv['topics']:
-                topic_trends[date][topic] += 1
+        # Đếm theo giờ/ngày/sentiment trên cột numpy (JIT bằng numba nếu có)
+        first_day, hourly, daily_sentiments = _get_trend_histograms()(
+            columns['lts'][start:], columns['sent'][start:], len(_SENTIMENT_NAMES)
+        )
         
-        return {
-            'daily_message_counts': dict(daily_message_counts),
-            'hourly_distribution': dict(hourly_distribution),
-            'sentiment_trends': dict(sentiment_trends),
-            'topic_trends': dict(topic_trends),
+        # Bảng (ngày, topic) dạng mảng 2D: mỗi topic một bincount theo chỉ số ngày
+        day_index = (columns['lts'][start:] // 86400).astype(np.int64) - first_day
+        topic_masks = columns['topics'][start:]
+        daily_topics = np.zeros((len(daily_sentiments), len(_TOPIC_NAMES)), np.int64)
+        for topic_id, bit in enumerate(_TOPIC_BITS.values()):
+            daily_topics[:, topic_id] = np.bincount(
+                day_index[(topic_masks & bit) != 0], minlength=len(daily_sentiments)
+            )
+        
+        # Chỉ chuyển sang dict khi trả kết quả
+        daily_message_counts = {}
+        sentiment_trends = {}
+        topic_trends = {}
+        for offset, (sentiment_row, topic_row) in enumerate(zip(daily_sentiments.tolist(), daily_topics.tolist())):
+            total = sum(sentiment_row)
+            if total:
+                date = time.strftime('%Y-%m-%d', time.gmtime((int(first_day) + offset) * 86400))
+                daily_message_counts[date] = total
+                sentiment_trends[date] = {
+                    _SENTIMENT_NAMES[sentiment_id]: count
+                    for sentiment_id, count in enumerate(sentiment_row) if count
+                }
+                topic_trends[date] = {
+                    _TOPIC_NAMES[topic_id]: count
+                    for topic_id, count in enumerate(topic_row) if count
+                }
+        
+        sentiment_counts = {
+            _SENTIMENT_NAMES[sentiment_id]: count
+            for sentiment_id, count in enumerate(daily_sentiments.sum(axis=0).tolist()) if count
+        }
+        topic_counts = Counter({
+            _TOPIC_NAMES[topic_id]: count
+            for topic_id, count in enumerate(daily_topics.sum(axis=0).tolist()) if count
+        })
+        
+        aggregate = {
             'total_conversations': len(recent_conversations),
-            'unique_users': len(set(conv['user_id'] for conv in recent_conversations)),
-            'avg_response_time': statistics.mean([conv['response_time'] for conv in recent_conversations])
+            'daily_message_counts': daily_message_counts,
+            'hourly_distribution': {hour: count for hour, count in enumerate(hourly.tolist()) if count},
+            'sentiment_trends': sentiment_trends,
+            'topic_trends': topic_trends,
+            'unique_users': len({conv['user_id'] for conv in recent_conversations}),
+            'sentiment_counts': sentiment_counts,
+            'topic_counts': topic_counts,
+            'response_times': columns['rt'][start:],
+            'message_lengths': columns['mlen'][start:]
+        }
+        self._aggregate_cache[cache_key] = aggregate
+        return aggregate
+
+    def get_conversation_trends(self, days=30, aggregate=None):
+        """Lấy xu hướng cuộc trò chuyện"""
+        if aggregate is None:
+            aggregate = self._aggregate_recent(days)
+        if not aggregate:
+            return {}
+        
+        return {
+            'daily_message_counts': aggregate['daily_message_counts'],
+            'hourly_distribution': aggregate['hourly_distribution'],
+            'sentiment_trends': aggregate['sentiment_trends'],
+            'topic_trends': aggregate['topic_trends'],
+            'total_conversations': aggregate['total_conversations'],
+            'unique_users': aggregate['unique_users'],
+            'avg_response_time': float(aggregate['response_times'].mean())
         }
 
     def generate_report(self, days=30):
         """Tạo báo cáo tổng hợp"""
-        trends = self.get_conversation_trends(days)
+        # Tổng hợp một lần rồi chia cho các phần của báo cáo
+        aggregate = self._aggregate_recent(days)
+        trends = self.get_conversation_trends(days, aggregate)
         
         report = {
             'report_date': datetime.now().isoformat(),
@@ -339,50 +928,51 @@ class AnalyticsEngine:
             },
             'trends': trends,
             'top_users': self.get_top_users(limit=10),
-            'popular_topics': self.get_popular_topics(days),
-            'sentiment_analysis': self.get_sentiment_analysis(days),
-            'performance_metrics': self.get_performance_metrics(days)
+            'popular_topics': self.get_popular_topics(days, aggregate),
+            'sentiment_analysis': self.get_sentiment_analysis(days, aggregate),
+            'performance_metrics': self.get_performance_metrics(days, aggregate)
         }
         
         return report
 
     def get_top_users(self, limit=10):
         """Lấy top users theo message count"""
-        sorted_users = sorted(
+        self.flush()
+        cache_key = ('top_users', limit, self._version)
+        if cache_key in self._aggregate_cache:
+            return self._aggregate_cache[cache_key]
+        
+        top_users = heapq.nlargest(
+            limit,
             self.user_profiles.items(),
-            key=lambda x: x[1]['message_count'],
-            reverse=True
+            key=lambda x: x[1]['message_count']
         )
         
-        return [
+        result = [
             {
                 'user_id': user_id,
                 'message_count': profile['message_count'],
                 'engagement_level': self.calculate_engagement_level(profile)
             }
-            for user_id, profile in sorted_users[:limit]
+            for user_id, profile in top_users
         ]
+        self._aggregate_cache[cache_key] = result
+        return result
 
-    def get_popular_topics(self, days=30):
+    def get_popular_topics(self, days=30, aggregate=None):
         """Lấy chủ đề phổ biến"""
-        cutoff_date = datetime.now() - timedelta(days=days)
-        
-        topic_counts = defaultdict(int)
-        for conv in self.conversation_data:
-            if datetime.fromisoformat(conv['timestamp']) > cutoff_date:
-                for topic in conv['topics']:
-                    topic_counts[topic] += 1
+        if aggregate is None:
+            aggregate = self._aggregate_recent(days)
+        if not aggregate:
+            return {}
         
-        return dict(Counter(topic_counts).most_common(10))
+        return dict(aggregate['topic_counts'].most_common(10))
 
-    def get_sentiment_analysis(self, days=30):
+    def get_sentiment_analysis(self, days=30, aggregate=None):
         """Phân tích cảm xúc tổng thể"""
-        cutoff_date = datetime.now() - timedelta(days=days)
-        
-        sentiment_counts = defaultdict(int)
-        for conv in self.conversation_data:
-            if datetime.fromisoformat(conv['timestamp']) > cutoff_date:
-                sentiment_counts[conv['sentiment']] += 1
+        if aggregate is None:
+            aggregate = self._aggregate_recent(days)
+        sentiment_counts = aggregate['sentiment_counts'] if aggregate else {}
         
         total = sum(sentiment_counts.values())
         
@@ -394,28 +984,23 @@ class AnalyticsEngine:
             }
         }
 
-    def get_performance_metrics(self, days=30):
+    def get_performance_metrics(self, days=30, aggregate=None):
         """Lấy metrics hiệu suất"""
-        cutoff_date = datetime.now() - timedelta(days=days)
-        
-        recent_conversations = [
-            conv for conv in self.conversation_data
-            if datetime.fromisoformat(conv['timestamp']) > cutoff_date
-        ]
-        
-        if not recent_conversations:
+        if aggregate is None:
+            aggregate = self._aggregate_recent(days)
+        if not aggregate:
             return {}
         
-        response_times = [conv['response_time'] for conv in recent_conversations]
-        message_lengths = [conv['message_length'] for conv in recent_conversations]
+        response_times = aggregate['response_times']
+        message_lengths = aggregate['message_lengths']
         
         return {
-            'avg_response_time': statistics.mean(response_times),
-            'median_response_time': statistics.median(response_times),
-            'max_response_time': max(response_times),
-            'min_response_time': min(response_times),
-            'avg_message_length': statistics.mean(message_lengths),
-            'conversations_per_day': len(recent_conversations) / days
+            'avg_response_time': float(response_times.mean()),
+            'median_response_time': float(np.median(response_times)),
+            'max_response_time': float(response_times.max()),
+            'min_response_time': float(response_times.min()),
+            'avg_message_length': float(message_lengths.mean()),
+            'conversations_per_day': len(response_times) / days
         }
 
     def save_report(self, filename="analytics/analytics_report.json"):
@@ -1,13 +1,191 @@
 import json
 import os
-from datetime import datetime, timedelta
-from collections import defaultdict, Counter
+import time
+from datetime import datetime, date, timedelta
+from collections import defaultdict, Counter, OrderedDict
+from itertools import combinations
 import re
+import functools
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.cluster import KMeans
+from sklearn.feature_extraction.text import TfidfVectorizer, HashingVectorizer
+from sklearn.cluster import KMeans, MiniBatchKMeans
 import networkx as nx
 
+try:
+    import orjson
+except ImportError:
+    # orjson chưa cài, dùng json chuẩn (chậm hơn)
+    orjson = None
+
+
+def _conv_epoch(conv):
+    """Epoch seconds của conversation - dùng 'ts_epoch' lưu lúc ghi, chỉ parse ISO với dữ liệu cũ"""
+    ts_epoch = conv.get('ts_epoch')
+    if ts_epoch is None:
+        ts_epoch = datetime.fromisoformat(conv['timestamp']).timestamp()
+    return ts_epoch
+
+
+# Từ số conversations này trở lên, clustering dùng HashingVectorizer + MiniBatchKMeans
+_LARGE_CORPUS_SIZE = 5000
+
+# Topic graph nhiều hơn số node này thì betweenness centrality tính xấp xỉ trên _BETWEENNESS_SAMPLES node
+_LARGE_GRAPH_NODES = 200
+_BETWEENNESS_SAMPLES = 64
+
+# Số report giữ trong LRU cache của generate_insights_report
+_REPORT_CACHE_SIZE = 128
+
+_SENTIMENT_CODES = {'negative': -1, 'neutral': 0, 'positive': 1}
+_SENTIMENT_LABELS = ('negative', 'neutral', 'positive')  # Theo thứ tự mã + 1
+
+
+def _sentiment_codes(conversations):
+    """Mã hoá sentiment của conversations thành mảng -1/0/1"""
+    return np.fromiter((_SENTIMENT_CODES[conv['sentiment']] for conv in conversations),
+                       dtype=np.int8, count=len(conversations))
+
+
+def _conversation_columns(conversations, timestamps=None):
+    """Tách các field số của conversations thành cột numpy song song (SoA) - đọc dict một lần"""
+    if timestamps is None:
+        timestamps = [_conv_epoch(conv) for conv in conversations]
+    n = len(conversations)
+    return {
+        'ts': np.asarray(timestamps, dtype=np.float64),
+        'msg_len': np.fromiter((conv['message_length'] for conv in conversations), dtype=np.float64, count=n),
+        'resp_time': np.fromiter((conv['response_time'] for conv in conversations), dtype=np.float64, count=n),
+        'sentiment_code': _sentiment_codes(conversations),
+    }
+
+
+# Indicators của satisfaction - mỗi nhóm gộp thành một regex, match substring như trước
+# Positive indicators
+_POSITIVE_WORDS = ('thanks', 'thank you', 'good', 'great', 'awesome', 'perfect',
+                   'cảm ơn', 'tốt', 'hay', 'được', 'ok', 'oke')
+
+# Negative indicators
+_NEGATIVE_WORDS = ('wrong', 'bad', 'not good', 'terrible', 'sai', 'tệ', 'không tốt',
+                   'dở', 'không đúng', 'chẳng hiểu')
+
+# Confusion indicators
+_CONFUSION_WORDS = ('what', 'huh', 'confused', 'không hiểu', 'gì', 'sao', 'hả')
+
+_POSITIVE_WORDS_RE = re.compile('|'.join(map(re.escape, _POSITIVE_WORDS)))
+_NEGATIVE_WORDS_RE = re.compile('|'.join(map(re.escape, _NEGATIVE_WORDS)))
+_CONFUSION_WORDS_RE = re.compile('|'.join(map(re.escape, _CONFUSION_WORDS)))
+
+
+def _most_common_codes(codes, labels, top_n):
+    """Như Counter.most_common trên mã số: đếm bằng bincount, hoà thì mã xuất hiện trước đứng trước"""
+    counts = np.bincount(codes, minlength=len(labels))
+    present, first_index = np.unique(codes, return_index=True)
+    order = np.lexsort((first_index, -counts[present]))[:top_n]
+    return [(labels[code], int(counts[code])) for code in present[order].tolist()]
+
+
+def _linear_slope(values):
+    """Slope của đường hồi quy tuyến tính qua values (x = 0..n-1)"""
+    y = np.asarray(values, dtype=np.float64)
+    if y.size < 2:
+        return 0
+    x = np.arange(y.size, dtype=np.float64)
+    x -= x.mean()
+    return float(np.dot(x, y - y.mean()) / np.dot(x, x))
+
+
+def _sentiment_stats_numpy(codes):
+    """Thống kê chuỗi sentiment (mã -1/0/1) - bản numpy
+    
+    Trả về (stable_count, transitions 3x3, counts, first_seen, slope, recovery_idx, decline_idx, streaks)
+    """
+    idx = codes.astype(np.int64) + 1
+    n = idx.size
+    
+    transitions = np.zeros((3, 3), np.int64)
+    np.add.at(transitions, (idx[:-1], idx[1:]), 1)
+    counts = np.bincount(idx, minlength=3)
+    first_seen = np.full(3, n, np.int64)
+    present, first_index = np.unique(idx, return_index=True)
+    first_seen[present] = first_index
+    stable_count = np.count_nonzero(idx[1:] == idx[:-1])
+    slope = _linear_slope(codes) if n >= 2 else 0.0
+    
+    positive = codes == 1
+    negative = codes == -1
+    recovery_idx = np.flatnonzero(negative[:-1] & positive[1:])
+    decline_idx = np.flatnonzero(positive[:-1] & negative[1:])
+    
+    # Positive streak - chỉ tính streak đã kết thúc bởi sentiment khác
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], positive.view(np.int8), [0]))))
+    starts, ends = edges[0::2], edges[1::2]
+    streaks = ends - starts
+    streaks = streaks[(streaks >= 3) & (ends < n)]
+    
+    return stable_count, transitions, counts, first_seen, slope, recovery_idx, decline_idx, streaks
+
+
+def _sentiment_stats_loop(codes):
+    """Thống kê chuỗi sentiment (mã -1/0/1) - một vòng lặp duy nhất, dành cho numba"""
+    n = codes.shape[0]
+    transitions = np.zeros((3, 3), np.int64)
+    counts = np.zeros(3, np.int64)
+    first_seen = np.full(3, n, np.int64)
+    recovery_idx = np.empty(n, np.int64)
+    decline_idx = np.empty(n, np.int64)
+    streaks = np.empty(n, np.int64)
+    n_recovery = 0
+    n_decline = 0
+    n_streaks = 0
+    stable_count = 0
+    streak = 0
+    x_mean = (n - 1) / 2.0
+    sxy = 0.0
+    sxx = 0.0
+    
+    for i in range(n):
+        code = codes[i]
+        counts[code + 1] += 1
+        if first_seen[code + 1] == n:
+            first_seen[code + 1] = i
+        sxy += (i - x_mean) * code
+        sxx += (i - x_mean) * (i - x_mean)
+        
+        if i > 0:
+            prev = codes[i - 1]
+            transitions[prev + 1, code + 1] += 1
+            if prev == code:
+                stable_count += 1
+            elif prev == -1 and code == 1:
+                recovery_idx[n_recovery] = i - 1
+                n_recovery += 1
+            elif prev == 1 and code == -1:
+                decline_idx[n_decline] = i - 1
+                n_decline += 1
+        
+        if code == 1:
+            streak += 1
+        else:
+            if streak >= 3:
+                streaks[n_streaks] = streak
+                n_streaks += 1
+            streak = 0
+    
+    slope = sxy / sxx if n >= 2 else 0.0
+    return (stable_count, transitions, counts, first_seen, slope,
+            recovery_idx[:n_recovery], decline_idx[:n_decline], streaks[:n_streaks])
+
+
+@functools.lru_cache(maxsize=None)
+def _get_sentiment_stats():
+    """Chọn kernel thống kê sentiment - import numba lúc cần (import numba khá nặng, không làm ở module load)"""
+    try:
+        import numba
+    except ImportError:
+        # numba chưa cài, kernel chạy bằng numpy
+        return _sentiment_stats_numpy
+    return numba.njit(cache=True)(_sentiment_stats_loop)
+
 
 class ConversationInsights:
     def __init__(self, analytics_engine=None):
@@ -17,6 +195,13 @@ class ConversationInsights:
         self.topic_networks = {}
         self.response_quality_scores = {}
         
+        # LRU (user_id, days, ngày hiện tại) -> (version dữ liệu của user, report) - tránh tính lại khi chưa có dữ liệu mới.
+        # Ngày nằm trong key vì cửa sổ `days` trượt theo thời gian dù dữ liệu không đổi
+        self._report_cache = OrderedDict()
+        
+        # Compile sẵn kernel sentiment (numba) để report đầu tiên không phải chờ JIT
+        _get_sentiment_stats()(np.zeros(1, dtype=np.int8))
+        
         print("[INSIGHTS] 🔍 Conversation Insights đã khởi tạo")
 
     def analyze_conversation_flow(self, user_id, days=30):
@@ -24,78 +209,61 @@ class ConversationInsights:
         if not self.analytics_engine:
             return None
         
-        cutoff_date = datetime.now() - timedelta(days=days)
+        cutoff_epoch = time.time() - days * 86400
         
-        # Lấy conversations của user
-        user_conversations = [
-            conv for conv in self.analytics_engine.conversation_data
-            if (conv['user_id'] == user_id and 
-                datetime.fromisoformat(conv['timestamp']) > cutoff_date)
-        ]
+        # Lấy conversations của user qua index theo user (đã sắp xếp theo thời gian, binary search cutoff)
+        user_conversations = self.analytics_engine.get_user_conversations(user_id, cutoff_epoch)
         
         if not user_conversations:
             return None
         
-        # Sắp xếp theo thời gian
-        user_conversations.sort(key=lambda x: x['timestamp'])
+        timestamps = [_conv_epoch(conv) for conv in user_conversations]
+        columns = _conversation_columns(user_conversations, timestamps)
         
         # Phân tích patterns
         flow_analysis = {
             'total_conversations': len(user_conversations),
-            'conversation_sessions': self.identify_sessions(user_conversations),
+            'conversation_sessions': self.identify_sessions(user_conversations, columns['ts']),
             'topic_transitions': self.analyze_topic_transitions(user_conversations),
-            'sentiment_journey': self.analyze_sentiment_journey(user_conversations),
-            'engagement_patterns': self.analyze_engagement_patterns(user_conversations),
-            'response_satisfaction': self.analyze_response_satisfaction(user_conversations)
+            'sentiment_journey': self.analyze_sentiment_journey(user_conversations, columns),
+            'engagement_patterns': self.analyze_engagement_patterns(user_conversations, columns),
+            'response_satisfaction': self.analyze_response_satisfaction(user_conversations, columns)
         }
         
         return flow_analysis
 
-    def identify_sessions(self, conversations):
-        """Nhận diện các session chat riêng biệt"""
-        sessions = []
-        current_session = []
-        session_gap_minutes = 30  # 30 phút không hoạt động = session mới
+    def identify_sessions(self, conversations, timestamps=None):
+        """Nhận diện các session chat riêng biệt
         
-        for i, conv in enumerate(conversations):
-            if i == 0:
-                current_session = [conv]
-            else:
-                prev_time = datetime.fromisoformat(conversations[i-1]['timestamp'])
-                curr_time = datetime.fromisoformat(conv['timestamp'])
-                
-                if (curr_time - prev_time).total_seconds() / 60 > session_gap_minutes:
-                    # Kết thúc session hiện tại
-                    sessions.append({
-                        'session_id': len(sessions) + 1,
-                        'start_time': current_session[0]['timestamp'],
-                        'end_time': current_session[-1]['timestamp'],
-                        'message_count': len(current_session),
-                        'duration_minutes': (
-                            datetime.fromisoformat(current_session[-1]['timestamp']) -
-                            datetime.fromisoformat(current_session[0]['timestamp'])
-                        ).total_seconds() / 60,
-                        'topics': list(set(topic for conv in current_session for topic in conv['topics'])),
-                        'sentiment_evolution': [conv['sentiment'] for conv in current_session]
-                    })
-                    
-                    # Bắt đầu session mới
-                    current_session = [conv]
-                else:
-                    current_session.append(conv)
+        timestamps: epoch seconds song song với conversations (tuỳ chọn)
+        """
+        if not conversations:
+            return []
+        
+        if timestamps is None:
+            timestamps = [_conv_epoch(conv) for conv in conversations]
+        
+        ts = np.asarray(timestamps, dtype=np.float64)
+        session_gap_seconds = 30 * 60  # 30 phút không hoạt động = session mới
+        
+        # Ranh giới session = vị trí có khoảng cách > gap, tính một lần cho cả chuỗi
+        boundaries = np.flatnonzero(np.diff(ts) > session_gap_seconds) + 1
+        starts = np.concatenate(([0], boundaries))
+        ends = np.concatenate((boundaries, [len(ts)]))
         
-        # Thêm session cuối cùng
-        if current_session:
+        sessions = []
+        for session_id, (start, end) in enumerate(zip(starts.tolist(), ends.tolist()), 1):
+            current_session = conversations[start:end]
+            session_topics = set()
+            for conv in current_session:
+                session_topics.update(conv['topics'])
             sessions.append({
-                'session_id': len(sessions) + 1,
+                'session_id': session_id,
                 'start_time': current_session[0]['timestamp'],
                 'end_time': current_session[-1]['timestamp'],
                 'message_count': len(current_session),
-                'duration_minutes': (
-                    datetime.fromisoformat(current_session[-1]['timestamp']) -
-                    datetime.fromisoformat(current_session[0]['timestamp'])
-                ).total_seconds() / 60,
-                'topics': list(set(topic for conv in current_session for topic in conv['topics'])),
+                'duration_minutes': float(ts[end - 1] - ts[start]) / 60,
+                'topics': list(session_topics),
                 'sentiment_evolution': [conv['sentiment'] for conv in current_session]
             })
         
@@ -103,220 +271,200 @@ class ConversationInsights:
 
     def analyze_topic_transitions(self, conversations):
         """Phân tích chuyển đổi chủ đề"""
-        transitions = []
         topic_sequences = []
         
         for conv in conversations:
             topic_sequences.extend(conv['topics'])
         
-        # Tạo transition matrix
-        transition_counts = defaultdict(lambda: defaultdict(int))
+        # Mã hoá topic thành số theo thứ tự xuất hiện đầu tiên
+        topic_index = {}
+        codes = np.fromiter((topic_index.setdefault(topic, len(topic_index)) for topic in topic_sequences),
+                            dtype=np.intp, count=len(topic_sequences))
+        topics = list(topic_index)
         
-        for i in range(len(topic_sequences) - 1):
-            current_topic = topic_sequences[i]
-            next_topic = topic_sequences[i + 1]
-            transition_counts[current_topic][next_topic] += 1
+        # Tạo transition matrix bằng một lần scatter-add
+        transition_matrix = np.zeros((len(topics), len(topics)), dtype=np.int64)
+        np.add.at(transition_matrix, (codes[:-1], codes[1:]), 1)
+        row_totals = transition_matrix.sum(axis=1)
         
-        # Tính transition probabilities
+        # Chuyển về dict cho output - chỉ giữ các transition thực sự xuất hiện
+        transition_counts = {}
         transition_probs = {}
-        for from_topic, to_topics in transition_counts.items():
-            total = sum(to_topics.values())
-            transition_probs[from_topic] = {
-                to_topic: count / total
-                for to_topic, count in to_topics.items()
+        for from_code in np.flatnonzero(row_totals).tolist():
+            row = transition_matrix[from_code]
+            to_codes = np.flatnonzero(row)
+            total = row_totals[from_code]
+            transition_counts[topics[from_code]] = {
+                topics[to_code]: count for to_code, count in zip(to_codes.tolist(), row[to_codes].tolist())
+            }
+            transition_probs[topics[from_code]] = {
+                topics[to_code]: prob for to_code, prob in zip(to_codes.tolist(), (row[to_codes] / total).tolist())
             }
         
         return {
-            'transition_counts': dict(transition_counts),
+            'transition_counts': transition_counts,
             'transition_probabilities': transition_probs,
-            'most_common_transitions': self.get_top_transitions(transition_counts),
-            'topic_persistence': self.calculate_topic_persistence(topic_sequences)
+            'most_common_transitions': self.get_top_transitions(transition_matrix, topics),
+            'topic_persistence': self.calculate_topic_persistence(codes)
         }
 
-    def get_top_transitions(self, transition_counts, top_n=5):
-        """Lấy top transitions phổ biến nhất"""
-        all_transitions = []
+    def get_top_transitions(self, transition_matrix, topics, top_n=5):
+        """Lấy top transitions phổ biến nhất từ transition matrix"""
+        off_diagonal = transition_matrix.copy()
+        np.fill_diagonal(off_diagonal, 0)  # Loại bỏ self-transitions
         
-        for from_topic, to_topics in transition_counts.items():
-            for to_topic, count in to_topics.items():
-                if from_topic != to_topic:  # Loại bỏ self-transitions
-                    all_transitions.append((from_topic, to_topic, count))
+        flat = off_diagonal.ravel()
+        nonzero = np.flatnonzero(flat)
+        top = nonzero[np.argsort(-flat[nonzero], kind='stable')[:top_n]]
         
-        return sorted(all_transitions, key=lambda x: x[2], reverse=True)[:top_n]
+        size = len(topics)
+        return [(topics[idx // size], topics[idx % size], int(flat[idx])) for idx in top.tolist()]
 
     def calculate_topic_persistence(self, topic_sequences):
         """Tính độ bền vững của chủ đề"""
         if len(topic_sequences) < 2:
             return 0
         
-        same_topic_count = sum(1 for i in range(len(topic_sequences) - 1) 
-                              if topic_sequences[i] == topic_sequences[i + 1])
+        sequence = np.asarray(topic_sequences)
+        same_topic_count = int(np.count_nonzero(sequence[1:] == sequence[:-1]))
         
         return same_topic_count / (len(topic_sequences) - 1)
 
-    def analyze_sentiment_journey(self, conversations):
-        """Phân tích hành trình cảm xúc"""
+    def analyze_sentiment_journey(self, conversations, columns=None):
+        """Phân tích hành trình cảm xúc
+        
+        columns: cột numpy từ _conversation_columns (tuỳ chọn)
+        """
         sentiments = [conv['sentiment'] for conv in conversations]
+        codes = columns['sentiment_code'] if columns is not None else _sentiment_codes(conversations)
         
-        # Tính sentiment transitions
-        sentiment_transitions = defaultdict(lambda: defaultdict(int))
-        for i in range(len(sentiments) - 1):
-            current = sentiments[i]
-            next_sentiment = sentiments[i + 1]
-            sentiment_transitions[current][next_sentiment] += 1
+        # Transitions, stability, dominant, trend và patterns trong một lần chạy kernel
+        (stable_count, transitions, counts, first_seen, slope,
+         recovery_idx, decline_idx, streaks) = _get_sentiment_stats()(codes)
         
-        # Tính sentiment stability
-        stability_score = sum(1 for i in range(len(sentiments) - 1) 
-                             if sentiments[i] == sentiments[i + 1]) / max(1, len(sentiments) - 1)
+        # Tính sentiment transitions
+        sentiment_transitions = {}
+        for from_code, to_code in zip(*np.nonzero(transitions)):
+            sentiment_transitions.setdefault(_SENTIMENT_LABELS[from_code], {})[_SENTIMENT_LABELS[to_code]] = \
+                int(transitions[from_code, to_code])
         
-        # Tìm sentiment patterns
-        patterns = self.find_sentiment_patterns(sentiments)
+        # Sentiment chiếm ưu thế - hoà thì lấy sentiment xuất hiện trước (như Counter.most_common)
+        dominant_sentiment = None
+        if sentiments:
+            dominant = min(np.flatnonzero(counts == counts.max()).tolist(), key=lambda code: first_seen[code])
+            dominant_sentiment = (_SENTIMENT_LABELS[dominant], int(counts[dominant]))
         
         return {
             'sentiment_sequence': sentiments,
-            'sentiment_transitions': dict(sentiment_transitions),
-            'stability_score': stability_score,
-            'dominant_sentiment': Counter(sentiments).most_common(1)[0] if sentiments else None,
-            'sentiment_patterns': patterns,
-            'sentiment_improvement': self.calculate_sentiment_trend(sentiments)
+            'sentiment_transitions': sentiment_transitions,
+            'stability_score': int(stable_count) / max(1, len(sentiments) - 1),
+            'dominant_sentiment': dominant_sentiment,
+            'sentiment_patterns': self._build_sentiment_patterns(recovery_idx, decline_idx, streaks),
+            'sentiment_improvement': float(slope) if len(sentiments) >= 2 else 0
         }
 
     def find_sentiment_patterns(self, sentiments):
         """Tìm patterns trong sentiment sequence"""
-        patterns = []
-        
-        # Pattern: Negative -> Positive (recovery)
-        for i in range(len(sentiments) - 1):
-            if sentiments[i] == 'negative' and sentiments[i + 1] == 'positive':
-                patterns.append(('recovery', i))
-        
-        # Pattern: Positive -> Negative (decline)
-        for i in range(len(sentiments) - 1):
-            if sentiments[i] == 'positive' and sentiments[i + 1] == 'negative':
-                patterns.append(('decline', i))
-        
-        # Pattern: Consistent positive streak
-        streak_count = 0
-        for sentiment in sentiments:
-            if sentiment == 'positive':
-                streak_count += 1
-            else:
-                if streak_count >= 3:
-                    patterns.append(('positive_streak', streak_count))
-                streak_count = 0
+        if not sentiments:
+            return []
         
+        codes = np.fromiter((_SENTIMENT_CODES[s] for s in sentiments), dtype=np.int8, count=len(sentiments))
+        _, _, _, _, _, recovery_idx, decline_idx, streaks = _get_sentiment_stats()(codes)
+        return self._build_sentiment_patterns(recovery_idx, decline_idx, streaks)
+
+    def _build_sentiment_patterns(self, recovery_idx, decline_idx, streaks):
+        """Ghép kết quả kernel thành list patterns: recovery, decline rồi positive streak"""
+        patterns = [('recovery', i) for i in recovery_idx.tolist()]
+        patterns.extend(('decline', i) for i in decline_idx.tolist())
+        patterns.extend(('positive_streak', count) for count in streaks.tolist())
         return patterns
 
-    def calculate_sentiment_trend(self, sentiments):
+    def calculate_sentiment_trend(self, sentiments, codes=None):
         """Tính xu hướng cảm xúc (cải thiện/xấu đi)"""
         if len(sentiments) < 2:
             return 0
         
-        # Chuyển sentiment thành số
-        sentiment_values = {'negative': -1, 'neutral': 0, 'positive': 1}
-        values = [sentiment_values[s] for s in sentiments]
-        
-        # Tính trend bằng linear regression đơn giản
-        n = len(values)
-        x = list(range(n))
-        
-        # Slope của regression line
-        slope = (n * sum(x[i] * values[i] for i in range(n)) - sum(x) * sum(values)) / \
-                (n * sum(x[i]**2 for i in range(n)) - sum(x)**2)
-        
-        return slope
+        # Chuyển sentiment thành số rồi tính trend bằng linear regression
+        if codes is None:
+            codes = [_SENTIMENT_CODES[s] for s in sentiments]
+        return _linear_slope(codes)
 
-    def analyze_engagement_patterns(self, conversations):
-        """Phân tích patterns tương tác"""
-        message_lengths = [conv['message_length'] for conv in conversations]
-        response_times = [conv['response_time'] for conv in conversations]
+    def analyze_engagement_patterns(self, conversations, columns=None):
+        """Phân tích patterns tương tác
+        
+        columns: cột numpy từ _conversation_columns (tuỳ chọn)
+        """
+        if columns is None:
+            columns = _conversation_columns(conversations)
+        message_lengths = columns['msg_len']
+        timestamps = columns['ts']
         
         # Tính engagement metrics
-        avg_message_length = np.mean(message_lengths)
+        avg_message_length = message_lengths.mean()
         message_length_trend = self.calculate_trend(message_lengths)
-        response_time_trend = self.calculate_trend(response_times)
+        response_time_trend = self.calculate_trend(columns['resp_time'])
         
         # Phân tích message frequency
-        timestamps = [datetime.fromisoformat(conv['timestamp']) for conv in conversations]
-        time_gaps = [(timestamps[i+1] - timestamps[i]).total_seconds() 
-                    for i in range(len(timestamps) - 1)]
+        time_gaps = np.diff(timestamps)
         
         return {
             'avg_message_length': avg_message_length,
             'message_length_trend': message_length_trend,
             'response_time_trend': response_time_trend,
-            'avg_time_between_messages': np.mean(time_gaps) if time_gaps else 0,
-            'engagement_consistency': 1 / (1 + np.std(message_lengths)) if message_lengths else 0,
-            'conversation_intensity': len(conversations) / max(1, (timestamps[-1] - timestamps[0]).days)
+            'avg_time_between_messages': time_gaps.mean() if time_gaps.size else 0,
+            'engagement_consistency': 1 / (1 + message_lengths.std()) if message_lengths.size else 0,
+            'conversation_intensity': len(conversations) / max(1, int((timestamps[-1] - timestamps[0]) // 86400))
         }
 
     def calculate_trend(self, values):
         """Tính trend của một chuỗi giá trị"""
-        if len(values) < 2:
-            return 0
+        return _linear_slope(values)
+
+    def analyze_response_satisfaction(self, conversations, columns=None):
+        """Phân tích mức độ hài lòng với response
+        
+        columns: cột numpy từ _conversation_columns (tuỳ chọn)
+        """
+        n = len(conversations)
+        if n == 0:
+            return {
+                'satisfaction_scores': [],
+                'avg_satisfaction': 0,
+                'satisfaction_trend': 0,
+                'highly_satisfied_count': 0,
+                'dissatisfied_count': 0
+            }
         
-        n = len(values)
-        x = list(range(n))
+        response_times = columns['resp_time'] if columns is not None else \
+            np.fromiter((conv['response_time'] for conv in conversations), dtype=np.float64, count=n)
+        response_lengths = np.fromiter((len(conv['bot_response']) for conv in conversations), dtype=np.int64, count=n)
         
-        slope = (n * sum(x[i] * values[i] for i in range(n)) - sum(x) * sum(values)) / \
-                (n * sum(x[i]**2 for i in range(n)) - sum(x)**2)
+        # Indicators từ next message của user (conversation cuối không có next message)
+        next_positive = np.zeros(n, dtype=bool)
+        next_negative = np.zeros(n, dtype=bool)
+        next_confused = np.zeros(n, dtype=bool)
+        for i in range(n - 1):
+            next_msg = conversations[i + 1]['user_message'].lower()
+            next_positive[i] = _POSITIVE_WORDS_RE.search(next_msg) is not None
+            next_negative[i] = _NEGATIVE_WORDS_RE.search(next_msg) is not None
+            next_confused[i] = _CONFUSION_WORDS_RE.search(next_msg) is not None
         
-        return slope
-
-    def analyze_response_satisfaction(self, conversations):
-        """Phân tích mức độ hài lòng với response"""
-        satisfaction_indicators = []
+        # Positive > negative > confusion như thứ tự if/elif
+        scores = np.select([next_positive, next_negative, next_confused], [1.0, -1.0, -0.5], 0.0)
         
-        for i, conv in enumerate(conversations):
-            # Indicators của satisfaction
-            user_msg = conv['user_message'].lower()
-            bot_response = conv['bot_response'].lower()
-            
-            # Positive indicators
-            positive_words = ['thanks', 'thank you', 'good', 'great', 'awesome', 'perfect', 
-                            'cảm ơn', 'tốt', 'hay', 'được', 'ok', 'oke']
-            
-            # Negative indicators  
-            negative_words = ['wrong', 'bad', 'not good', 'terrible', 'sai', 'tệ', 'không tốt', 
-                            'dở', 'không đúng', 'chẳng hiểu']
-            
-            # Confusion indicators
-            confusion_words = ['what', 'huh', 'confused', 'không hiểu', 'gì', 'sao', 'hả']
-            
-            satisfaction_score = 0
-            
-            # Kiểm tra next message của user (nếu có)
-            if i < len(conversations) - 1:
-                next_msg = conversations[i + 1]['user_message'].lower()
-                
-                if any(word in next_msg for word in positive_words):
-                    satisfaction_score += 1
-                elif any(word in next_msg for word in negative_words):
-                    satisfaction_score -= 1
-                elif any(word in next_msg for word in confusion_words):
-                    satisfaction_score -= 0.5
-            
-            # Kiểm tra response time (nhanh = tốt)
-            if conv['response_time'] < 2:
-                satisfaction_score += 0.3
-            elif conv['response_time'] > 10:
-                satisfaction_score -= 0.3
-            
-            # Kiểm tra response length (quá ngắn hoặc quá dài có thể không tốt)
-            response_length = len(bot_response)
-            if 20 <= response_length <= 200:
-                satisfaction_score += 0.2
-            elif response_length < 5 or response_length > 500:
-                satisfaction_score -= 0.2
-            
-            satisfaction_indicators.append(satisfaction_score)
+        # Response time (nhanh = tốt)
+        scores += np.select([response_times < 2, response_times > 10], [0.3, -0.3], 0.0)
+        
+        # Response length (quá ngắn hoặc quá dài có thể không tốt)
+        scores += np.select([(response_lengths >= 20) & (response_lengths <= 200),
+                             (response_lengths < 5) | (response_lengths > 500)], [0.2, -0.2], 0.0)
         
         return {
-            'satisfaction_scores': satisfaction_indicators,
-            'avg_satisfaction': np.mean(satisfaction_indicators) if satisfaction_indicators else 0,
-            'satisfaction_trend': self.calculate_trend(satisfaction_indicators),
-            'highly_satisfied_count': sum(1 for score in satisfaction_indicators if score > 0.5),
-            'dissatisfied_count': sum(1 for score in satisfaction_indicators if score < -0.5)
+            'satisfaction_scores': scores.tolist(),
+            'avg_satisfaction': scores.mean(),
+            'satisfaction_trend': self.calculate_trend(scores),
+            'highly_satisfied_count': int(np.count_nonzero(scores > 0.5)),
+            'dissatisfied_count': int(np.count_nonzero(scores < -0.5))
         }
 
     def cluster_conversation_topics(self, conversations, n_clusters=5):
@@ -327,30 +475,46 @@ class ConversationInsights:
         # Tạo text corpus
         texts = [conv['user_message'] for conv in conversations]
         
-        # TF-IDF vectorization
-        vectorizer = TfidfVectorizer(max_features=100, stop_words='english')
         try:
-            tfidf_matrix = vectorizer.fit_transform(texts)
+            if len(texts) >= _LARGE_CORPUS_SIZE:
+                # Corpus lớn: hashing (không cần vocabulary) + mini-batch k-means, bộ nhớ không phụ thuộc corpus
+                vectorizer = HashingVectorizer(n_features=4096, alternate_sign=False, norm='l2',
+                                               stop_words='english', dtype=np.float32)
+                tfidf_matrix = vectorizer.transform(texts)
+                kmeans = MiniBatchKMeans(n_clusters=n_clusters, batch_size=256, n_init=3, random_state=42)
+            else:
+                # TF-IDF vectorization (float32 cho nhẹ bộ nhớ)
+                vectorizer = TfidfVectorizer(max_features=100, stop_words='english', dtype=np.float32)
+                tfidf_matrix = vectorizer.fit_transform(texts)
+                kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=1, algorithm='elkan')
             
             # K-means clustering
-            kmeans = KMeans(n_clusters=n_clusters, random_state=42)
             cluster_labels = kmeans.fit_predict(tfidf_matrix)
             
             # Phân tích clusters
+            sentiment_codes = _sentiment_codes(conversations)
             clusters = defaultdict(list)
             for i, label in enumerate(cluster_labels):
                 clusters[label].append(conversations[i])
             
+            # Mã hoá topics một lần, topic_owner = vị trí conversation chứa topic đó
+            topic_index = {}
+            topic_codes = np.fromiter(
+                (topic_index.setdefault(topic, len(topic_index)) for conv in conversations for topic in conv['topics']),
+                dtype=np.intp)
+            topic_owner = np.repeat(np.arange(len(conversations)), [len(conv['topics']) for conv in conversations])
+            topic_labels = list(topic_index)
+            
             # Tạo cluster summaries
             cluster_summaries = {}
             for cluster_id, cluster_convs in clusters.items():
-                topics = [topic for conv in cluster_convs for topic in conv['topics']]
-                common_topics = Counter(topics).most_common(3)
+                in_cluster = cluster_labels == cluster_id
+                common_topics = _most_common_codes(topic_codes[in_cluster[topic_owner]], topic_labels, 3)
                 
                 cluster_summaries[cluster_id] = {
                     'size': len(cluster_convs),
                     'common_topics': common_topics,
-                    'avg_sentiment': self.calculate_avg_sentiment(cluster_convs),
+                    'avg_sentiment': self.calculate_avg_sentiment(cluster_convs, sentiment_codes[in_cluster]),
                     'sample_messages': [conv['user_message'] for conv in cluster_convs[:3]]
                 }
             
@@ -360,12 +524,12 @@ class ConversationInsights:
             print(f"[INSIGHTS] ⚠️ Lỗi clustering: {str(e)}")
             return None
 
-    def calculate_avg_sentiment(self, conversations):
+    def calculate_avg_sentiment(self, conversations, sentiment_codes=None):
         """Tính sentiment trung bình của một nhóm conversations"""
-        sentiment_values = {'negative': -1, 'neutral': 0, 'positive': 1}
-        values = [sentiment_values[conv['sentiment']] for conv in conversations]
+        if sentiment_codes is None:
+            sentiment_codes = _sentiment_codes(conversations)
         
-        avg_value = np.mean(values)
+        avg_value = sentiment_codes.mean()
         
         if avg_value > 0.3:
             return 'positive'
@@ -376,21 +540,28 @@ class ConversationInsights:
 
     def build_topic_network(self, conversations):
         """Xây dựng mạng lưới chủ đề"""
-        G = nx.Graph()
-        
-        # Thêm edges giữa các topics xuất hiện cùng nhau
+        # Đếm các cặp topics xuất hiện cùng nhau rồi thêm edges một lần
+        pair_counts = Counter()
         for conv in conversations:
-            topics = conv['topics']
-            for i in range(len(topics)):
-                for j in range(i + 1, len(topics)):
-                    if G.has_edge(topics[i], topics[j]):
-                        G[topics[i]][topics[j]]['weight'] += 1
-                    else:
-                        G.add_edge(topics[i], topics[j], weight=1)
-        
-        # Tính centrality measures
-        centrality = nx.degree_centrality(G)
-        betweenness = nx.betweenness_centrality(G)
+            pair_counts.update(combinations(sorted(set(conv['topics'])), 2))
+        
+        G = nx.Graph()
+        G.add_weighted_edges_from((u, v, weight) for (u, v), weight in pair_counts.items())
+        
+        # Degree centrality = bậc / (n - 1), bậc đếm thẳng từ các cặp (không có self-loop)
+        degrees = Counter()
+        for u, v in pair_counts:
+            degrees[u] += 1
+            degrees[v] += 1
+        scale = 1 / (len(degrees) - 1) if len(degrees) > 1 else 1
+        centrality = {topic: degree * scale for topic, degree in degrees.items()}
+        
+        # Betweenness chính xác là O(V*E) - graph lớn thì ước lượng trên mẫu node
+        n_nodes = G.number_of_nodes()
+        if n_nodes > _LARGE_GRAPH_NODES:
+            betweenness = nx.betweenness_centrality(G, k=min(_BETWEENNESS_SAMPLES, n_nodes), seed=42, normalized=True)
+        else:
+            betweenness = nx.betweenness_centrality(G)
         
         return {
             'graph': G,
@@ -401,7 +572,18 @@ class ConversationInsights:
         }
 
     def generate_insights_report(self, user_id, days=30):
-        """Tạo báo cáo insights tổng hợp"""
+        """
+        Tạo báo cáo insights tổng hợp (có cache theo version dữ liệu của user)
+        Trả về bản copy nông - các giá trị lồng bên trong dùng chung với cache, chỉ đọc
+        """
+        # Không có analytics engine thì không biết version dữ liệu -> không cache
+        version = self.analytics_engine.user_version(user_id) if self.analytics_engine else None
+        cache_key = (user_id, days, date.today())
+        cached = self._report_cache.get(cache_key)
+        if version is not None and cached is not None and cached[0] == version:
+            self._report_cache.move_to_end(cache_key)
+            return dict(cached[1])
+        
         flow_analysis = self.analyze_conversation_flow(user_id, days)
         
         if not flow_analysis:
@@ -413,14 +595,19 @@ class ConversationInsights:
         report = {
             'user_id': user_id,
             'analysis_period_days': days,
-            'generated_at': datetime.now().isoformat(),
+            'generated_at': datetime.now().isoformat(timespec='seconds'),
             'conversation_flow': flow_analysis,
             'user_profile': user_insights,
             'key_insights': self.extract_key_insights(flow_analysis, user_insights),
             'recommendations': self.generate_recommendations(flow_analysis, user_insights)
         }
         
-        return report
+        if version is not None:
+            self._report_cache[cache_key] = (version, report)
+            self._report_cache.move_to_end(cache_key)
+            while len(self._report_cache) > _REPORT_CACHE_SIZE:
+                self._report_cache.popitem(last=False)
+        return dict(report)
 
     def extract_key_insights(self, flow_analysis, user_insights):
         """Trích xuất insights chính"""
@@ -498,14 +685,20 @@ class ConversationInsights:
     def save_insights_report(self, user_id, filename=None):
         """Lưu báo cáo insights"""
         if not filename:
-            filename = f"analytics/insights_{user_id}_{datetime.now().strftime('%Y%m%d')}.json"
+            filename = f"analytics/insights_{user_id}_{date.today().isoformat().replace('-', '')}.json"
         
         try:
             report = self.generate_insights_report(user_id)
             if report:
                 os.makedirs(os.path.dirname(filename), exist_ok=True)
-                with open(filename, 'w', encoding='utf-8') as f:
-                    json.dump(report, f, indent=2, ensure_ascii=False)
+                if orjson is not None:
+                    data = orjson.dumps(report, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS |
+                                        orjson.OPT_SERIALIZE_NUMPY)
+                    with open(filename, 'wb') as f:
+                        f.write(data)
+                else:
+                    with open(filename, 'w', encoding='utf-8') as f:
+                        json.dump(report, f, indent=2, ensure_ascii=False)
                 
                 print(f"[INSIGHTS] 💾 Insights report saved: {filename}")
                 return True
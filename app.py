@@ -5,13 +5,20 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.action_chains import ActionChains
 from selenium.webdriver.common.keys import Keys
+from selenium.common.exceptions import StaleElementReferenceException
 from webdriver_manager.chrome import ChromeDriverManager
 import time
 import os
-import shutil
 import threading
-import random
+import socket
 import uuid
+import asyncio
+import hashlib
+import functools
+from collections import namedtuple
+import logging
+from datetime import datetime, timedelta
+import numpy as np
 from core import create_insta_bot, cleanup_insta_bot
 
 # Load environment variables from .env file
@@ -22,6 +29,12 @@ except ImportError:
     # python-dotenv not installed, skip loading .env file
     pass
 
+try:
+    import xxhash
+except ImportError:
+    # xxhash chưa cài, hash tin nhắn bằng blake2b của hashlib
+    xxhash = None
+
 # Import các module mới
 from monitoring.performance_monitor import get_performance_monitor
 from monitoring.error_handler import get_error_handler, retry_on_error, ErrorSeverity
@@ -29,9 +42,265 @@ from security.security_manager import get_security_manager
 from security.session_manager import get_session_manager
 from analytics.analytics_engine import get_analytics_engine
 from analytics.conversation_insights import get_conversation_insights
+from utils.browser_pool import get_browser_pool
+from utils.buffered_log import get_logger, flush_logs
 from utils.notification_system import notify_info, notify_warning, notify_error, notify_critical
 from config.config_manager import get_config_manager
 
+log = get_logger()
+
+
+# Selector là cặp (loại, biểu thức): 'css' chạy bằng querySelectorAll (selector engine native của Blink,
+# nhanh hơn XPath), 'xpath' chỉ dùng khi cần điều kiện theo text
+_QUERY_ALL_JS = """
+const queryAll = ([kind, sel]) => {
+    if (kind === 'css') return document.querySelectorAll(sel);
+    const snap = document.evaluate(sel, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+    return {length: snap.snapshotLength, item: (i) => snap.snapshotItem(i)};
+};
+"""
+
+# Đánh giá cả danh sách selector trong trang bằng một lần execute_script.
+# mode: 'first' - node đầu tiên của selector khớp sớm nhất
+#       'clickable' - như 'first' nhưng node phải hiển thị và không bị disabled
+#       'last' - node cuối cùng của selector khớp sớm nhất (vd: tin nhắn mới nhất)
+# Trả về [vị trí selector, element, innerText] hoặc null
+_FIND_SELECTOR_JS = _QUERY_ALL_JS + """
+const selectors = arguments[0], mode = arguments[1];
+for (let i = 0; i < selectors.length; i++) {
+    const nodes = queryAll(selectors[i]);
+    if (nodes.length === 0) continue;
+    const node = nodes.item(mode === 'last' ? nodes.length - 1 : 0);
+    if (mode === 'clickable' && (node.disabled || node.getClientRects().length === 0)) continue;
+    return [i, node, node.innerText || ''];
+}
+return null;
+"""
+
+
+# Cài MutationObserver theo dõi tin nhắn mới nhất: selector chỉ được đánh giá lại khi DOM thay đổi
+# (gộp các mutation trong 100ms), Python chỉ cần đọc window.__instaMsgWatcher.latest
+_INSTALL_MESSAGE_WATCHER_JS = _QUERY_ALL_JS + """
+const selectors = arguments[0];
+const findLatest = () => {
+    for (const selector of selectors) {
+        const nodes = queryAll(selector);
+        if (nodes.length > 0) return nodes.item(nodes.length - 1).innerText || '';
+    }
+    return null;
+};
+const watcher = window.__instaMsgWatcher = {latest: findLatest(), pending: false};
+new MutationObserver(() => {
+    if (watcher.pending) return;
+    watcher.pending = true;
+    setTimeout(() => {
+        watcher.pending = false;
+        watcher.latest = findLatest();
+    }, 100);
+}).observe(document.body, {childList: true, subtree: true, characterData: true});
+return [watcher.latest];
+"""
+
+# Đọc tin nhắn mới nhất từ observer; null nếu trang đã load lại (observer mất)
+_READ_MESSAGE_WATCHER_EXPR = "window.__instaMsgWatcher ? [window.__instaMsgWatcher.latest] : null"
+
+
+def poll_js_until(driver, script, *args, timeout=3, interval=0.2):
+    """Chạy script trong trang cho đến khi trả về giá trị truthy hoặc hết timeout (None)"""
+    deadline = time.monotonic() + timeout
+    while True:
+        result = driver.execute_script(script, *args)
+        if result:
+            return result
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(interval)
+
+
+def read_message_watcher(driver):
+    """Đọc state của message observer bằng CDP Runtime.evaluate - một lệnh, trả về giá trị thuần (không qua lớp element của WebDriver)"""
+    result = driver.execute_cdp_cmd('Runtime.evaluate', {
+        'expression': _READ_MESSAGE_WATCHER_EXPR,
+        'returnByValue': True,
+    })
+    return result.get('result', {}).get('value')
+
+
+def find_free_port():
+    """Xin OS một port TCP trống trên localhost (bind port 0) cho Chrome debug port"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def find_first_selector(driver, selectors, mode='first', timeout=3):
+    """Tìm element theo danh sách selector (ưu tiên theo thứ tự), trả về (index, element, text) hoặc None"""
+    result = poll_js_until(driver, _FIND_SELECTOR_JS, selectors, mode, timeout=timeout)
+    if result:
+        return result[0], result[1], result[2]
+    return None
+
+
+def _preview(text, length):
+    """Rút gọn tin nhắn để in log"""
+    return f"'{text[:length]}...'" if text else 'None'
+
+
+# Kết quả phân loại tin nhắn đọc được từ DOM
+MSG_NEW, MSG_BOT, MSG_DUP = 0, 1, 2
+
+# Ring buffer (hash, timestamp) các tin nhắn đã xử lý
+_MSG_RING_SIZE = 128
+_MSG_DEDUP_SECONDS = 120  # Bằng time window mặc định của create_message_hash
+
+# Thay tab thất bại (login lỗi...) thì chờ 60s, 120s, 240s... (tối đa 1 giờ) mới thử lại - tránh login dồn dập bị khóa
+_RECYCLE_BACKOFF_BASE = 60
+_RECYCLE_BACKOFF_MAX = 3600
+
+
+def _code_points(text):
+    """Chuỗi -> mảng code point (uint32) cho kernel numba"""
+    return np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+
+
+def _classify_message_str(message, last_user, last_user_t, last_sent, last_sent_t, now):
+    """Phân loại tin nhắn bằng so sánh chuỗi -> (là tin của bot, là tin trùng)"""
+    is_bot = bool(last_sent and now - last_sent_t < 30 and (
+        # Exact match, hoặc một bên dài bị cắt nằm trong bên kia
+        message == last_sent or
+        (len(last_sent) > 30 and message in last_sent) or
+        (len(message) > 30 and last_sent in message)))
+    
+    # Same as last user message trong 60 giây
+    is_dup = message == last_user and now - last_user_t < 60
+    
+    # Very similar message (typo protection) - so sánh từng ký tự (code point) bằng numpy
+    if (not is_dup and last_user and len(message) > 5 and
+            abs(len(message) - len(last_user)) <= 2 and now - last_user_t < 30):
+        a = _code_points(message.lower())
+        b = _code_points(last_user.lower())
+        n = min(len(a), len(b))
+        common_chars = int(np.count_nonzero(a[:n] == b[:n]))
+        is_dup = common_chars / max(len(message), len(last_user)) > 0.85
+    
+    return is_bot, is_dup
+
+
+def _classify_message_loop(msg, msg_lower, last_user, last_user_lower, last_user_t,
+                           last_sent, last_sent_t, now):
+    """Như _classify_message_str nhưng trên mảng code point, vòng lặp thuần - dành cho numba"""
+    n = msg.shape[0]
+    m = last_sent.shape[0]
+    
+    # Tin của bot: msg nằm trong tin bot (hoặc ngược lại) trong 30 giây - exact match là trường hợp cùng độ dài
+    is_bot = False
+    if m > 0 and now - last_sent_t < 30:
+        for direction in range(2):
+            if direction == 0:
+                hay, needle, allowed = last_sent, msg, m > 30 or n == m
+            else:
+                hay, needle, allowed = msg, last_sent, n > 30
+            if not allowed or needle.shape[0] > hay.shape[0]:
+                continue
+            for i in range(hay.shape[0] - needle.shape[0] + 1):
+                j = 0
+                while j < needle.shape[0] and hay[i + j] == needle[j]:
+                    j += 1
+                if j == needle.shape[0]:
+                    is_bot = True
+                    break
+            if is_bot:
+                break
+    
+    # Same as last user message trong 60 giây
+    k = last_user.shape[0]
+    is_dup = False
+    if now - last_user_t < 60 and n == k:
+        is_dup = True
+        for i in range(n):
+            if msg[i] != last_user[i]:
+                is_dup = False
+                break
+    
+    # Very similar message (typo protection)
+    if not is_dup and k > 0 and n > 5 and abs(n - k) <= 2 and now - last_user_t < 30:
+        common_chars = 0
+        for i in range(min(msg_lower.shape[0], last_user_lower.shape[0])):
+            if msg_lower[i] == last_user_lower[i]:
+                common_chars += 1
+        is_dup = common_chars / max(n, k) > 0.85
+    
+    return is_bot, is_dup
+
+
+@functools.lru_cache(maxsize=None)
+def _get_message_classifier():
+    """Chọn hàm phân loại tin nhắn - import numba lúc cần (import numba khá nặng, không làm ở module load)"""
+    try:
+        import numba
+    except ImportError:
+        # numba chưa cài, phân loại bằng so sánh chuỗi
+        return _classify_message_str
+    kernel = numba.njit(cache=True)(_classify_message_loop)
+    
+    def classify(message, last_user, last_user_t, last_sent, last_sent_t, now):
+        # Encode một lần tại chỗ poll, kernel chỉ làm việc trên mảng uint32
+        return kernel(_code_points(message), _code_points(message.lower()),
+                      _code_points(last_user), _code_points(last_user.lower()), float(last_user_t),
+                      _code_points(last_sent), float(last_sent_t), float(now))
+    return classify
+
+
+# Selector dùng chung, khai báo một lần ở module. Ưu tiên CSS, chỉ giữ XPath khi cần so khớp text
+# Các element chỉ xuất hiện khi đã đăng nhập
+_LOGIN_SUCCESS_SELECTORS = (
+    ('xpath', "//button[contains(text(), 'Save info') or contains(text(), 'Save Info')]"),
+    ('xpath', "//button[contains(text(), 'Not Now')]"),
+    ('css', 'div[aria-label*="Home"]'),
+    ('css', 'a[href*="/direct/"]'),
+    ('xpath', "//span[text()='Home']"),
+)
+_SAVE_INFO_INDICATOR = 0  # Vị trí nút Save info trong _LOGIN_SUCCESS_SELECTORS
+
+# Thông báo lỗi đăng nhập của Instagram (sai mật khẩu, sai username...)
+_LOGIN_ERROR_SELECTORS = (
+    ('css', '#slfErrorAlert'),
+    ('css', 'form#loginForm div[role="alert"]'),
+    ('xpath', "//div[contains(text(), 'password was incorrect') or contains(text(), 'check your username')]"),
+)
+
+# Nút Message trên trang profile
+_MESSAGE_BUTTON_SELECTORS = (
+    ('xpath', "//div[contains(text(), 'Message')]"),
+    ('xpath', "//button[contains(text(), 'Message')]"),
+    ('xpath', "//a[contains(text(), 'Message')]"),
+    ('xpath', "//div[@role='button' and contains(text(), 'Message')]"),
+    ('xpath', "//div[contains(@class, '_acan') and contains(text(), 'Message')]"),
+    ('xpath', "//div[contains(@class, '_ap30')]//div[contains(text(), 'Message')]"),
+    ('css', 'button._acan'),
+    ('css', 'div[class="x1i10hfl xjqpnuy xa49m3k xqeqjp1 x2hbi6w x972fbf xcfux6l x1qhh985 xm0m39n xdl72j9 x2lah0s xe8uvvx xdj266r x11i5rnm xat24cr x1mh8g0r x2lwn1j xeuugli xexx8yu x18d9i69 x1hl2dhg xggy1nq x1ja2u2z x1t137rt x1q0g3np x1lku1pv x1a2a7pz x6s0dn4 xjyslct x1lq5wgf xgqcy7u x30kzoy x9jhf4c x1ejq31n xd10rxx x1sy0etr x17r0tee x9f619 x1ypdohk x78zum5 x1f6kntn xwhw2v2 x10w6t97 xl56j7k x17ydfre x1swvt13 x1pi30zi x1n2onr6 x2b8uid xlyipyv x87ps6o x14atkfc xcdnw81 x1i0vuye x1gjpkn9 x5n08af xsz8vos"]'),
+)
+
+# Tin nhắn trong khung chat (lấy node cuối cùng = tin mới nhất)
+_MESSAGE_SELECTORS = (
+    ('css', 'div[role="none"] div.x126k92a'),
+    ('css', 'div.x1n2onr6 span'),
+    ('css', 'div[data-scope="messages"] div'),
+    ('css', 'div.html-div'),
+    ('css', 'div[class="html-div xexx8yu x4uap5 x18d9i69 xkhd6sd x1gslohp x11i5rnm x12nagc x1mh8g0r x1yc453h x126k92a x18lvrbx"]'),
+    ('css', 'span.x1lliihq'),
+    ('xpath', "//div[contains(text(), 'hi') or contains(text(), 'Hi') or contains(text(), 'hello')]"),
+)
+
+# Ô nhập tin nhắn
+_INPUT_SELECTORS = (
+    ('css', 'div[contenteditable="true"][aria-label="Message"]'),
+    ('css', 'div[contenteditable="true"]'),
+    ('css', 'div[role="textbox"]'),
+    ('css', 'textarea[placeholder="Message..."]'),
+    ('css', 'div[aria-label*="Message"]'),
+)
+
 
 class LoginCreateSession:
     def __init__(self, username=None, password=None, target_username=None, user_temp_dir_path=None):
@@ -50,6 +319,7 @@ class LoginCreateSession:
         self.setup_session()
         
         # Khởi tạo driver và login
+        self.target_id = None  # Tab đang giữ trong browser pool
         self.driver = self.driver_init()
         self.login()
         self.go_to_chat()
@@ -85,17 +355,9 @@ class LoginCreateSession:
         if chrome_config.get('headless', True):
             chrome_options.add_argument("--headless=new")
         
-        # Tạo unique temp directory cho profile
-        import tempfile
-        temp_dir = tempfile.mkdtemp(prefix="chrome_selenium_")
-        chrome_options.add_argument(f"--user-data-dir={temp_dir}")
-        
-        # Lưu để cleanup sau
-        self.temp_profile_dir = temp_dir
-        
-        # Thêm random port để tránh conflict khi chạy nhiều instance
-        random_port = random.randint(9000, 9999)
-        chrome_options.add_argument(f"--remote-debugging-port={random_port}")
+        # Port trống do OS cấp để tránh conflict khi chạy nhiều instance
+        debug_port = find_free_port()
+        chrome_options.add_argument(f"--remote-debugging-port={debug_port}")
         
         # Thêm các option từ config
         if chrome_config.get('no_sandbox', True):
@@ -112,6 +374,18 @@ class LoginCreateSession:
         chrome_options.add_argument("--disable-extensions")
         chrome_options.add_argument("--disable-plugins")
         
+        # Giảm RAM cho listener chạy lâu (không dùng --single-process vì làm hỏng tách tab của browser pool)
+        chrome_options.add_argument("--no-zygote")
+        chrome_options.add_argument("--disable-breakpad")
+        chrome_options.add_argument("--disable-component-extensions-with-background-pages")
+        chrome_options.add_argument("--disable-ipc-flooding-protection")
+        chrome_options.add_argument("--disk-cache-size=1")
+        chrome_options.add_argument("--media-cache-size=1")
+        chrome_options.add_argument("--metrics-recording-only")
+        chrome_options.add_argument("--enable-features=NetworkServiceInProcess")
+        chrome_options.add_argument("--js-flags=--max-old-space-size=512")
+        chrome_options.add_argument("--hide-scrollbars")
+        
         # Window size từ config
         window_size = chrome_config.get('window_size', '1920,1080')
         chrome_options.add_argument(f"--window-size={window_size}")
@@ -142,16 +416,18 @@ class LoginCreateSession:
         }
         chrome_options.add_experimental_option("prefs", prefs)
 
-        print(f"[*] Đang tạo trình duyệt HEADLESS với debug port: {random_port}")
-        print(f"[*] Temp profile: {temp_dir}")
+        # Chrome dùng chung qua browser pool - chỉ khởi động process lần đầu, mỗi session có WebDriver session và tab riêng
+        browser_pool = get_browser_pool()
+        if browser_pool.driver is None:
+            print(f"[*] Đang tạo trình duyệt HEADLESS với debug port: {debug_port}")
         
         try:
-            driver = webdriver.Chrome(options=chrome_options)
+            driver, self.target_id = browser_pool.acquire_tab(chrome_options)
             notify_info("Trình duyệt đã khởi tạo thành công!", "driver_init")
             
             # Lưu thông tin driver vào session
             self.session_manager.update_session(self.session_name, {
-                'chrome_profile_path': temp_dir,
+                'chrome_profile_path': browser_pool.profile_dir,
                 'status': 'driver_ready'
             })
             
@@ -159,12 +435,6 @@ class LoginCreateSession:
         except Exception as e:
             self.error_handler.log_error(e, "driver_init", ErrorSeverity.CRITICAL)
             notify_critical(f"Lỗi khi khởi tạo Chrome: {str(e)}", "driver_init")
-            
-            # Cleanup temp directory nếu failed
-            try:
-                shutil.rmtree(temp_dir)
-            except:
-                pass
                 
             notify_error("Thử các giải pháp sau:", "driver_init")
             notify_error("  1. Cài đặt Chrome browser mới nhất", "driver_init")
@@ -174,10 +444,56 @@ class LoginCreateSession:
             raise
     
     
+    def restore_cookie_session(self):
+        """Đăng nhập lại bằng cookies đã lưu, trả về True nếu session còn hiệu lực"""
+        session_data = self.session_manager.get_session(self.session_name) or {}
+        saved_at = session_data.get('cookies_saved_at')
+        if not saved_at:
+            return False
+        
+        max_age_days = self.config_manager.get('app', 'instagram.cookie_max_age_days', 30)
+        if datetime.now() - datetime.fromisoformat(saved_at) > timedelta(days=max_age_days):
+            notify_info("Cookies đã quá hạn, đăng nhập lại", "login")
+            return False
+        
+        cookies = self.session_manager.load_chrome_cookies(self.session_name)
+        if not cookies:
+            return False
+        
+        notify_info("Đang khôi phục session từ cookies...", "login")
+        try:
+            self.driver.get("https://www.instagram.com/")
+            for cookie in cookies:
+                self.driver.add_cookie(cookie)
+            self.driver.refresh()
+            
+            found = find_first_selector(self.driver, _LOGIN_SUCCESS_SELECTORS, timeout=10)
+            if found and "accounts/login" not in self.driver.current_url:
+                notify_info("Khôi phục session thành công, bỏ qua đăng nhập!", "login")
+                return True
+        except Exception as e:
+            self.error_handler.log_error(e, "restore_cookie_session", ErrorSeverity.LOW)
+        
+        notify_warning("Cookies không còn hiệu lực, đăng nhập lại", "login")
+        self.driver.delete_all_cookies()
+        return False
+
+    def save_login_cookies(self):
+        """Lưu cookies sau khi đăng nhập thành công để lần sau bỏ qua login"""
+        try:
+            if self.session_manager.save_chrome_cookies(self.session_name, self.driver.get_cookies()):
+                notify_info("Đã lưu cookies đăng nhập", "login")
+        except Exception as e:
+            self.error_handler.log_error(e, "save_login_cookies", ErrorSeverity.LOW)
+
     @retry_on_error(max_attempts=3, exceptions=(Exception,))
     def login(self):
         notify_info("Đang đăng nhập...", "login")
         
+        # Thử dùng cookies từ lần đăng nhập trước
+        if self.restore_cookie_session():
+            return
+        
         # Kiểm tra có thể đăng nhập không
         can_login, msg = self.session_manager.can_attempt_login(self.session_name)
         if not can_login:
@@ -187,9 +503,8 @@ class LoginCreateSession:
         notify_info("Đang truy cập Instagram...", "login")
         self.driver.get("https://www.instagram.com/")
         
-        # Chờ page load với config timeout
+        # Chờ page load với config timeout (WebDriverWait tự poll, không cần sleep cố định)
         login_timeout = self.config_manager.get('app', 'instagram.login_timeout', 30)
-        time.sleep(3)
         
         # Tìm username input
         try:
@@ -233,44 +548,39 @@ class LoginCreateSession:
         
         # Chờ một trong các element sau login xuất hiện
         login_success = False
+        login_error = None  # Thông báo lỗi Instagram hiện trên trang (sai mật khẩu...)
         wait_time = login_timeout
         
         try:
             # Thử nhiều selector để detect login thành công
-            success_indicators = [
-                "//button[contains(text(), 'Save info') or contains(text(), 'Save Info')]",
-                "//button[contains(text(), 'Not Now')]", 
-                "//div[contains(@aria-label, 'Home')]",
-                "//a[contains(@href, '/direct/')]",
-                "//span[text()='Home']"
-            ]
-            
-            for i, selector in enumerate(success_indicators):
-                try:
-                    print(f"[*] Kiểm tra indicator {i+1}: {selector[:30]}...")
-                    element = WebDriverWait(self.driver, 5).until(
-                        EC.presence_of_element_located((By.XPATH, selector))
-                    )
-                    print(f"[*] Tìm thấy login indicator {i+1}!")
-                    login_success = True
-                    
-                    # Nếu là Save Info button, click Not Now nếu có
-                    if "Save info" in selector or "Save Info" in selector:
-                        try:
-                            not_now_btn = self.driver.find_element(By.XPATH, "//button[contains(text(), 'Not Now')]")
-                            not_now_btn.click()
-                            print("[*] Đã click 'Not Now' cho Save Info")
-                        except:
-                            pass
-                    break
-                except:
-                    print(f"[!] Indicator {i+1} không tìm thấy")
-                    continue
+            # Kiểm tra tất cả indicators (thành công lẫn lỗi) trong mỗi lần poll thay vì chờ lần lượt từng cái
+            found = find_first_selector(self.driver, _LOGIN_SUCCESS_SELECTORS + _LOGIN_ERROR_SELECTORS,
+                                        timeout=wait_time)
+            if found and found[0] >= len(_LOGIN_SUCCESS_SELECTORS):
+                # Instagram đã báo lỗi - dừng ngay, không chờ hết login timeout
+                login_error = found[2][:100]
+                print(f"[!] Instagram báo lỗi đăng nhập: {login_error}")
+            elif found:
+                i, element, _ = found
+                print(f"[*] Tìm thấy login indicator {i+1}!")
+                login_success = True
+                
+                # Nếu là Save Info button, click Not Now nếu có
+                if i == _SAVE_INFO_INDICATOR:
+                    try:
+                        not_now_btn = self.driver.find_element(By.XPATH, "//button[contains(text(), 'Not Now')]")
+                        not_now_btn.click()
+                        print("[*] Đã click 'Not Now' cho Save Info")
+                    except:
+                        pass
+            else:
+                print("[!] Không tìm thấy login indicator nào")
                     
             if login_success:
                 notify_info('Đăng nhập thành công!', "login")
                 self.session_manager.record_login_attempt(self.session_name, success=True)
-            else:
+                self.save_login_cookies()
+            elif login_error is None:
                 notify_error("Không thể xác nhận đăng nhập thành công", "login")
                 self.session_manager.record_login_attempt(self.session_name, success=False)
                 raise Exception("Login verification failed")
@@ -285,10 +595,17 @@ class LoginCreateSession:
                 notify_info("Có vẻ như đã đăng nhập thành công dựa trên URL", "login")
                 login_success = True
                 self.session_manager.record_login_attempt(self.session_name, success=True)
+                self.save_login_cookies()
             else:
                 self.session_manager.record_login_attempt(self.session_name, success=False)
                 raise Exception(f"Login failed. Current URL: {current_url}")
         
+        # Lỗi Instagram báo rõ ràng: không dùng heuristic URL (trang login cũng là instagram.com/)
+        if login_error is not None:
+            notify_error(f"Instagram báo lỗi đăng nhập: {login_error}", "login")
+            self.session_manager.record_login_attempt(self.session_name, success=False)
+            raise Exception(f"Login failed: {login_error}")
+        
         if not login_success:
             self.session_manager.record_login_attempt(self.session_name, success=False)
             raise Exception("Could not verify login success")
@@ -299,34 +616,15 @@ class LoginCreateSession:
         print(f"[*] Đang truy cập trang của {self.target_username}...")
         self.driver.get(f"https://www.instagram.com/{self.target_username}")
         
-        # Chờ trang load
-        time.sleep(3)
+        # Không sleep chờ trang load - find_first_selector bên dưới tự poll tới khi nút xuất hiện
         print("[*] Đang tìm nút Message...")
         
         # Thử nhiều cách tìm nút Message
         click_message_btn = None
-        message_selectors = [
-            "//div[contains(text(), 'Message')]",
-            "//button[contains(text(), 'Message')]", 
-            "//a[contains(text(), 'Message')]",
-            "//div[@role='button' and contains(text(), 'Message')]",
-            "//div[contains(@class, '_acan') and contains(text(), 'Message')]",
-            "//div[contains(@class, '_ap30')]//div[contains(text(), 'Message')]",
-            "//button[contains(@class, '_acan')]",
-            "//div[@class='x1i10hfl xjqpnuy xa49m3k xqeqjp1 x2hbi6w x972fbf xcfux6l x1qhh985 xm0m39n xdl72j9 x2lah0s xe8uvvx xdj266r x11i5rnm xat24cr x1mh8g0r x2lwn1j xeuugli xexx8yu x18d9i69 x1hl2dhg xggy1nq x1ja2u2z x1t137rt x1q0g3np x1lku1pv x1a2a7pz x6s0dn4 xjyslct x1lq5wgf xgqcy7u x30kzoy x9jhf4c x1ejq31n xd10rxx x1sy0etr x17r0tee x9f619 x1ypdohk x78zum5 x1f6kntn xwhw2v2 x10w6t97 xl56j7k x17ydfre x1swvt13 x1pi30zi x1n2onr6 x2b8uid xlyipyv x87ps6o x14atkfc xcdnw81 x1i0vuye x1gjpkn9 x5n08af xsz8vos']"
-        ]
-        
-        for i, selector in enumerate(message_selectors):
-            try:
-                print(f"[*] Thử selector {i+1}...")
-                click_message_btn = WebDriverWait(self.driver, 3).until(
-                    EC.element_to_be_clickable((By.XPATH, selector))
-                )
-                print(f"[*] Tìm thấy nút Message với selector {i+1}!")
-                break
-            except:
-                print(f"[!] Selector {i+1} không hoạt động")
-                continue
+        found = find_first_selector(self.driver, _MESSAGE_BUTTON_SELECTORS, mode='clickable', timeout=10)
+        if found:
+            i, click_message_btn, _ = found
+            print(f"[*] Tìm thấy nút Message với selector {i+1}!")
         
         if click_message_btn:
             print("[*] Đang click nút Message...")
@@ -340,13 +638,14 @@ class LoginCreateSession:
                 print("[*] Đã click nút Message bằng JavaScript!")
         else:
             print("[!] Không tìm thấy nút Message với tất cả selector!")
-            # In ra source để debug
-            print("[*] Đang in page source để debug...")
-            page_source = self.driver.page_source
-            if "Message" in page_source:
-                print("[*] Từ 'Message' có trong page source")
+            # Kiểm tra text ngay trong trang thay vì tải cả page source về để debug
+            print("[*] Đang kiểm tra nội dung trang để debug...")
+            has_message_text = self.driver.execute_script(
+                "return document.body.innerText.indexOf('Message') >= 0")
+            if has_message_text:
+                print("[*] Từ 'Message' có trong nội dung trang")
             else:
-                print("[!] Từ 'Message' KHÔNG có trong page source")
+                print("[!] Từ 'Message' KHÔNG có trong nội dung trang")
             return
 
         try:
@@ -368,7 +667,10 @@ class Listener(LoginCreateSession):
         self.message_inited = False
         
         # Hệ thống tracking tin nhắn mạnh mẽ
-        self.processed_messages = set()  # Lưu message hash đã xử lý
+        # SoA ring buffer: hash (uint64) + thời điểm xử lý của 128 tin nhắn gần nhất
+        self._msg_ring = np.zeros(_MSG_RING_SIZE, dtype=[('h', 'u8'), ('t', 'f8')])
+        self._ring_i = 0
+        self._hash_index = {}  # hash -> thời điểm xử lý mới nhất, mirror ring để tra O(1)
         self.last_user_message = ""  # Tin nhắn cuối từ user
         self.last_user_message_time = 0  # Thời gian tin nhắn cuối từ user
         self.last_sent_message = ""  # Tin nhắn cuối bot gửi
@@ -378,86 +680,96 @@ class Listener(LoginCreateSession):
         self.total_messages_processed = 0
         self.duplicate_detections = 0
         
+        # Định kỳ thay tab mới để Chrome không phình RAM (DM view của Instagram leak bộ nhớ)
+        self.driver_lock = threading.RLock()
+        self.recycled_at_count = 0
+        self.recycled_at_time = time.time()
+        self.recycle_failures = 0
+        self.recycle_retry_at = 0  # Chưa tới thời điểm này thì không thử thay tab lại
+        
+        # Compile sẵn kernel phân loại (numba) để poll đầu tiên không phải chờ JIT
+        _get_message_classifier()("", "", 0.0, "", 0.0, 0.0)
+        
         self.listener_thread = threading.Thread(target=self.listener)
         self.listener_thread.start()
 
     def create_message_hash(self, message, window_minutes=2):
-        """Tạo hash unique cho tin nhắn trong time window"""
-        import hashlib
+        """Tạo hash unique (số nguyên 64-bit) cho tin nhắn trong time window"""
         # Sử dụng time window để tạo hash
         time_window = int(time.time() // (window_minutes * 60))
-        hash_input = f"{message.strip()}_{time_window}"
-        return hashlib.md5(hash_input.encode()).hexdigest()[:12]
+        hash_input = f"{message.strip()}_{time_window}".encode()
+        if xxhash is not None:
+            return xxhash.xxh64_intdigest(hash_input)
+        return int.from_bytes(hashlib.blake2b(hash_input, digest_size=8).digest(), 'little')
+
+    def classify_message(self, message):
+        """Phân loại tin nhắn một lần cho mỗi poll -> MSG_NEW / MSG_BOT / MSG_DUP"""
+        is_bot, is_dup = _get_message_classifier()(
+            message, self.last_user_message, self.last_user_message_time,
+            self.last_sent_message, self.last_sent_time, time.time())
+        if is_bot:
+            return MSG_BOT
+        
+        # Message hash đã xử lý cũng tính là trùng
+        if self.is_hash_processed(self.create_message_hash(message)):
+            is_dup = True
+        
+        if is_dup:
+            self.duplicate_detections += 1
+            return MSG_DUP
+        return MSG_NEW
 
     def is_bot_message(self, message):
         """Kiểm tra có phải tin nhắn của bot không - nhiều điều kiện"""
-        current_time = time.time()
-        
-        # Check 1: Exact match với tin nhắn vừa gửi
-        if (self.last_sent_message and message == self.last_sent_message and
-            current_time - self.last_sent_time < 30):
-            return True
-            
-        # Check 2: Partial match cho tin nhắn dài bị cắt
-        if (self.last_sent_message and len(self.last_sent_message) > 30 and
-            message in self.last_sent_message and 
-            current_time - self.last_sent_time < 30):
-            return True
-            
-        # Check 3: Reverse check - bot message có trong current message
-        if (self.last_sent_message and len(message) > 30 and
-            self.last_sent_message in message and 
-            current_time - self.last_sent_time < 30):
-            return True
-            
-        return False
+        is_bot, _ = _get_message_classifier()(
+            message, self.last_user_message, self.last_user_message_time,
+            self.last_sent_message, self.last_sent_time, time.time())
+        return is_bot
 
     def is_duplicate_message(self, message):
         """Kiểm tra tin nhắn trùng lặp với multiple checks"""
-        current_time = time.time()
-        
         # Check 1: Message hash
-        msg_hash = self.create_message_hash(message)
-        if msg_hash in self.processed_messages:
+        if self.is_hash_processed(self.create_message_hash(message)):
             self.duplicate_detections += 1
             return True
-            
-        # Check 2: Same as last user message trong 60 giây
-        if (message == self.last_user_message and 
-            current_time - self.last_user_message_time < 60):
+        
+        # Check 2 + 3: trùng tin cuối trong 60 giây hoặc gần giống (typo) trong 30 giây
+        _, is_dup = _get_message_classifier()(
+            message, self.last_user_message, self.last_user_message_time,
+            self.last_sent_message, self.last_sent_time, time.time())
+        if is_dup:
             self.duplicate_detections += 1
-            return True
-            
-        # Check 3: Very similar message (typo protection)
-        if (self.last_user_message and len(message) > 5 and
-            abs(len(message) - len(self.last_user_message)) <= 2 and
-            current_time - self.last_user_message_time < 30):
-            # Simple similarity check
-            common_chars = sum(1 for a, b in zip(message.lower(), self.last_user_message.lower()) if a == b)
-            similarity = common_chars / max(len(message), len(self.last_user_message))
-            if similarity > 0.85:
-                self.duplicate_detections += 1
-                return True
-                
-        return False
+        return is_dup
+
+    def is_hash_processed(self, msg_hash):
+        """Hash đã có trong ring buffer và còn trong time window chưa"""
+        processed_at = self._hash_index.get(msg_hash)
+        return processed_at is not None and (time.time() - processed_at) < _MSG_DEDUP_SECONDS
+
+    def processed_hash_count(self):
+        """Số hash đang giữ trong ring buffer"""
+        return min(self._ring_i, _MSG_RING_SIZE)
 
     def mark_message_processed(self, message):
         """Đánh dấu tin nhắn đã xử lý"""
         current_time = time.time()
         
-        # Add hash to processed
+        # Ghi hash vào ring buffer - slot cũ nhất tự bị ghi đè, không cần dọn
+        slot = self._msg_ring[self._ring_i % _MSG_RING_SIZE]
+        if self._ring_i >= _MSG_RING_SIZE:
+            # Bỏ hash bị ghi đè khỏi index, trừ khi nó đã được ghi lại ở slot mới hơn
+            old_hash = int(slot['h'])
+            if self._hash_index.get(old_hash) == slot['t']:
+                del self._hash_index[old_hash]
         msg_hash = self.create_message_hash(message)
-        self.processed_messages.add(msg_hash)
+        slot['h'] = msg_hash
+        slot['t'] = current_time
+        self._hash_index[msg_hash] = current_time
+        self._ring_i += 1
         
         # Update last user message
         self.last_user_message = message
         self.last_user_message_time = current_time
-        
-        # Clean old hashes (keep only last 100)
-        if len(self.processed_messages) > 100:
-            # Convert to list, remove first 20, convert back
-            temp_list = list(self.processed_messages)
-            self.processed_messages = set(temp_list[-80:])
             
         self.total_messages_processed += 1
         print(f"[TRACKER] 📝 Đã xử lý {self.total_messages_processed} tin nhắn, {self.duplicate_detections} duplicate")
@@ -465,43 +777,30 @@ class Listener(LoginCreateSession):
     
     def init_first_message(self):
         print("[*] Đang khởi tạo để đọc tin nhắn...")
-        messages = None
         
         # Chờ chat interface load
         time.sleep(2)
         
         # Thử nhiều selector để tìm tin nhắn
-        message_selectors = [
-            "//div[@role='none']//div[contains(@class, 'x126k92a')]",
-            "//div[contains(@class, 'x1n2onr6')]//span",
-            "//div[@data-scope='messages']//div",
-            "//div[contains(@class, 'html-div')]",
-            "//div[@class='html-div xexx8yu x4uap5 x18d9i69 xkhd6sd x1gslohp x11i5rnm x12nagc x1mh8g0r x1yc453h x126k92a x18lvrbx']",
-            "//span[contains(@class, 'x1lliihq')]",
-            "//div[contains(text(), 'hi') or contains(text(), 'Hi') or contains(text(), 'hello')]"
-        ]
+        try:
+            found = find_first_selector(self.driver, _MESSAGE_SELECTORS, mode='last', timeout=5)
+        except Exception as e:
+            print(f"[!] Lỗi khi đọc tin nhắn: {str(e)[:50]}")
+            found = None
         
-        for i, selector in enumerate(message_selectors):
-            try:
-                print(f"[*] Thử đọc tin nhắn với selector {i+1}...")
-                messages = WebDriverWait(self.driver, 3).until(
-                    EC.presence_of_all_elements_located((By.XPATH, selector))
-                )
-                if messages and len(messages) > 0:
-                    initial_message = messages[-1].text
-                    self.hist_message_input = initial_message
-                    self.current_message_input = initial_message
-                    
-                    # Khởi tạo tracking cho tin nhắn đầu tiên
-                    if initial_message.strip():
-                        self.mark_message_processed(initial_message)
-                        print(f"[*] Đã khởi tạo tin nhắn: '{initial_message[:50]}...'")
-                    
-                    self.message_inited = True
-                    return
-            except:
-                print(f"[!] Selector {i+1} không hoạt động")
-                continue
+        if found:
+            i, _, initial_message = found
+            print(f"[*] Đọc tin nhắn với selector {i+1}")
+            self.hist_message_input = initial_message
+            self.current_message_input = initial_message
+            
+            # Khởi tạo tracking cho tin nhắn đầu tiên
+            if initial_message.strip():
+                self.mark_message_processed(initial_message)
+                print(f"[*] Đã khởi tạo tin nhắn: '{initial_message[:50]}...'")
+            
+            self.message_inited = True
+            return
         
         print('[!] Không thể khởi tạo đọc tin nhắn với tất cả selector!')
         # Khởi tạo rỗng để không bị lỗi
@@ -510,39 +809,56 @@ class Listener(LoginCreateSession):
         self.message_inited = True
 
 
+    def should_recycle_tab(self):
+        """Đến lúc thay tab mới chưa (sau N tin nhắn hoặc M phút, trừ khi đang backoff sau lần thất bại)"""
+        if time.time() < self.recycle_retry_at:
+            return False
+        max_messages = self.config_manager.get('app', 'chrome_options.recycle_after_messages', 500)
+        max_minutes = self.config_manager.get('app', 'chrome_options.recycle_after_minutes', 240)
+        return (self.total_messages_processed - self.recycled_at_count >= max_messages or
+                time.time() - self.recycled_at_time >= max_minutes * 60)
+
+    def recycle_tab(self):
+        """Đóng tab hiện tại, mở tab mới từ browser pool rồi vào lại chat"""
+        with self.driver_lock:
+            notify_info(f"♻️ Thay tab Chrome sau {self.total_messages_processed - self.recycled_at_count} tin nhắn", "recycle")
+            try:
+                get_browser_pool().release_tab(self.target_id)
+                self.target_id = None
+                self.driver = self.driver_init()
+                self.login()  # Khôi phục từ cookies đã lưu nếu còn hạn
+                self.go_to_chat()
+            except Exception as e:
+                self.recycle_failures += 1
+                delay = min(_RECYCLE_BACKOFF_BASE * 2 ** (self.recycle_failures - 1), _RECYCLE_BACKOFF_MAX)
+                self.recycle_retry_at = time.time() + delay
+                notify_error(f"Thay tab thất bại lần {self.recycle_failures}, thử lại sau {delay}s: {str(e)[:100]}", "recycle")
+                raise
+            self._input_el = None
+            self.recycled_at_count = self.total_messages_processed
+            self.recycled_at_time = time.time()
+            self.recycle_failures = 0
+
     def listener(self):
         self.init_first_message()
         print("[*] Bắt đầu lắng nghe tin nhắn...")
         
-        message_selectors = [
-            "//div[@role='none']//div[contains(@class, 'x126k92a')]",
-            "//div[contains(@class, 'x1n2onr6')]//span",
-            "//div[@data-scope='messages']//div",
-            "//div[contains(@class, 'html-div')]",
-            "//div[@class='html-div xexx8yu x4uap5 x18d9i69 xkhd6sd x1gslohp x11i5rnm x12nagc x1mh8g0r x1yc453h x126k92a x18lvrbx']",
-            "//span[contains(@class, 'x1lliihq')]",
-            "//div[contains(text(), 'hi') or contains(text(), 'Hi') or contains(text(), 'hello')]"
-        ]
-        
         retry_count = 0
         max_retries = 3
         
         while True:
             try:
-                messages = None
+                if self.should_recycle_tab():
+                    self.recycle_tab()
                 
-                # Thử từng selector cho đến khi tìm được
-                for i, selector in enumerate(message_selectors):
-                    try:
-                        messages = WebDriverWait(self.driver, 2).until(
-                            EC.presence_of_all_elements_located((By.XPATH, selector))
-                        )
-                        if messages and len(messages) > 0:
-                            break
-                    except:
-                        continue
+                # Observer trong trang giữ sẵn tin nhắn mới nhất - mỗi lần check chỉ là một lần đọc biến
+                state = read_message_watcher(self.driver)
+                if state is None:
+                    # Lần đầu hoặc trang vừa load lại - cài lại observer
+                    state = self.driver.execute_script(_INSTALL_MESSAGE_WATCHER_JS, _MESSAGE_SELECTORS)
+                    print("[*] Đã cài message observer")
                 
-                if not messages:
+                if state[0] is None:
                     print('[!] Không thể đọc tin nhắn, thử lại...')
                     time.sleep(3)
                     retry_count += 1
@@ -555,30 +871,24 @@ class Listener(LoginCreateSession):
                 # Reset retry count khi thành công
                 retry_count = 0
                 
-                # Kiểm tra tin nhắn mới với xử lý stale element
-                latest_message = ""
-                try:
-                    # Lấy text từ element cuối cùng
-                    if messages and len(messages) > 0:
-                        latest_element = messages[-1]
-                        latest_message = latest_element.text.strip() if latest_element.text else ""
-                except Exception as e:
-                    print(f"[DEBUG] Stale element hoặc lỗi đọc: {str(e)[:50]}")
-                    time.sleep(1)
-                    continue  # Bỏ qua và thử lại
+                # Text đọc ngay trong trang nên không có stale element
+                latest_message = state[0].strip()
                 
                 # LOGIC MỚI: Kiểm tra tin nhắn với comprehensive checks
                 if latest_message and latest_message != self.hist_message_input:
                     
+                    # Phân loại một lần: tin của bot hay duplicate?
+                    kind = self.classify_message(latest_message)
+                    
                     # Check 1: Có phải tin nhắn của bot không?
-                    if self.is_bot_message(latest_message):
+                    if kind == MSG_BOT:
                         print(f"[DEBUG] Bot message detected: '{latest_message[:30]}...'")
                         self.hist_message_input = latest_message  # Update để không check lại
                         time.sleep(1)
                         continue
                     
                     # Check 2: Có phải duplicate không?
-                    if self.is_duplicate_message(latest_message):
+                    if kind == MSG_DUP:
                         print(f"[DEBUG] Duplicate message: '{latest_message[:30]}...'")
                         self.hist_message_input = latest_message  # Update để không check lại
                         time.sleep(1)
@@ -625,60 +935,66 @@ class Listener(LoginCreateSession):
 
 class Sender(Listener):
     def __init__(self, username=None, password=None, target_username=None, user_temp_dir_path=None):
+        self._input_el = None  # Input box đã tìm được, dùng lại cho đến khi stale
         super().__init__(username, password, target_username, user_temp_dir_path)
     
 
-    def send_message(self, text=None):
-        text = text.replace("\n", " ")
-        
+    def locate_input_box(self):
+        """Tìm input box tin nhắn và cache lại"""
         # Thử nhiều selector để tìm input box
-        input_selectors = [
-            "//div[@contenteditable='true' and @aria-label='Message']",
-            "//div[@contenteditable='true']",
-            "//div[@role='textbox']",
-            "//textarea[@placeholder='Message...']",
-            "//div[contains(@aria-label, 'Message')]"
-        ]
-        
-        aria_input = None
-        for i, selector in enumerate(input_selectors):
-            try:
-                print(f"[*] Thử tìm input box với selector {i+1}...")
-                aria_input = WebDriverWait(self.driver, 3).until(
-                    EC.element_to_be_clickable((By.XPATH, selector))
-                )
+        self._input_el = None
+        try:
+            found = find_first_selector(self.driver, _INPUT_SELECTORS, mode='clickable', timeout=3)
+            if found:
+                i, self._input_el, _ = found
                 print(f"[*] Tìm thấy input box với selector {i+1}!")
-                break
-            except:
-                print(f"[!] Input selector {i+1} không hoạt động")
-                continue
+        except Exception as e:
+            print(f"[!] Lỗi khi tìm input box: {str(e)[:50]}")
+        return self._input_el
+
+    def send_message(self, text=None):
+        text = text.replace("\n", " ")
         
-        if aria_input:
-            try:
-                aria_input.clear()
-                aria_input.send_keys(text)
-                aria_input.send_keys(Keys.ENTER)
+        # Giữ driver_lock để listener không thay tab giữa chừng
+        with self.driver_lock:
+            # Dùng input box đã cache, chỉ tìm lại khi chưa có hoặc DOM đã render lại (stale)
+            for attempt in range(2):
+                aria_input = self._input_el or self.locate_input_box()
+                if not aria_input:
+                    print("[!] Không tìm thấy input box để gửi tin nhắn!")
+                    return
+            
+                try:
+                    aria_input.clear()
+                    aria_input.send_keys(text)
+                    aria_input.send_keys(Keys.ENTER)
                 
-                # Cập nhật tracking system cho tin nhắn bot
-                self.last_sent_message = text
-                self.last_sent_time = time.time()
+                    # Cập nhật tracking system cho tin nhắn bot
+                    self.last_sent_message = text
+                    self.last_sent_time = time.time()
                 
-                print(f"[*] Đã gửi tin nhắn: '{text}'")
-                print(f"[TRACKER] 🤖 Bot sent: '{text[:30]}...' at {int(self.last_sent_time)}")
+                    print(f"[*] Đã gửi tin nhắn: '{text}'")
+                    print(f"[TRACKER] 🤖 Bot sent: '{text[:30]}...' at {int(self.last_sent_time)}")
+                    return
                 
-            except Exception as e:
-                print(f"[!] Lỗi khi gửi tin nhắn: {str(e)}")
-        else:
-            print("[!] Không tìm thấy input box để gửi tin nhắn!")
+                except StaleElementReferenceException:
+                    print("[*] Input box đã stale, đang tìm lại...")
+                    self._input_el = None
+                except Exception as e:
+                    print(f"[!] Lỗi khi gửi tin nhắn: {str(e)}")
+                    return
 
 
 
 class InstaChat(Sender):
     def __init__(self, username=None, password=None, target_username=None, user_temp_dir_path=None, gemini_api_key=None):
+        # Gán trước super().__init__ vì listener thread bắt đầu chạy từ trong đó
+        self.pending_image_request = None
         super().__init__(username, password, target_username, user_temp_dir_path)
         
         # Khởi tạo các managers bổ sung
         self.performance_monitor = get_performance_monitor()
+        self.security_manager = get_security_manager()
         self.analytics_engine = get_analytics_engine()
         self.conversation_insights = get_conversation_insights(self.analytics_engine)
         
@@ -696,29 +1012,8 @@ class InstaChat(Sender):
         """Lấy phản hồi từ AI và xử lý image generation"""
         if self.ai_bot:
             try:
-                # Kiểm tra xem có phải image request không
-                if (self.ai_bot.image_generator and 
-                    self.ai_bot.image_generator.is_image_request(message)):
-                    
-                    print("[*] 🎨 Phát hiện yêu cầu tạo ảnh")
-                    
-                    # Gửi response ngay để user biết đang process
-                    initial_response = self.ai_bot.generate_response(message, self.target_username)
-                    
-                    # Trigger background image generation
-                    description = self.ai_bot.image_generator.extract_description(message)
-                    
-                    # Store image request để xử lý sau
-                    self.pending_image_request = {
-                        'description': description,
-                        'username': self.target_username,
-                        'timestamp': time.time()
-                    }
-                    
-                    return initial_response
-                else:
-                    # Xử lý tin nhắn thường
-                    return self.ai_bot.generate_response(message, self.target_username)
+                self.prepare_image_request(message)
+                return self.ai_bot.generate_response(message, self.target_username)
                     
             except Exception as e:
                 print(f"[!] ❌ Lỗi AI: {str(e)}")
@@ -726,52 +1021,82 @@ class InstaChat(Sender):
         else:
             return "ai chưa sẵn sàng"
 
-    def check_and_send_pending_image(self):
-        """Kiểm tra và gửi ảnh đang pending"""
-        if (hasattr(self, 'pending_image_request') and 
-            self.pending_image_request and 
-            not self.ai_bot.is_generating_image):
-            
+    async def aget_ai_response(self, message):
+        """Bản async của get_ai_response - chờ Gemini mà không chặn event loop"""
+        if self.ai_bot:
             try:
-                print("[*] 🎨 Đang xử lý image generation...")
-                
-                # Process image generation
-                result = self.ai_bot.process_image_generation(
-                    self.pending_image_request['description'],
-                    self.pending_image_request['username']
-                )
-                
-                if result['success']:
-                    print(f"[*] ✅ Image URL: {result['url']}")
-                    
-                    # Gửi URL thay vì upload file (đơn giản hơn)
-                    image_message = f"{result['response_text']}\n{result['url']}"
-                    self.send_message(image_message)
+                # Intent detection có thể gọi Gemini đồng bộ -> chạy trong thread
+                await asyncio.to_thread(self.prepare_image_request, message)
+                return await self.ai_bot.agenerate_response(message, self.target_username)
                     
-                else:
-                    print(f"[*] ❌ Image generation failed: {result.get('error', 'Unknown error')}")
-                    self.send_message(result['response_text'])
+            except Exception as e:
+                print(f"[!] ❌ Lỗi AI: {str(e)}")
+                return "uh sorry mình không hiểu"
+        else:
+            return "ai chưa sẵn sàng"
+
+    def prepare_image_request(self, message):
+        """Nếu là image request thì lưu pending_image_request để image worker xử lý sau"""
+        # Đang tạo ảnh cho user này -> generate_response chỉ báo chờ, không xếp thêm request
+        if self.ai_bot.is_image_request_active(self.target_username):
+            return
+        
+        # Kiểm tra xem có phải image request không
+        if (self.ai_bot.image_generator and 
+            self.ai_bot.image_generator.is_image_request(message)):
+            
+            print("[*] 🎨 Phát hiện yêu cầu tạo ảnh")
+            
+            # Trigger background image generation
+            description = self.ai_bot.image_generator.extract_description(message)
+            
+            # Store image request để xử lý sau
+            self.pending_image_request = {
+                'description': description,
+                'username': self.target_username,
+                'timestamp': time.time()
+            }
+
+    async def asend_generated_image(self, request):
+        """Tạo ảnh theo request (trên image executor của bot) và gửi kết quả"""
+        try:
+            print("[*] 🎨 Đang xử lý image generation...")
+            
+            # Process image generation
+            result = await self.ai_bot.aprocess_image_generation(
+                request['description'],
+                request['username']
+            )
+            
+            if result['success']:
+                print(f"[*] ✅ Image URL: {result['url']}")
                 
-                # Clear pending request
-                self.pending_image_request = None
+                # Gửi URL thay vì upload file (đơn giản hơn)
+                image_message = f"{result['response_text']}\n{result['url']}"
+                await asyncio.to_thread(self.send_message, image_message)
                 
-            except Exception as e:
-                print(f"[!] ❌ Lỗi khi xử lý image: {str(e)}")
-                self.send_message("sorry, tạo ảnh bị lỗi rồi :((")
-                self.pending_image_request = None
+            else:
+                print(f"[*] ❌ Image generation failed: {result.get('error', 'Unknown error')}")
+                await asyncio.to_thread(self.send_message, result['response_text'])
+            
+        except Exception as e:
+            print(f"[!] ❌ Lỗi khi xử lý image: {str(e)}")
+            await asyncio.to_thread(self.send_message, "sorry, tạo ảnh bị lỗi rồi :((")
     
     def cleanup(self):
         """Dọn dẹp trình duyệt và hiển thị memory stats"""
         try:
             notify_info("Đang dọn dẹp...", "cleanup")
             
-            # Hiển thị tracking statistics
-            notify_info("📊 Final Statistics:", "cleanup")
-            notify_info(f"  - Total messages processed: {self.total_messages_processed}", "cleanup")
-            notify_info(f"  - Duplicates blocked: {self.duplicate_detections}", "cleanup")
-            notify_info(f"  - Processed hashes: {len(self.processed_messages)}", "cleanup")
-            notify_info(f"  - Last user message: '{self.last_user_message[:30]}...' if self.last_user_message else 'None'", "cleanup")
-            notify_info(f"  - Last bot message: '{self.last_sent_message[:30]}...' if self.last_sent_message else 'None'", "cleanup")
+            # Hiển thị tracking statistics - gộp thành một notification
+            notify_info("\n".join([
+                "📊 Final Statistics:",
+                f"  - Total messages processed: {self.total_messages_processed}",
+                f"  - Duplicates blocked: {self.duplicate_detections}",
+                f"  - Processed hashes: {self.processed_hash_count()}",
+                f"  - Last user message: {_preview(self.last_user_message, 30)}",
+                f"  - Last bot message: {_preview(self.last_sent_message, 30)}",
+            ]), "cleanup")
             
             # Hiển thị comprehensive statistics
             if self.ai_bot:
@@ -786,47 +1111,135 @@ class InstaChat(Sender):
                 # Cleanup AI bot
                 cleanup_insta_bot(self.ai_bot)
             
+            # Ghi các thay đổi config còn đang chờ debounce
+            self.config_manager.flush_now()
+            flush_logs()
+            
             # Print summaries từ các systems
             self.performance_monitor.print_summary()
             self.error_handler.print_error_summary()
             self.security_manager.print_security_summary()
-            
-            # Đóng trình duyệt
-            if hasattr(self, 'driver'):
-                self.driver.quit()
-                notify_info("Đã đóng trình duyệt", "cleanup")
-                
-            # Cleanup temp directory
-            if hasattr(self, 'temp_profile_dir'):
-                try:
-                    shutil.rmtree(self.temp_profile_dir)
-                    notify_info("Đã dọn dẹp temp directory", "cleanup")
-                except:
-                    pass
                 
         except Exception as e:
             self.error_handler.log_error(e, "cleanup", ErrorSeverity.MEDIUM)
             notify_error(f"Lỗi khi dọn dẹp: {str(e)}", "cleanup")
+        finally:
+            # Luôn trả tab về browser pool (kể cả khi bước trên lỗi), tắt Chrome nếu không còn session nào dùng
+            browser_pool = get_browser_pool()
+            if self.target_id:
+                browser_pool.release_tab(self.target_id)
+                self.target_id = None
+            if browser_pool.active_tabs() == 0:
+                browser_pool.shutdown()
+                notify_info("Đã đóng trình duyệt và dọn dẹp temp directory", "cleanup")
     
     def debug_tracking_status(self):
         """Debug method to show current tracking status"""
-        print(f"\n[DEBUG] 🔍 Tracking Status:")
-        print(f"  - Messages processed: {self.total_messages_processed}")
-        print(f"  - Duplicates detected: {self.duplicate_detections}")
-        print(f"  - Hash cache size: {len(self.processed_messages)}")
-        print(f"  - Last user msg: '{self.last_user_message[:40]}...' if self.last_user_message else 'None'")
-        print(f"  - Last bot msg: '{self.last_sent_message[:40]}...' if self.last_sent_message else 'None'")
+        # Tắt ở production (level INFO) - khỏi format chuỗi
+        if not log.isEnabledFor(logging.DEBUG):
+            return
+        lines = [
+            f"\n[DEBUG] 🔍 Tracking Status:",
+            f"  - Messages processed: {self.total_messages_processed}",
+            f"  - Duplicates detected: {self.duplicate_detections}",
+            f"  - Hash cache size: {self.processed_hash_count()}",
+            f"  - Last user msg: {_preview(self.last_user_message, 40)}",
+            f"  - Last bot msg: {_preview(self.last_sent_message, 40)}",
+        ]
         current_time = time.time()
         if self.last_user_message_time > 0:
-            print(f"  - User msg age: {current_time - self.last_user_message_time:.1f}s")
+            lines.append(f"  - User msg age: {current_time - self.last_user_message_time:.1f}s")
         if self.last_sent_time > 0:
-            print(f"  - Bot msg age: {current_time - self.last_sent_time:.1f}s")
-        print(f"  - Current input: '{self.current_message_input[:40]}...' if self.current_message_input else 'None'")
-        print(f"  - Hist input: '{self.hist_message_input[:40]}...' if self.hist_message_input else 'None'")
-        print()  # Blank line for readability
+            lines.append(f"  - Bot msg age: {current_time - self.last_sent_time:.1f}s")
+        lines.append(f"  - Current input: {_preview(self.current_message_input, 40)}")
+        lines.append(f"  - Hist input: {_preview(self.hist_message_input, 40)}")
+        lines.append("")  # Blank line for readability
+        log.debug("\n".join(lines))
+
+
+
+
+# Backoff khi poll tin nhắn: 0.5s lúc đang chat, giãn dần tới 5s khi idle
+_POLL_DELAY_MIN = 0.5
+_POLL_DELAY_MAX = 5.0
+_POLL_BACKOFF = 1.5
+
+
+async def run_chat_loop(instagram, config_manager):
+    """Vòng lặp chính: nghe/trả lời tin nhắn và tạo ảnh chạy song song (Selenium/AI chạy trong thread)"""
+    image_queue = asyncio.Queue()
+    
+    # Đọc config timing một lần ngoài vòng lặp, watcher cập nhật lại khi config app thay đổi
+    timing = {}
+    def refresh_timing(app_config):
+        timing['message_delay'] = app_config.get('message_delay', 3)
+    refresh_timing(config_manager.get('app', default={}))
+    config_manager.watch('app', refresh_timing)
+    
+    image_tasks = set()
+    
+    async def image_worker():
+        # Mỗi request thành một task riêng - nhiều ảnh tạo song song, không chặn việc trả lời tin nhắn mới
+        while True:
+            request = await image_queue.get()
+            notify_info("🎨 Có pending image request, đang xử lý...", "main")
+            task = asyncio.create_task(instagram.asend_generated_image(request))
+            image_tasks.add(task)
+            task.add_done_callback(image_tasks.discard)
+            image_queue.task_done()
+    
+    async def message_loop():
+        poll_delay = _POLL_DELAY_MIN
+        
+        while True:
+            new_message = await asyncio.to_thread(instagram.listen_new_message)
+            if new_message is not None:
+                poll_delay = _POLL_DELAY_MIN  # Có hoạt động -> poll nhanh lại
+                notify_info(f"Tin nhắn mới từ {instagram.target_username}: '{new_message[:50]}...'", "main")
+                
+                # Sử dụng AI để tạo phản hồi
+                notify_info("🤖 Đang tạo phản hồi bằng AI...", "main")
+                ai_response = await instagram.aget_ai_response(new_message)
+                
+                notify_info(f"💬 Đang gửi: '{ai_response[:50]}...'", "main")
+                await asyncio.to_thread(instagram.send_message, ai_response)
+                
+                # Chuyển pending image request sang image worker
+                if instagram.pending_image_request and instagram.ai_bot:
+                    image_queue.put_nowait(instagram.pending_image_request)
+                    instagram.pending_image_request = None
+                
+                # Delay từ config
+                await asyncio.sleep(timing['message_delay'])
+                    
+            else:
+                # Không có tin nhắn mới -> giãn dần thời gian poll (exponential backoff)
+                await asyncio.sleep(poll_delay)
+                poll_delay = min(poll_delay * _POLL_BACKOFF, _POLL_DELAY_MAX)
+    
+    worker = asyncio.create_task(image_worker())
+    try:
+        await message_loop()
+    finally:
+        worker.cancel()
+        for task in image_tasks:
+            task.cancel()
+
 
+Credentials = namedtuple('Credentials', 'gemini_api_key username password target_username')
 
 
+def load_credentials(config_manager):
+    """Đọc API key và thông tin login (environment ưu tiên hơn config)"""
+    env = os.environ
+    app_config = config_manager.get('app') or {}
+    return Credentials(
+        gemini_api_key=env.get('GEMINI_API_KEY') or config_manager.get('ai', 'api_key'),
+        username=env.get('INSTAGRAM_USERNAME') or app_config.get('instagram_username'),
+        password=env.get('INSTAGRAM_PASSWORD') or app_config.get('instagram_password'),
+        target_username=env.get('TARGET_USERNAME') or app_config.get('target_username'),
+    )
+
 
 if __name__ == "__main__":
     instagram = None
@@ -836,33 +1249,18 @@ if __name__ == "__main__":
         # Khởi tạo config manager
         config_manager = get_config_manager()
         
-        # Lấy Gemini API key từ environment hoặc config
-        gemini_api_key = os.getenv('GEMINI_API_KEY') or config_manager.get('ai', 'api_key')
-        if not gemini_api_key:
+        # Đọc credentials một lần từ environment hoặc config
+        creds = load_credentials(config_manager)
+        if not creds.gemini_api_key:
             notify_error("⚠️ GEMINI_API_KEY không được tìm thấy!", "main")
             notify_info("💡 Hướng dẫn setup:", "main")
             notify_info("   1. Tạo file .env từ env_example", "main")
             notify_info("   2. Hoặc set environment: set GEMINI_API_KEY=your_key", "main")
             notify_info("   3. Hoặc cấu hình trong config_manager.py", "main")
             raise Exception("Missing GEMINI_API_KEY")
-            
-        if not gemini_api_key:
-            notify_warning("⚠️ Không tìm thấy GEMINI_API_KEY trong environment", "main")
-            notify_info("💡 Bạn có thể:", "main")
-            notify_info("   1. Set environment: set GEMINI_API_KEY=your_key", "main")
-            notify_info("   2. Hoặc bot sẽ chạy ở chế độ cơ bản", "main")
-        
-        # Lấy thông tin login từ environment hoặc config
-        app_config = config_manager.get('app', {})
-        username = (os.getenv('INSTAGRAM_USERNAME') or 
-                   app_config.get('instagram_username'))
-        password = (os.getenv('INSTAGRAM_PASSWORD') or 
-                   app_config.get('instagram_password'))
-        target_username = (os.getenv('TARGET_USERNAME') or 
-                          app_config.get('target_username'))
         
         # Kiểm tra thông tin bắt buộc
-        if not username or not password or not target_username:
+        if not creds.username or not creds.password or not creds.target_username:
             notify_error("⚠️ Thiếu thông tin đăng nhập Instagram!", "main")
             notify_info("💡 Hướng dẫn setup:", "main")
             notify_info("   1. Tạo file .env từ env_example", "main")
@@ -874,58 +1272,17 @@ if __name__ == "__main__":
             raise Exception("Missing Instagram credentials")
         
         instagram = InstaChat(
-            username=username,
-            password=password,
-            target_username=target_username,
+            username=creds.username,
+            password=creds.password,
+            target_username=creds.target_username,
             user_temp_dir_path="./chromium_temp_data_dir",
-            gemini_api_key=gemini_api_key
+            gemini_api_key=creds.gemini_api_key
         )
         
         notify_info("Khởi tạo thành công! Bắt đầu lắng nghe tin nhắn...", "main")
         notify_info("Nhấn Ctrl+C để dừng chương trình", "main")
         
-        consecutive_empty_count = 0  # Đếm số lần liên tiếp không có tin nhắn mới
-        
-        while True:
-            new_message = instagram.listen_new_message()
-            if new_message is not None:
-                consecutive_empty_count = 0  # Reset counter
-                notify_info(f"Tin nhắn mới từ {instagram.target_username}: '{new_message[:50]}...'", "main")
-                
-                # Sử dụng AI để tạo phản hồi
-                notify_info("🤖 Đang tạo phản hồi bằng AI...", "main")
-                ai_response = instagram.get_ai_response(new_message)
-                
-                notify_info(f"💬 Đang gửi: '{ai_response[:50]}...'", "main")
-                instagram.send_message(ai_response)
-                
-                # Delay từ config
-                message_delay = config_manager.get('app', 'message_delay', 3)
-                time.sleep(message_delay)
-                
-                # Kiểm tra và xử lý pending image request
-                if hasattr(instagram, 'pending_image_request') and instagram.pending_image_request:
-                    notify_info("🎨 Có pending image request, đang xử lý...", "main")
-                    time.sleep(2)  # Thêm delay trước khi process image
-                    instagram.check_and_send_pending_image()
-                    
-            else:
-                consecutive_empty_count += 1
-                
-                # Kiểm tra pending image request ngay cả khi không có tin nhắn mới
-                if (hasattr(instagram, 'pending_image_request') and 
-                    instagram.pending_image_request and 
-                    instagram.ai_bot and
-                    not instagram.ai_bot.is_generating_image):
-                    notify_info("🎨 Processing pending image trong idle time...", "main")
-                    instagram.check_and_send_pending_image()
-                
-                # Nếu không có tin nhắn mới trong thời gian dài, delay ít hơn
-                idle_threshold = config_manager.get('app', 'idle_threshold', 20)
-                if consecutive_empty_count > idle_threshold:
-                    time.sleep(5)  # Delay lớn hơn khi không có hoạt động
-                else:
-                    time.sleep(3)  # Delay bình thường
+        asyncio.run(run_chat_loop(instagram, config_manager))
             
     except KeyboardInterrupt:
         notify_info("\nNgười dùng dừng chương trình...", "main")
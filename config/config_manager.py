@@ -1,17 +1,183 @@
+import atexit
 import json
 import os
-import yaml
+import copy
+import functools
 from datetime import datetime
 from typing import Any, Dict, Optional
 import threading
+from utils.buffered_log import get_logger
+
+try:
+    import orjson
+except ImportError:
+    # orjson chưa cài, dùng json chuẩn (chậm hơn)
+    orjson = None
+
+
+def _dump_json_bytes(data):
+    """Serialize config thành JSON bytes có indent (ưu tiên orjson)"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8')
+
+
+def _load_json_bytes(raw):
+    """Parse JSON bytes (ưu tiên orjson)"""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+log = get_logger("config")
+
+
+@functools.lru_cache(maxsize=1024)
+def _split_key(key: str) -> tuple:
+    """Tách key dạng 'a.b.c' thành tuple - cache lại vì các key được đọc lặp đi lặp lại"""
+    return tuple(key.split('.'))
+
+
+# Config mặc định cho từng loại - dựng một lần lúc import
+_DEFAULT_CONFIGS = {
+    'app': {
+        'bot_name': 'InstaChatBot',
+        'version': '1.0.0',
+        'debug_mode': False,
+        'auto_restart': True,
+        'max_retries': 3,
+        'retry_delay': 5,
+        'session_timeout': 3600,
+        'chrome_options': {
+            'headless': True,
+            'no_sandbox': True,
+            'disable_dev_shm_usage': True,
+            'window_size': '1920,1080',
+            'recycle_after_messages': 500,
+            'recycle_after_minutes': 240
+        },
+        'instagram': {
+            'login_timeout': 30,
+            'message_timeout': 10,
+            'max_message_length': 1000,
+            'rate_limit_messages_per_minute': 30,
+            'cookie_max_age_days': 30
+        }
+    },
+    'ai': {
+        'model': 'gemini-2.0-flash',
+        'temperature': 0.7,
+        'max_tokens': 1024,
+        'top_p': 0.8,
+        'top_k': 70,
+        'response_timeout': 30,
+        'max_concurrent_requests': 8,
+        'max_context_length': 4000,
+        'prompt_token_budget': 2048,
+        'memory_settings': {
+            'short_context_limit': 10,
+            'long_memory_limit': 12,
+            'memory_write_threshold': 16
+        },
+        'image_generation': {
+            'enabled': True,
+            'max_requests_per_hour': 20,
+            'timeout': 60,
+            'fallback_on_error': True,
+            'max_workers': 2
+        },
+        'prompt_settings': {
+            'use_emoticons': True,
+            'max_response_length': 200,
+            'personality': 'friendly_gen_z',
+            'use_context_cache': True
+        }
+    },
+    'security': {
+        'rate_limiting': {
+            'enabled': True,
+            'messages_per_minute': 30,
+            'messages_per_hour': 200,
+            'ai_requests_per_minute': 10,
+            'image_requests_per_hour': 20
+        },
+        'spam_detection': {
+            'enabled': True,
+            'max_duplicate_messages': 3,
+            'max_similar_messages': 5,
+            'spam_threshold': 50,
+            'auto_block_threshold': 80
+        },
+        'content_filtering': {
+            'enabled': True,
+            'max_message_length': 1000,
+            'blocked_keywords': ['spam', 'scam', 'hack'],
+            'allow_links': False
+        },
+        'account_protection': {
+            'max_login_attempts': 3,
+            'cooldown_minutes': 30,
+            'session_encryption': True
+        }
+    },
+    'monitoring': {
+        'performance': {
+            'enabled': True,
+            'monitoring_interval': 5,
+            'cpu_threshold': 80,
+            'memory_threshold': 80,
+            'response_time_threshold': 10
+        },
+        'error_tracking': {
+            'enabled': True,
+            'max_errors_per_hour': 50,
+            'auto_restart_on_critical': True,
+            'error_retention_days': 7
+        },
+        'analytics': {
+            'enabled': True,
+            'data_retention_days': 30,
+            'real_time_insights': True,
+            'export_reports': True
+        },
+        'notifications': {
+            'enabled': True,
+            'channels': ['console', 'file'],
+            'min_level': 'info',
+            'rate_limit_per_minute': 60
+        }
+    },
+    'cache': {
+        'enabled': True,
+        'memory_cache_size': 1000,
+        'disk_cache_size_mb': 100,
+        'response_cache_ttl': 7200,
+        'image_cache_ttl': 86400,
+        'cleanup_interval': 3600
+    }
+}
 
 
 class ConfigManager:
-    def __init__(self, config_dir="config"):
+    def __init__(self, config_dir="config", flush_delay=0.5):
         self.config_dir = config_dir
         self.configs = {}
         self.watchers = {}
-        self.lock = threading.RLock()
+        self.lock = threading.Lock()  # Chỉ writer cần lock, không gọi lồng nhau (xem các hàm *_locked)
+        
+        # Copy-on-write: (configs, cache resolve) được thay cả cụm mỗi lần ghi, get() đọc không cần lock.
+        # Cache resolve: (config_name, key) -> (dict cha, key cuối), gắn với snapshot nên không cần xóa
+        self._state = (self.configs, {})
+        
+        # Debounce ghi file: set/update chỉ đánh dấu dirty, timer ghi gộp sau flush_delay giây
+        self.flush_delay = flush_delay
+        self._dirty = set()
+        self._flush_timer = None
+        # Timer là daemon nên không chờ khi thoát - ghi nốt thay đổi còn dirty lúc exit
+        atexit.register(self.flush_now)
+        
+        # config_name -> (file_path, mtime_ns) lần cuối load/save, để reload bỏ qua file không đổi
+        self._mtimes = {}
         
         # Tạo thư mục config
         os.makedirs(config_dir, exist_ok=True)
@@ -19,7 +185,7 @@ class ConfigManager:
         # Load all configs
         self.load_all_configs()
         
-        print("[CONFIG] ⚙️ Config Manager đã khởi tạo")
+        log.info("[CONFIG] ⚙️ Config Manager đã khởi tạo")
 
     def load_all_configs(self):
         """Load tất cả config files"""
@@ -31,219 +197,160 @@ class ConfigManager:
             'cache_config.json'
         ]
         
-        for config_file in config_files:
-            config_name = config_file.split('_')[0]  # app, ai, security, etc.
-            self.load_config(config_name, config_file)
+        # Giữ lock một lần cho cả lượt, watcher được gọi sau khi nhả lock
+        reloaded = []
+        with self.lock:
+            for config_file in config_files:
+                config_name = config_file.split('_')[0]  # app, ai, security, etc.
+                if self._load_config_locked(config_name, config_file):
+                    reloaded.append(config_name)
+        
+        for config_name in reloaded:
+            self.notify_watchers(config_name)
 
     def load_config(self, config_name: str, filename: str) -> Dict[str, Any]:
         """Load config từ file"""
         with self.lock:
-            file_path = os.path.join(self.config_dir, filename)
-            
+            reloaded = self._load_config_locked(config_name, filename)
+            config = self.configs[config_name]
+        
+        if reloaded:
+            self.notify_watchers(config_name)
+        return config
+
+    def _load_config_locked(self, config_name: str, filename: str) -> bool:
+        """Load config từ file (caller giữ self.lock) -> True nếu vừa đọc lại từ file"""
+        file_path = os.path.join(self.config_dir, filename)
+        
+        try:
             try:
-                if os.path.exists(file_path):
+                mtime = os.stat(file_path).st_mtime_ns
+            except FileNotFoundError:
+                mtime = None
+            
+            # File không đổi từ lần load/save trước -> bỏ qua parse
+            if mtime is not None and self._mtimes.get(config_name) == (file_path, mtime):
+                return False
+            
+            if mtime is not None:
+                if filename.endswith('.yaml') or filename.endswith('.yml'):
+                    import yaml  # Import lazy - chỉ config YAML mới cần PyYAML
                     with open(file_path, 'r', encoding='utf-8') as f:
-                        if filename.endswith('.yaml') or filename.endswith('.yml'):
-                            config_data = yaml.safe_load(f)
-                        else:
-                            config_data = json.load(f)
-                    
-                    self.configs[config_name] = config_data
-                    print(f"[CONFIG] 📂 Loaded {config_name} config from {filename}")
+                        config_data = yaml.safe_load(f)
                 else:
-                    # Tạo config mặc định
-                    default_config = self.get_default_config(config_name)
-                    self.configs[config_name] = default_config
-                    self.save_config(config_name, filename)
-                    print(f"[CONFIG] 📝 Created default {config_name} config")
+                    with open(file_path, 'rb') as f:
+                        config_data = _load_json_bytes(f.read())
                 
-                return self.configs[config_name]
-                
-            except Exception as e:
-                print(f"[CONFIG] ❌ Error loading {config_name}: {str(e)}")
-                # Fallback to default
-                self.configs[config_name] = self.get_default_config(config_name)
-                return self.configs[config_name]
+                self._commit_config(config_name, config_data)
+                self._mtimes[config_name] = (file_path, mtime)
+                log.info(f"[CONFIG] 📂 Loaded {config_name} config from {filename}")
+                return True
+            
+            # Tạo config mặc định
+            default_config = self.get_default_config(config_name)
+            self._commit_config(config_name, default_config)
+            self._save_config_locked(config_name, filename)
+            log.info(f"[CONFIG] 📝 Created default {config_name} config")
+            return False
+            
+        except Exception as e:
+            log.error(f"[CONFIG] ❌ Error loading {config_name}: {str(e)}")
+            # Fallback to default
+            self._commit_config(config_name, self.get_default_config(config_name))
+            return False
 
     def get_default_config(self, config_name: str) -> Dict[str, Any]:
         """Lấy default config cho từng loại"""
-        defaults = {
-            'app': {
-                'bot_name': 'InstaChatBot',
-                'version': '1.0.0',
-                'debug_mode': False,
-                'auto_restart': True,
-                'max_retries': 3,
-                'retry_delay': 5,
-                'session_timeout': 3600,
-                'chrome_options': {
-                    'headless': True,
-                    'no_sandbox': True,
-                    'disable_dev_shm_usage': True,
-                    'window_size': '1920,1080'
-                },
-                'instagram': {
-                    'login_timeout': 30,
-                    'message_timeout': 10,
-                    'max_message_length': 1000,
-                    'rate_limit_messages_per_minute': 30
-                }
-            },
-            'ai': {
-                'model': 'gemini-2.0-flash',
-                'temperature': 0.7,
-                'max_tokens': 1024,
-                'top_p': 0.8,
-                'top_k': 70,
-                'response_timeout': 30,
-                'max_context_length': 4000,
-                'memory_settings': {
-                    'short_context_limit': 10,
-                    'long_memory_limit': 12,
-                    'memory_write_threshold': 16
-                },
-                'image_generation': {
-                    'enabled': True,
-                    'max_requests_per_hour': 20,
-                    'timeout': 60,
-                    'fallback_on_error': True
-                },
-                'prompt_settings': {
-                    'use_emoticons': True,
-                    'max_response_length': 200,
-                    'personality': 'friendly_gen_z'
-                }
-            },
-            'security': {
-                'rate_limiting': {
-                    'enabled': True,
-                    'messages_per_minute': 30,
-                    'messages_per_hour': 200,
-                    'ai_requests_per_minute': 10,
-                    'image_requests_per_hour': 20
-                },
-                'spam_detection': {
-                    'enabled': True,
-                    'max_duplicate_messages': 3,
-                    'max_similar_messages': 5,
-                    'spam_threshold': 50,
-                    'auto_block_threshold': 80
-                },
-                'content_filtering': {
-                    'enabled': True,
-                    'max_message_length': 1000,
-                    'blocked_keywords': ['spam', 'scam', 'hack'],
-                    'allow_links': False
-                },
-                'account_protection': {
-                    'max_login_attempts': 3,
-                    'cooldown_minutes': 30,
-                    'session_encryption': True
-                }
-            },
-            'monitoring': {
-                'performance': {
-                    'enabled': True,
-                    'monitoring_interval': 5,
-                    'cpu_threshold': 80,
-                    'memory_threshold': 80,
-                    'response_time_threshold': 10
-                },
-                'error_tracking': {
-                    'enabled': True,
-                    'max_errors_per_hour': 50,
-                    'auto_restart_on_critical': True,
-                    'error_retention_days': 7
-                },
-                'analytics': {
-                    'enabled': True,
-                    'data_retention_days': 30,
-                    'real_time_insights': True,
-                    'export_reports': True
-                },
-                'notifications': {
-                    'enabled': True,
-                    'channels': ['console', 'file'],
-                    'min_level': 'info',
-                    'rate_limit_per_minute': 60
-                }
-            },
-            'cache': {
-                'enabled': True,
-                'memory_cache_size': 1000,
-                'disk_cache_size_mb': 100,
-                'response_cache_ttl': 7200,
-                'image_cache_ttl': 86400,
-                'cleanup_interval': 3600
-            }
-        }
-        
-        return defaults.get(config_name, {})
+        # deepcopy vì caller sẽ sửa trực tiếp config trả về
+        return copy.deepcopy(_DEFAULT_CONFIGS.get(config_name, {}))
 
     def save_config(self, config_name: str, filename: str = None):
         """Lưu config vào file"""
         with self.lock:
-            if config_name not in self.configs:
-                return False
-            
-            if not filename:
-                filename = f"{config_name}_config.json"
-            
-            file_path = os.path.join(self.config_dir, filename)
-            
-            try:
-                config_data = self.configs[config_name].copy()
-                config_data['_metadata'] = {
+            return self._save_config_locked(config_name, filename)
+
+    def _save_config_locked(self, config_name: str, filename: str = None):
+        """Lưu config vào file (caller giữ self.lock)"""
+        if config_name not in self.configs:
+            return False
+        
+        if not filename:
+            filename = f"{config_name}_config.json"
+        
+        file_path = os.path.join(self.config_dir, filename)
+        
+        try:
+            # Payload chỉ dùng để serialize - không copy cây config, không đụng vào self.configs
+            config_data = {
+                **self.configs[config_name],
+                '_metadata': {
                     'last_updated': datetime.now().isoformat(),
                     'version': '1.0.0'
                 }
-                
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    if filename.endswith('.yaml') or filename.endswith('.yml'):
-                        yaml.dump(config_data, f, default_flow_style=False, allow_unicode=True)
-                    else:
-                        json.dump(config_data, f, indent=2, ensure_ascii=False)
-                
-                print(f"[CONFIG] 💾 Saved {config_name} config to {filename}")
-                return True
-                
-            except Exception as e:
-                print(f"[CONFIG] ❌ Error saving {config_name}: {str(e)}")
-                return False
-
-    def get(self, config_name: str, key: str = None, default: Any = None) -> Any:
-        """Lấy giá trị config"""
-        with self.lock:
-            if config_name not in self.configs:
-                return default
-            
-            config = self.configs[config_name]
+            }
             
-            if key is None:
-                return config
+            if filename.endswith('.yaml') or filename.endswith('.yml'):
+                import yaml  # Import lazy - chỉ config YAML mới cần PyYAML
+                with open(file_path, 'w', encoding='utf-8') as f:
+                    yaml.dump(config_data, f, default_flow_style=False, allow_unicode=True)
+            else:
+                with open(file_path, 'wb') as f:
+                    f.write(_dump_json_bytes(config_data))
             
-            # Support nested keys với dot notation
-            keys = key.split('.')
-            value = config
+            # Ghi nhận mtime của chính mình để reload sau đó không parse lại
+            self._mtimes[config_name] = (file_path, os.stat(file_path).st_mtime_ns)
+            log.info("[CONFIG] 💾 Saved %s config to %s", config_name, filename)
+            return True
             
-            for k in keys:
-                if isinstance(value, dict) and k in value:
-                    value = value[k]
+        except Exception as e:
+            log.error(f"[CONFIG] ❌ Error saving {config_name}: {str(e)}")
+            return False
+
+    def _commit_config(self, config_name: str, config_data):
+        """Đăng snapshot mới với config_name thay bằng config_data (gọi khi đang giữ lock)"""
+        configs = dict(self.configs)
+        configs[config_name] = config_data
+        self.configs = configs
+        # Gán tuple một lần - reader thấy trọn snapshot cũ hoặc trọn snapshot mới
+        self._state = (configs, {})
+
+    def get(self, config_name: str, key: str = None, default: Any = None) -> Any:
+        """Lấy giá trị config (không lock - đọc trên snapshot hiện tại, không sửa trực tiếp giá trị trả về)"""
+        configs, resolved_cache = self._state
+        if config_name not in configs:
+            return default
+        
+        config = configs[config_name]
+        
+        if key is None:
+            return config
+        
+        # Support nested keys với dot notation - dùng lại vị trí đã resolve nếu có
+        resolved = resolved_cache.get((config_name, key))
+        if resolved is None:
+            keys = _split_key(key)
+            parent = config
+            for k in keys[:-1]:
+                if isinstance(parent, dict) and k in parent:
+                    parent = parent[k]
                 else:
                     return default
-            
-            return value
+            if not isinstance(parent, dict):
+                return default
+            resolved = (parent, keys[-1])
+            resolved_cache[(config_name, key)] = resolved
+        
+        parent, last_key = resolved
+        return parent.get(last_key, default)
 
     def set(self, config_name: str, key: str, value: Any, save: bool = True):
         """Set giá trị config"""
         with self.lock:
-            if config_name not in self.configs:
-                self.configs[config_name] = {}
-            
-            config = self.configs[config_name]
+            # Sửa trên bản copy rồi mới đăng snapshot mới
+            config = copy.deepcopy(self.configs.get(config_name, {}))
             
             # Support nested keys với dot notation
-            keys = key.split('.')
+            keys = _split_key(key)
             current = config
             
             for k in keys[:-1]:
@@ -252,17 +359,20 @@ class ConfigManager:
                 current = current[k]
             
             current[keys[-1]] = value
+            self._commit_config(config_name, config)
             
             if save:
-                self.save_config(config_name)
+                self._mark_dirty_locked(config_name)
             
-            print(f"[CONFIG] ✏️ Updated {config_name}.{key} = {value}")
+            log.info("[CONFIG] ✏️ Updated %s.%s = %s", config_name, key, value)
+        
+        self.notify_watchers(config_name)
 
     def update(self, config_name: str, updates: Dict[str, Any], save: bool = True):
         """Update multiple config values"""
         with self.lock:
-            if config_name not in self.configs:
-                self.configs[config_name] = {}
+            # Sửa trên bản copy rồi mới đăng snapshot mới
+            config = copy.deepcopy(self.configs.get(config_name, {}))
             
             def deep_update(base_dict, update_dict):
                 for key, value in update_dict.items():
@@ -271,12 +381,57 @@ class ConfigManager:
                     else:
                         base_dict[key] = value
             
-            deep_update(self.configs[config_name], updates)
+            deep_update(config, updates)
+            self._commit_config(config_name, config)
             
             if save:
-                self.save_config(config_name)
+                self._mark_dirty_locked(config_name)
+            
+            log.info("[CONFIG] 🔄 Updated %s with %d changes", config_name, len(updates))
+        
+        self.notify_watchers(config_name)
+
+    def mark_dirty(self, config_name: str):
+        """Đánh dấu config cần ghi, gộp nhiều lần set/update thành một lần ghi file"""
+        with self.lock:
+            self._mark_dirty_locked(config_name)
+
+    def _mark_dirty_locked(self, config_name: str):
+        """mark_dirty khi caller đã giữ self.lock"""
+        self._dirty.add(config_name)
+        if self._flush_timer is None:
+            self._flush_timer = threading.Timer(self.flush_delay, self.flush_now)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def flush_now(self):
+        """Ghi ngay các config đang dirty xuống file"""
+        with self.lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
             
-            print(f"[CONFIG] 🔄 Updated {config_name} with {len(updates)} changes")
+            dirty = list(self._dirty)
+            self._dirty.clear()
+            for config_name in dirty:
+                self._save_config_locked(config_name)
+
+    def watch(self, config_name: str, callback):
+        """Đăng ký callback(config) chạy mỗi khi config thay đổi (set/update/reload)"""
+        with self.lock:
+            self.watchers.setdefault(config_name, []).append(callback)
+
+    def notify_watchers(self, config_name: str):
+        """Gọi các callback đã đăng ký cho config"""
+        with self.lock:
+            callbacks = list(self.watchers.get(config_name, []))
+            config = self.configs.get(config_name, {})
+        
+        for callback in callbacks:
+            try:
+                callback(config)
+            except Exception as e:
+                log.error(f"[CONFIG] ❌ Watcher error ({config_name}): {str(e)}")
 
     def reload_config(self, config_name: str):
         """Reload config từ file"""
@@ -285,7 +440,7 @@ class ConfigManager:
 
     def reload_all_configs(self):
         """Reload tất cả configs"""
-        print("[CONFIG] 🔄 Reloading all configs...")
+        log.info("[CONFIG] 🔄 Reloading all configs...")
         self.load_all_configs()
 
     def validate_config(self, config_name: str) -> tuple[bool, list]:
@@ -347,14 +502,14 @@ class ConfigManager:
                 'configs': self.configs
             }
             
-            with open(export_path, 'w', encoding='utf-8') as f:
-                json.dump(export_data, f, indent=2, ensure_ascii=False)
+            with open(export_path, 'wb') as f:
+                f.write(_dump_json_bytes(export_data))
             
-            print(f"[CONFIG] 📦 Exported all configs to {filename}")
+            log.info(f"[CONFIG] 📦 Exported all configs to {filename}")
             return True
             
         except Exception as e:
-            print(f"[CONFIG] ❌ Export error: {str(e)}")
+            log.error(f"[CONFIG] ❌ Export error: {str(e)}")
             return False
 
     def import_configs(self, filename: str):
@@ -362,28 +517,30 @@ class ConfigManager:
         import_path = os.path.join(self.config_dir, filename)
         
         if not os.path.exists(import_path):
-            print(f"[CONFIG] ❌ Import file not found: {filename}")
+            log.error(f"[CONFIG] ❌ Import file not found: {filename}")
             return False
         
         try:
-            with open(import_path, 'r', encoding='utf-8') as f:
-                import_data = json.load(f)
+            with open(import_path, 'rb') as f:
+                import_data = _load_json_bytes(f.read())
             
             if 'configs' in import_data:
-                self.configs.update(import_data['configs'])
+                with self.lock:
+                    for config_name, config_data in import_data['configs'].items():
+                        self._commit_config(config_name, config_data)
                 
                 # Save all imported configs
                 for config_name in import_data['configs'].keys():
                     self.save_config(config_name)
                 
-                print(f"[CONFIG] 📥 Imported {len(import_data['configs'])} configs")
+                log.info(f"[CONFIG] 📥 Imported {len(import_data['configs'])} configs")
                 return True
             else:
-                print(f"[CONFIG] ❌ Invalid import file format")
+                log.error(f"[CONFIG] ❌ Invalid import file format")
                 return False
                 
         except Exception as e:
-            print(f"[CONFIG] ❌ Import error: {str(e)}")
+            log.error(f"[CONFIG] ❌ Import error: {str(e)}")
             return False
 
     def print_config_summary(self):
@@ -408,15 +565,11 @@ class ConfigManager:
         print(f"[CONFIG] ================================\n")
 
 
-# Singleton instance
-_config_manager = None
-
+# Singleton instance - functools.cache giữ instance, không cần global + check None
+@functools.cache
 def get_config_manager():
     """Lấy instance singleton của ConfigManager"""
-    global _config_manager
-    if _config_manager is None:
-        _config_manager = ConfigManager()
-    return _config_manager
+    return ConfigManager()
 
 
 # Convenience functions
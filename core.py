@@ -1,8 +1,15 @@
 import google.generativeai as genai
 import os
 import time
+import asyncio
+import re
+import random
 import json
-from datetime import datetime
+import queue
+import threading
+from datetime import timedelta
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
 from llm_memories_manager import ActivateLocalMemories, ShortContextManager, WriteNewLocalMemories
 from image_generator import ImageGenerator
 
@@ -16,6 +23,71 @@ from utils.notification_system import get_notification_system, notify_info, noti
 from config.config_manager import get_config_manager
 
 
+# RNG riêng của bot, không dùng chung RNG global của module random
+_RNG = random.Random()
+
+_FALLBACK_RESPONSES = (
+    "uh lag quá",
+    "mình không hiểu", 
+    "hả",
+    "ờ",
+    "sao zạ",
+    "sorry mình lag"
+)
+
+# Câu trả lời ngay khi nhận yêu cầu tạo ảnh - {username} được format lúc chọn
+_PROCESSING_TEMPLATES = (
+    "okee {username}, đang tạo ảnh cho bạn nè :))",
+    "roger {username}, tui đang vẽ ảnh :vv",
+    "đang process ảnh cho {username}, chờ tí nha :))",
+    "okk đang tạo ảnh ngay {username} :D"
+)
+
+# Memory flusher: ghi tối đa 16 cặp tin nhắn mỗi lượt, hoặc sau 0.5 giây
+_MEMORY_FLUSH_BATCH = 16
+_MEMORY_FLUSH_INTERVAL = 0.5
+
+# Yêu cầu tạo ảnh quá số giây này mà chưa xong thì coi như treo, cho user yêu cầu lại
+_IMAGE_REQUEST_TIMEOUT = 30
+
+# TTL (giây) của Gemini context cache chứa system prompt
+_PROMPT_CACHE_TTL = 3600
+
+# Ước lượng token (~4 ký tự / token) để giữ prompt trong budget, không cần tokenizer
+_PROMPT_OVERHEAD_TOKENS = 128
+
+
+def _estimate_tokens(text):
+    return len(text) >> 2
+
+
+# Regex loại emoji/ký tự đặc biệt - compile một lần
+_SPECIAL_CHARS_RE = re.compile(r'[^\w\s\.\!\?\,\-\'\"]')
+
+
+class _KeepAsciiAndLettersTable(dict):
+    """Bảng cho str.translate: giữ ký tự ASCII (< 127) và chữ cái, xóa phần còn lại"""
+    def __missing__(self, code):
+        # Tính một lần cho mỗi ký tự mới gặp, các lần sau tra dict ở tốc độ C
+        value = code if code < 127 or chr(code).isalpha() else None
+        self[code] = value
+        return value
+
+
+_KEEP_ASCII_AND_LETTERS = _KeepAsciiAndLettersTable()
+
+
+@dataclass(slots=True)
+class BotStats:
+    """Thống kê của InstaBot - thời gian tính bằng time.monotonic()"""
+    total_messages: int = 0
+    start_time: float = field(default_factory=time.monotonic)
+    last_message_time: float = 0.0
+    memories_activated: int = 0
+    memories_written: int = 0
+    images_generated: int = 0
+
+
 class InstaBot:
     def __init__(self, api_key=None):
         """
@@ -54,9 +126,19 @@ class InstaBot:
                 raise ValueError("Cần GEMINI_API_KEY trong environment hoặc truyền api_key parameter")
             genai.configure(api_key=api_key)
         
-        # Khởi tạo model với config
-        model_name = self.config_manager.get('ai', 'model', 'gemini-2.5-flash-lite-preview-06-17')
-        self.model = genai.GenerativeModel(model_name)
+        # System prompt và generation config dựng sẵn - watcher cập nhật khi config 'ai' đổi
+        self.system_prompt = self.get_system_prompt()
+        
+        # Khởi tạo model với config - system prompt nằm trong context cache, không gửi lại mỗi request
+        self.model_name = self.config_manager.get('ai', 'model', 'gemini-2.5-flash-lite-preview-06-17')
+        self.prompt_cache = None
+        self.prompt_cache_expires_at = 0
+        self.model = self.create_model()
+        self.refresh_ai_settings(self.config_manager.get('ai', default={}))
+        self.config_manager.watch('ai', self.refresh_ai_settings)
+        
+        # Giới hạn số request Gemini chạy song song ở async path (tránh vượt QPM)
+        self.llm_semaphore = asyncio.Semaphore(self.config_manager.get('ai', 'max_concurrent_requests', 8))
         
         # Khởi tạo Image Generator
         try:
@@ -83,25 +165,27 @@ class InstaBot:
         )
         
         # Thống kê
-        self.stats = {
-            'total_messages': 0,
-            'start_time': datetime.now(),
-            'last_message_time': None,
-            'memories_activated': 0,
-            'memories_written': 0,
-            'images_generated': 0
-        }
+        self.stats = BotStats()
+        
+        # Ghi memory xuống disk theo batch ở thread nền
+        self.memory_write_queue = queue.Queue()
+        self.memory_flusher_thread = threading.Thread(target=self.memory_flusher, name="memory_flusher", daemon=True)
+        self.memory_flusher_thread.start()
+        self._memory_files_count = None  # (mtime thư mục memories, số file .txt)
         
         # Image processing state
-        self.is_generating_image = False
-        self.last_image_request_time = 0
+        # Gate theo từng user: username -> thời điểm nhận yêu cầu tạo ảnh đang xử lý
+        self.image_requests_at = {}
+        self.image_requests_lock = threading.Lock()  # image executor và event loop cùng sửa image_requests_at
+        image_workers = self.config_manager.get('ai', 'image_generation.max_workers', 2)
+        self.image_executor = ThreadPoolExecutor(max_workers=image_workers, thread_name_prefix="image_gen")
         
         print("[CORE] ✅ InstaBot với Memory System và ImageGenerator đã khởi tạo thành công")
 
-    def safe_write_memory(self, user_message, ai_response):
+    def safe_write_memory(self, user_message, ai_response, backup=True):
         """Safe wrapper cho memory writer để tránh list index out of range"""
         try:
-            self.memory_writer.write_newLocalMem(user_message, ai_response)
+            self.memory_writer.write_newLocalMem(user_message, ai_response, backup=backup)
             return True
         except IndexError as e:
             print(f"[MEMORY] ⚠️ Index error trong memory writer: {str(e)}")
@@ -117,6 +201,101 @@ class InstaBot:
             print(f"[MEMORY] ⚠️ Lỗi khác trong memory writer: {str(e)}")
             return False
 
+    def queue_memory_write(self, user_message, ai_response):
+        """Đưa cặp tin nhắn vào hàng đợi, memory flusher sẽ ghi xuống disk theo batch"""
+        self.memory_write_queue.put((user_message, ai_response))
+
+    def memory_flusher(self):
+        """Thread nền: gom tối đa _MEMORY_FLUSH_BATCH lần ghi hoặc chờ _MEMORY_FLUSH_INTERVAL giây rồi ghi một lượt"""
+        while True:
+            item = self.memory_write_queue.get()
+            batch = [] if item is None else [item]
+            deadline = time.monotonic() + _MEMORY_FLUSH_INTERVAL
+            
+            while item is not None and len(batch) < _MEMORY_FLUSH_BATCH:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self.memory_write_queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is not None:
+                    batch.append(item)
+            
+            if batch:
+                self.write_memory_batch(batch)
+            if item is None:  # Tín hiệu dừng từ flush_memory_writes
+                return
+
+    def write_memory_batch(self, batch):
+        """Ghi một batch vào long term memory, sao lưu context một lần cho cả batch"""
+        written = 0
+        for user_message, ai_response in batch:
+            if self.safe_write_memory(user_message, ai_response, backup=False):
+                written += 1
+        self.stats.memories_written += written
+        
+        try:
+            self.memory_writer.backup_contxt_writer()
+            self.short_context.backup_short_context_writer()
+        except Exception as e:
+            print(f"[MEMORY] ⚠️ Lỗi khi sao lưu context: {str(e)}")
+        
+        if written == len(batch):
+            print(f"[MEMORY] 💾 Đã lưu {written} tin nhắn vào memory systems")
+        else:
+            print(f"[MEMORY] ⚠️ Lưu memory thất bại {len(batch) - written}/{len(batch)} nhưng bot vẫn hoạt động")
+
+    def flush_memory_writes(self):
+        """Ghi hết hàng đợi memory và dừng memory flusher (gọi khi tắt bot)"""
+        if self.memory_flusher_thread.is_alive():
+            self.memory_write_queue.put(None)
+            self.memory_flusher_thread.join(timeout=10)
+
+    def create_model(self):
+        """
+        Tạo GenerativeModel với system prompt trong Gemini context cache
+        Không tạo được cache (prompt quá ngắn, model không hỗ trợ...) thì dùng system_instruction
+        """
+        if self.config_manager.get('ai', 'prompt_settings.use_context_cache', True):
+            try:
+                # Import lúc dùng: google-generativeai bản cũ chưa có module caching
+                from google.generativeai import caching
+                self.prompt_cache = caching.CachedContent.create(
+                    model=self.model_name,
+                    system_instruction=self.system_prompt,
+                    ttl=timedelta(seconds=_PROMPT_CACHE_TTL),
+                )
+                self.prompt_cache_expires_at = time.time() + _PROMPT_CACHE_TTL
+                print("[CORE] ✅ Đã cache system prompt trên Gemini")
+                return genai.GenerativeModel.from_cached_content(cached_content=self.prompt_cache)
+            except Exception as e:
+                print(f"[CORE] ⚠️ Không tạo được context cache, dùng system_instruction: {str(e)}")
+                self.prompt_cache = None
+        
+        return genai.GenerativeModel(self.model_name, system_instruction=self.system_prompt)
+
+    def prompt_cache_expiring(self):
+        """Context cache còn dưới 60 giây là hết hạn"""
+        return self.prompt_cache is not None and time.time() > self.prompt_cache_expires_at - 60
+
+    def refresh_prompt_cache(self):
+        """Tạo lại model khi context cache sắp hết hạn (gọi mạng, chặn thread hiện tại)"""
+        if self.prompt_cache_expiring():
+            self.model = self.create_model()
+
+    def delete_prompt_cache(self):
+        """Xóa context cache trên Gemini để không bị tính phí lưu trữ đến khi hết TTL"""
+        if self.prompt_cache is None:
+            return
+        try:
+            self.prompt_cache.delete()
+            print("[CORE] 🗑️ Đã xóa context cache của system prompt")
+        except Exception as e:
+            print(f"[CORE] ⚠️ Không xóa được context cache: {str(e)}")
+        self.prompt_cache = None
+
     def get_system_prompt(self):
         """
         prompt để bot có thể phản hồi theo ý của bạn 
@@ -130,63 +309,105 @@ class InstaBot:
         Tạo phản hồi với Memory System, Context Analysis và Image Generation
         """
         try:
-            # SECURITY: Validate message trước khi xử lý
-            is_valid, error_msg = self.security_manager.validate_message(user_message, username)
-            if not is_valid:
-                notify_warning(f"Message rejected: {error_msg}", "security")
-                return "tin nhắn không hợp lệ, vui lòng thử lại"
-            
-            # CACHE: Kiểm tra cached response
-            cached_response = self.response_cache.get_cached_response(user_message, username)
-            if cached_response:
-                notify_info("Sử dụng cached response", "cache")
-                return cached_response
-            
-            # Cập nhật stats
-            self.stats['total_messages'] += 1
-            self.stats['last_message_time'] = datetime.now()
-            
-            # PRIORITY 1: Kiểm tra xem có đang tạo ảnh không
             current_time = time.time()
-            if self.is_generating_image:
-                if current_time - self.last_image_request_time < 30:  # 30 giây timeout
-                    return "đang tạo ảnh nè, chờ tí :vv"
-                else:
-                    # Reset state nếu quá lâu
-                    self.is_generating_image = False
-                    notify_warning("Reset image generation state due to timeout", "image_generation")
-            
-            # PRIORITY 2: Kiểm tra có phải image request không
-            if self.image_generator and self.image_generator.is_image_request(user_message):
-                return self.handle_image_request(user_message, username)
+            early_response = self.precheck_message(user_message, username)
+            if early_response is not None:
+                return early_response
             
             # PRIORITY 3: Xử lý tin nhắn thường với memory system
             response = self.handle_normal_message(user_message, username)
+            self.record_response(user_message, response, username, current_time)
+            return response
             
-            # CACHE: Lưu response vào cache
-            self.response_cache.cache_response(user_message, response, username)
-            
-            # ANALYTICS: Ghi lại conversation
-            response_time = time.time() - current_time
-            self.analytics_engine.record_conversation(user_message, response, username, response_time)
+        except Exception as e:
+            return self.fallback_response(e, user_message)
+
+    @measure_response_time
+    @log_errors(severity=ErrorSeverity.HIGH, context="generate_response")
+    async def agenerate_response(self, user_message, username="user"):
+        """
+        Bản async của generate_response - nhiều tin nhắn có thể chờ Gemini song song
+        """
+        try:
+            current_time = time.time()
+            # Precheck có thể gọi Gemini đồng bộ (AI intent detection) -> chạy trong thread
+            early_response = await asyncio.to_thread(self.precheck_message, user_message, username)
+            if early_response is not None:
+                return early_response
             
+            response = await self.ahandle_normal_message(user_message, username)
+            self.record_response(user_message, response, username, current_time)
             return response
             
         except Exception as e:
-            self.error_handler.log_error(e, "generate_response", ErrorSeverity.HIGH, user_message)
-            notify_error(f"Lỗi khi tạo phản hồi: {str(e)}", "generate_response")
-            
-            # Fallback phù hợp với context
-            fallback_responses = [
-                "uh lag quá",
-                "mình không hiểu", 
-                "hả",
-                "ờ",
-                "sao zạ",
-                "sorry mình lag"
-            ]
-            import random
-            return random.choice(fallback_responses)
+            return self.fallback_response(e, user_message)
+
+    async def abatch_generate_responses(self, messages):
+        """
+        Tạo phản hồi cho nhiều (user_message, username) cùng lúc - các request Gemini chạy song song
+        Trả về list phản hồi theo đúng thứ tự đầu vào
+        """
+        # Mỗi agenerate_response tự qua llm_semaphore nên batch lớn vẫn không vượt giới hạn
+        return await asyncio.gather(
+            *(self.agenerate_response(user_message, username) for user_message, username in messages)
+        )
+
+    def precheck_message(self, user_message, username="user"):
+        """
+        Các bước trước khi gọi Gemini -> phản hồi trả ngay, hoặc None nếu cần xử lý như tin nhắn thường
+        """
+        # SECURITY: Validate message trước khi xử lý
+        is_valid, error_msg = self.security_manager.validate_message(user_message, username)
+        if not is_valid:
+            notify_warning(f"Message rejected: {error_msg}", "security")
+            return "tin nhắn không hợp lệ, vui lòng thử lại"
+        
+        # CACHE: Kiểm tra cached response
+        cached_response = self.response_cache.get_cached_response(user_message, username)
+        if cached_response:
+            notify_info("Sử dụng cached response", "cache")
+            return cached_response
+        
+        # Cập nhật stats
+        self.stats.total_messages += 1
+        self.stats.last_message_time = time.monotonic()
+        
+        # PRIORITY 1: Kiểm tra xem có đang tạo ảnh không
+        current_time = time.time()
+        with self.image_requests_lock:
+            requested_at = self.image_requests_at.get(username)
+            timed_out = requested_at is not None and current_time - requested_at >= _IMAGE_REQUEST_TIMEOUT
+            if timed_out:
+                # Reset state nếu quá lâu
+                self.image_requests_at.pop(username, None)
+        if requested_at is not None:
+            if not timed_out:
+                return "đang tạo ảnh nè, chờ tí :vv"
+            else:
+                notify_warning("Reset image generation state due to timeout", "image_generation")
+        
+        # PRIORITY 2: Kiểm tra có phải image request không
+        if self.image_generator and self.image_generator.is_image_request(user_message):
+            return self.handle_image_request(user_message, username)
+        
+        return None
+
+    def record_response(self, user_message, response, username, start_time):
+        """Cache response và ghi analytics sau khi Gemini trả lời"""
+        # CACHE: Lưu response vào cache
+        self.response_cache.cache_response(user_message, response, username)
+        
+        # ANALYTICS: Ghi lại conversation
+        response_time = time.time() - start_time
+        self.analytics_engine.record_conversation(user_message, response, username, response_time)
+
+    def fallback_response(self, error, user_message):
+        """Log lỗi và trả câu fallback"""
+        self.error_handler.log_error(error, "generate_response", ErrorSeverity.HIGH, user_message)
+        notify_error(f"Lỗi khi tạo phản hồi: {str(error)}", "generate_response")
+        
+        # Fallback phù hợp với context
+        return _RNG.choice(_FALLBACK_RESPONSES)
 
     def handle_image_request(self, user_message, username="user"):
         """
@@ -196,50 +417,73 @@ class InstaBot:
             print(f"[CORE] 🎨 Phát hiện yêu cầu tạo ảnh từ {username}")
             
             # Set image generation state
-            self.is_generating_image = True
-            self.last_image_request_time = time.time()
+            with self.image_requests_lock:
+                self.image_requests_at[username] = time.time()
             
             # Extract description
             description = self.image_generator.extract_description(user_message)
             
             # Tạo response ngay để user biết đang process
-            processing_responses = [
-                f"okee {username}, đang tạo ảnh cho bạn nè :))",
-                f"roger {username}, tui đang vẽ ảnh :vv",
-                f"đang process ảnh cho {username}, chờ tí nha :))",
-                f"okk đang tạo ảnh ngay {username} :D"
-            ]
-            import random
-            initial_response = random.choice(processing_responses)
+            initial_response = _RNG.choice(_PROCESSING_TEMPLATES).format(username=username)
             
             # Lưu vào memory (chỉ initial response)
             try:
-                self.short_context.save_to_shortContextMem(user_message, initial_response)
-                if self.safe_write_memory(user_message, initial_response):
-                    self.stats['memories_written'] += 1
+                self.short_context.save_to_shortContextMem(user_message, initial_response, backup=False)
+                self.queue_memory_write(user_message, initial_response)
             except Exception as e:
                 print(f"[MEMORY] ⚠️ Lỗi khi lưu memory cho image request: {str(e)}")
             
             # Stats
-            self.stats['images_generated'] += 1
+            self.stats.images_generated += 1
             
             return initial_response
             
         except Exception as e:
             print(f"[CORE] ❌ Lỗi khi xử lý image request: {str(e)}")
-            self.is_generating_image = False
+            self.clear_image_request(username)
             return f"sorry {username}, có lỗi khi tạo ảnh :(("
 
     def handle_normal_message(self, user_message, username="user"):
         """
         Xử lý tin nhắn thường với memory system
         """
+        full_prompt = self.build_prompt(user_message)
+        self.refresh_prompt_cache()
+        
+        # 5. Gọi Gemini AI với config từ config manager
+        response = self.model.generate_content(
+            full_prompt,
+            generation_config=self.generation_config
+        )
+        return self.finalize_response(user_message, response.text)
+
+    async def ahandle_normal_message(self, user_message, username="user"):
+        """
+        Bản async của handle_normal_message - không chặn event loop khi chờ Gemini
+        """
+        full_prompt = self.build_prompt(user_message)
+        if self.prompt_cache_expiring():
+            # Tạo cache là request mạng đồng bộ - chạy ở thread để không chặn event loop
+            await asyncio.to_thread(self.refresh_prompt_cache)
+        
+        # 5. Gọi Gemini AI (async) - semaphore giới hạn số request đang chạy
+        async with self.llm_semaphore:
+            response = await self.model.generate_content_async(
+                full_prompt,
+                generation_config=self.generation_config
+            )
+        return self.finalize_response(user_message, response.text)
+
+    def build_prompt(self, user_message):
+        """
+        Ghép system prompt, ký ức và ngữ cảnh gần đây thành prompt cho Gemini
+        """
         # 1. Kích hoạt Local Memories dựa trên similarity - với error handling
         long_term_memories = None
         try:
             long_term_memories = self.local_memories.activate_localMemories(user_message)
             if long_term_memories and len(long_term_memories) > 0:
-                self.stats['memories_activated'] += 1
+                self.stats.memories_activated += 1
                 print(f"[MEMORY] 🧠 Kích hoạt {len(long_term_memories)} ký ức liên quan")
         except Exception as e:
             print(f"[MEMORY] ⚠️ Lỗi khi load ký ức: {str(e)}")
@@ -249,54 +493,70 @@ class InstaBot:
         short_context = None
         try:
             short_context = self.short_context.activate_shortContetxMem()
-            if short_context and str(short_context) == "[]":
+            if not short_context:
                 short_context = None
         except Exception as e:
             print(f"[MEMORY] ⚠️ Lỗi khi load context: {str(e)}")
             short_context = None
         
-        # 3. Xây dựng prompt với nhiều luồng dữ liệu - safe approach
-        memory_context = ""
-        if long_term_memories and len(long_term_memories) > 0:
-            memory_context += "\nký ức từ trước:\n"
-            # Safe slicing để tránh lỗi index
-            safe_memories = long_term_memories[:min(3, len(long_term_memories))]
-            for memory in safe_memories:
-                if memory and memory.strip():
-                    memory_context += f"- {memory}\n"
-        
-        conversation_context = ""
-        if short_context and len(short_context) > 0:
-            conversation_context += "\ncuộc trò chuyện gần đây:\n"
-            # Safe slicing để tránh lỗi index
-            safe_context = short_context[-min(6, len(short_context)):]
-            for context in safe_context:
-                if context and context.strip():
-                    conversation_context += f"{context}\n"
-        
-        # 4. Tạo prompt hoàn chỉnh ngắn gọn
-        full_prompt = f"""{self.get_system_prompt()}
-{memory_context}
-{conversation_context}
-tin nhắn: {user_message}
-
-trả lời:"""
+        # 3. Xây dựng prompt với nhiều luồng dữ liệu - giữ trong token budget
+        budget = (self.prompt_token_budget - _estimate_tokens(self.system_prompt)
+                  - _estimate_tokens(user_message) - _PROMPT_OVERHEAD_TOKENS)
+        
+        # Ưu tiên ngữ cảnh gần đây: lấy từ tin mới nhất ngược về, hết budget thì bỏ các tin cũ hơn
+        conversation_lines = []
+        if short_context:
+            for context in reversed(short_context[-6:]):
+                if not (context and context.strip()):
+                    continue
+                cost = _estimate_tokens(context) + 1
+                if cost > budget:
+                    break
+                budget -= cost
+                conversation_lines.append(f"{context}\n")
+            conversation_lines.reverse()
+        
+        # Ký ức dùng phần budget còn lại
+        memory_lines = []
+        if long_term_memories:
+            for memory in long_term_memories[:3]:
+                if not (memory and memory.strip()):
+                    continue
+                cost = _estimate_tokens(memory) + 1
+                if cost > budget:
+                    break
+                budget -= cost
+                memory_lines.append(f"- {memory}\n")
+        
+        memory_context = "".join(("\nký ức từ trước:\n", *memory_lines)) if memory_lines else ""
+        conversation_context = "".join(("\ncuộc trò chuyện gần đây:\n", *conversation_lines)) if conversation_lines else ""
+        
+        # 4. Tạo prompt hoàn chỉnh ngắn gọn (system prompt đã nằm trong model)
+        full_prompt = "".join((
+            memory_context, "\n",
+            conversation_context,
+            "\ntin nhắn: ", user_message,
+            "\n\ntrả lời:",
+        ))
 
         print(f"[CORE] 🤔 Đang phân tích tin nhắn: '{user_message[:30]}...'")
-        
-        # 5. Gọi Gemini AI với config từ config manager
-        generation_config = {
-            'temperature': self.config_manager.get('ai', 'temperature', 0.7),
-            'top_p': self.config_manager.get('ai', 'top_p', 0.8),
-            'top_k': self.config_manager.get('ai', 'top_k', 70),
-            'max_output_tokens': self.config_manager.get('ai', 'max_tokens', 1024),
+        return full_prompt
+
+    def refresh_ai_settings(self, ai_config):
+        """Dựng lại generation config và token budget của prompt từ config 'ai'"""
+        self.prompt_token_budget = ai_config.get('prompt_token_budget', 2048)
+        self.generation_config = {
+            'temperature': ai_config.get('temperature', 0.7),
+            'top_p': ai_config.get('top_p', 0.8),
+            'top_k': ai_config.get('top_k', 70),
+            'max_output_tokens': ai_config.get('max_tokens', 1024),
         }
-        
-        response = self.model.generate_content(
-            full_prompt,
-            generation_config=generation_config
-        )
-        ai_response = response.text.strip()
+
+    def finalize_response(self, user_message, response_text):
+        """
+        Post-process phản hồi của Gemini và lưu vào memory systems
+        """
+        ai_response = response_text.strip()
         
         # 6. Post-processing để đảm bảo ngắn gọn và tự nhiên
         ai_response = self.post_process_response(ai_response)
@@ -308,15 +568,11 @@ trả lời:"""
         
         # 8. Lưu vào Memory Systems - với safe error handling
         try:
-            # Lưu vào short context
-            self.short_context.save_to_shortContextMem(user_message, ai_response)
+            # Lưu vào short context (trong RAM ngay, file backup do memory flusher ghi)
+            self.short_context.save_to_shortContextMem(user_message, ai_response, backup=False)
             
-            # Lưu vào long term memory với safe wrapper
-            if self.safe_write_memory(user_message, ai_response):
-                self.stats['memories_written'] += 1
-                print(f"[MEMORY] 💾 Đã lưu vào memory systems")
-            else:
-                print(f"[MEMORY] ⚠️ Lưu memory thất bại nhưng bot vẫn hoạt động")
+            # Lưu vào long term memory - memory flusher ghi theo batch
+            self.queue_memory_write(user_message, ai_response)
                 
         except Exception as e:
             print(f"[MEMORY] ⚠️ Lỗi khi lưu short context: {str(e)}")
@@ -337,7 +593,7 @@ trả lời:"""
             result = self.image_generator.generate_image(description)
             
             # Reset state
-            self.is_generating_image = False
+            self.clear_image_request(username)
             
             # Return result với response text
             if result['success']:
@@ -351,36 +607,74 @@ trả lời:"""
             
         except Exception as e:
             print(f"[CORE] ❌ Lỗi critical trong image generation: {str(e)}")
-            self.is_generating_image = False
+            self.clear_image_request(username)
             return {
                 'success': False,
                 'error': str(e),
                 'response_text': f"sorry {username}, có lỗi nghiêm trọng khi tạo ảnh :(("
             }
 
+    def is_image_request_active(self, username):
+        """User đang có yêu cầu tạo ảnh chưa xong (chưa quá timeout)"""
+        with self.image_requests_lock:
+            requested_at = self.image_requests_at.get(username)
+        return requested_at is not None and time.time() - requested_at < _IMAGE_REQUEST_TIMEOUT
+
+    def clear_image_request(self, username):
+        """Bỏ trạng thái đang tạo ảnh của user"""
+        with self.image_requests_lock:
+            self.image_requests_at.pop(username, None)
+
+    def submit_image_generation(self, description, username="user"):
+        """
+        Chạy process_image_generation trên image executor -> concurrent.futures.Future
+        """
+        return self.image_executor.submit(self.process_image_generation, description, username)
+
+    async def aprocess_image_generation(self, description, username="user"):
+        """
+        Bản async của process_image_generation - nhiều user có thể tạo ảnh song song
+        """
+        return await asyncio.wrap_future(self.submit_image_generation(description, username))
+
+    @property
+    def is_generating_image(self):
+        """Có user nào đang chờ tạo ảnh không"""
+        return bool(self.image_requests_at)
+
     def post_process_response(self, response):
         """
         Chỉ xử lý cơ bản - loại bỏ emoji và lowercase
         """
-        import re
-        
         # Chỉ loại bỏ emoji và ký tự đặc biệt
-        cleaned_text = re.sub(r'[^\w\s\.\!\?\,\-\'\"]', '', response)
-        cleaned_text = ''.join(char for char in cleaned_text if ord(char) < 127 or char.isalpha())
+        cleaned_text = _SPECIAL_CHARS_RE.sub('', response)
+        cleaned_text = cleaned_text.translate(_KEEP_ASCII_AND_LETTERS)
         
         # Chuyển về lowercase
         cleaned_text = cleaned_text.lower()
         
         return cleaned_text.strip()
 
+    def count_memory_files(self, memories_dir="./memories"):
+        """
+        Đếm file ký ức .txt - chỉ quét lại thư mục khi mtime của thư mục đổi (có file mới/bị xóa)
+        """
+        try:
+            dir_mtime = os.stat(memories_dir).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+        
+        if self._memory_files_count is None or self._memory_files_count[0] != dir_mtime:
+            with os.scandir(memories_dir) as entries:
+                count = sum(1 for entry in entries if entry.name.endswith('.txt') and entry.is_file())
+            self._memory_files_count = (dir_mtime, count)
+        return self._memory_files_count[1]
+
     def get_memory_stats(self):
         """
         Lấy thống kê về memory system và image generation
         """
-        memories_count = 0
-        memories_dir = "./memories"
-        if os.path.exists(memories_dir):
-            memories_count = len([f for f in os.listdir(memories_dir) if f.endswith('.txt')])
+        memories_count = self.count_memory_files()
         
         # Image stats
         image_stats = {}
@@ -397,13 +691,13 @@ trả lời:"""
         analytics_stats = self.analytics_engine.get_conversation_trends(7)
         
         return {
-            'total_messages': self.stats['total_messages'],
-            'memories_activated': self.stats['memories_activated'],
-            'memories_written': self.stats['memories_written'],
-            'images_generated': self.stats['images_generated'],
+            'total_messages': self.stats.total_messages,
+            'memories_activated': self.stats.memories_activated,
+            'memories_written': self.stats.memories_written,
+            'images_generated': self.stats.images_generated,
             'total_memory_files': memories_count,
             'short_context_length': len(self.short_context.context) if self.short_context.context else 0,
-            'uptime_minutes': (datetime.now() - self.stats['start_time']).total_seconds() / 60,
+            'uptime_minutes': (time.monotonic() - self.stats.start_time) / 60,
             'image_generation_stats': image_stats,
             'is_generating_image': self.is_generating_image,
             'performance_stats': performance_stats,
@@ -419,20 +713,24 @@ trả lời:"""
         if not short_context:
             return "Chưa có cuộc trò chuyện nào"
         
-        analysis = {
+        # Tách tin nhắn user/bot và phân tích chủ đề trong một lượt duyệt
+        user_messages, bot_responses, topics_flow = [], [], []
+        for msg in short_context:
+            if msg.startswith('user:'):
+                user_messages.append(msg)
+                # Context đã được chuẩn hóa khoảng trắng khi lưu nên > 2 từ <=> > 1 dấu cách
+                clean_msg = msg[5:].strip()
+                if clean_msg.count(' ') > 1:
+                    topics_flow.append(clean_msg[:30] + "...")
+            elif msg.startswith('bot:'):
+                bot_responses.append(msg)
+        
+        return {
             'conversation_length': len(short_context),
-            'user_messages': [msg for msg in short_context if msg.startswith('user:')],
-            'bot_responses': [msg for msg in short_context if msg.startswith('bot:')],
-            'topics_flow': []
+            'user_messages': user_messages,
+            'bot_responses': bot_responses,
+            'topics_flow': topics_flow
         }
-        
-        # Phân tích chủ đề
-        for msg in analysis['user_messages']:
-            clean_msg = msg.replace('user:', '').strip()
-            if len(clean_msg.split()) > 2:
-                analysis['topics_flow'].append(clean_msg[:30] + "...")
-        
-        return analysis
 
     def clear_short_memory(self):
         """
@@ -467,6 +765,9 @@ def cleanup_insta_bot(bot):
     Cleanup function để dọn dẹp InstaBot
     """
     try:
+        if hasattr(bot, 'memory_flusher_thread'):
+            bot.flush_memory_writes()
+        
         if hasattr(bot, 'performance_monitor'):
             bot.performance_monitor.stop_monitoring()
             bot.performance_monitor.save_report()
@@ -481,6 +782,12 @@ def cleanup_insta_bot(bot):
         if hasattr(bot, 'notification_system'):
             bot.notification_system.stop()
         
+        if hasattr(bot, 'image_executor'):
+            bot.image_executor.shutdown(wait=False, cancel_futures=True)
+        
+        if hasattr(bot, 'prompt_cache'):
+            bot.delete_prompt_cache()
+        
         notify_info("InstaBot cleanup completed", "cleanup")
         
     except Exception as e:
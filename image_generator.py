@@ -1,5 +1,6 @@
 import re
 import time
+import threading
 from g4f.client import Client
 import google.generativeai as genai
 from datetime import datetime
@@ -40,7 +41,8 @@ class ImageGenerator:
             r'make (.+)',
         ]
         
-        # Statistics
+        # Statistics - generate_image chạy song song trên image executor nên cập nhật dưới lock
+        self.stats_lock = threading.Lock()
         self.stats = {
             'total_requests': 0,
             'successful_generations': 0,
@@ -200,7 +202,8 @@ class ImageGenerator:
         Generate image từ description với error handling
         """
         try:
-            self.stats['total_requests'] += 1
+            with self.stats_lock:
+                self.stats['total_requests'] += 1
             print(f"[IMAGE] 🎨 Đang tạo ảnh với prompt: '{description}'")
             
             # Enhance prompt trước khi tạo
@@ -215,7 +218,8 @@ class ImageGenerator:
             
             if response and response.data and len(response.data) > 0:
                 image_url = response.data[0].url
-                self.stats['successful_generations'] += 1
+                with self.stats_lock:
+                    self.stats['successful_generations'] += 1
                 print(f"[IMAGE] ✅ Tạo ảnh thành công: {image_url}")
                 return {
                     'success': True,
@@ -227,7 +231,8 @@ class ImageGenerator:
                 raise Exception("No image data returned")
                 
         except Exception as e:
-            self.stats['failed_generations'] += 1
+            with self.stats_lock:
+                self.stats['failed_generations'] += 1
             print(f"[IMAGE] ❌ Lỗi tạo ảnh: {str(e)}")
             return {
                 'success': False,
@@ -263,12 +268,14 @@ class ImageGenerator:
         """
         Lấy thống kê image generation
         """
-        uptime = (datetime.now() - self.stats['start_time']).total_seconds() / 60
+        with self.stats_lock:
+            stats = dict(self.stats)
+        uptime = (datetime.now() - stats['start_time']).total_seconds() / 60
         return {
-            'total_requests': self.stats['total_requests'],
-            'successful_generations': self.stats['successful_generations'],
-            'failed_generations': self.stats['failed_generations'],
-            'success_rate': (self.stats['successful_generations'] / max(1, self.stats['total_requests'])) * 100,
+            'total_requests': stats['total_requests'],
+            'successful_generations': stats['successful_generations'],
+            'failed_generations': stats['failed_generations'],
+            'success_rate': (stats['successful_generations'] / max(1, stats['total_requests'])) * 100,
             'uptime_minutes': uptime
         }
 
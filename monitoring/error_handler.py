@@ -1,5 +1,6 @@
 import time
 import traceback
+import inspect
 import logging
 from datetime import datetime
 from functools import wraps
@@ -262,6 +263,21 @@ def retry_on_error(max_attempts=3, delay=1, exceptions=(Exception,)):
 def log_errors(severity=ErrorSeverity.MEDIUM, context=""):
     """Decorator để tự động log errors"""
     def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                try:
+                    return await func(*args, **kwargs)
+                except Exception as e:
+                    error_handler = get_error_handler()
+                    error_handler.log_error(
+                        e, 
+                        context=context or func.__name__,
+                        severity=severity
+                    )
+                    raise e
+            return async_wrapper
+        
         @wraps(func)
         def wrapper(*args, **kwargs):
             try:
@@ -1,6 +1,8 @@
 import time
 import psutil
 import threading
+import inspect
+from functools import wraps
 from datetime import datetime, timedelta
 import json
 import os
@@ -243,7 +245,22 @@ def get_performance_monitor():
 
 # Decorator để đo response time
 def measure_response_time(func):
-    """Decorator để đo thời gian phản hồi"""
+    """Decorator để đo thời gian phản hồi (hỗ trợ cả hàm async)"""
+    if inspect.iscoroutinefunction(func):
+        @wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            start_time = time.time()
+            try:
+                result = await func(*args, **kwargs)
+                response_time = time.time() - start_time
+                get_performance_monitor().record_response_time(response_time)
+                return result
+            except Exception as e:
+                get_performance_monitor().record_error()
+                raise e
+        return async_wrapper
+    
+    @wraps(func)
     def wrapper(*args, **kwargs):
         start_time = time.time()
         try:
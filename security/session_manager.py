@@ -208,6 +208,7 @@ class SessionManager:
             encrypted_cookies = self.encrypt_data(cookies_data)
             
             self.sessions[session_name]['cookies'] = encrypted_cookies
+            self.sessions[session_name]['cookies_saved_at'] = datetime.now().isoformat()
             self.sessions[session_name]['last_activity'] = datetime.now().isoformat()
             
             self.save_sessions()
@@ -0,0 +1,164 @@
+import os
+import shutil
+import socket
+import tempfile
+import threading
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+
+# Số kết nối HTTP giữ sẵn tới ChromeDriver - listener thread và main thread gọi song song
+HTTP_POOL_MAXSIZE = 10
+
+
+def enlarge_connection_pool(driver, maxsize=HTTP_POOL_MAXSIZE):
+    """Thay urllib3 pool mặc định (maxsize=1) của driver bằng pool lớn hơn"""
+    # webdriver.Chrome chưa nhận client_config, nên sửa ClientConfig của executor rồi tạo lại pool
+    executor = driver.command_executor
+    executor._client_config.init_args_for_pool_manager = {
+        "init_args_for_pool_manager": {"maxsize": maxsize}
+    }
+    old_conn = getattr(executor, '_conn', None)
+    executor._conn = executor._get_connection_manager()
+    if old_conn is not None:
+        old_conn.clear()
+
+
+def _debug_port_from_options(options):
+    """Lấy port --remote-debugging-port trong options, chưa có thì chọn port trống và thêm vào"""
+    for arg in options.arguments:
+        if arg.startswith("--remote-debugging-port="):
+            return int(arg.split("=", 1)[1])
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('', 0))
+        port = s.getsockname()[1]
+    options.add_argument(f"--remote-debugging-port={port}")
+    return port
+
+
+class BrowserPool:
+    """Dùng chung một tiến trình Chrome cho nhiều session
+
+    Mỗi session nhận một WebDriver session riêng (attach vào Chrome chung qua debuggerAddress)
+    và một tab trong browser context riêng. Cửa sổ hiện tại thuộc về từng WebDriver session,
+    nên các session không giành tab của nhau. Driver trả về chỉ được dùng trên tab của chính nó,
+    không switch_to.window sang tab khác.
+    """
+
+    def __init__(self):
+        self.driver = None  # Session gốc: khởi động Chrome và chỉ dùng để tạo/đóng tab qua CDP
+        self.profile_dir = None
+        self.debugger_address = None
+        self.lock = threading.RLock()
+        self.tabs = {}  # target_id -> (browser_context_id, driver của session)
+
+        print("[BROWSER_POOL] 🧭 Browser Pool đã khởi tạo")
+
+    def _launch(self, options):
+        """Khởi động tiến trình Chrome dùng chung (chỉ gọi lần đầu)"""
+        self.profile_dir = tempfile.mkdtemp(prefix="chrome_selenium_")
+        options.add_argument(f"--user-data-dir={self.profile_dir}")
+        debug_port = _debug_port_from_options(options)
+        try:
+            self.driver = webdriver.Chrome(options=options)
+        except Exception:
+            shutil.rmtree(self.profile_dir, ignore_errors=True)
+            self.profile_dir = None
+            raise
+        self.debugger_address = f"127.0.0.1:{debug_port}"
+        print(f"[BROWSER_POOL] 🚀 Đã khởi động Chrome dùng chung, profile: {self.profile_dir}")
+
+    def _attach_session(self):
+        """Mở WebDriver session mới gắn vào Chrome đang chạy (không khởi động Chrome mới)"""
+        attach_options = Options()
+        attach_options.debugger_address = self.debugger_address
+        driver = webdriver.Chrome(options=attach_options)
+        enlarge_connection_pool(driver)
+        return driver
+
+    def acquire_tab(self, options):
+        """Lấy một tab mới (cookie tách biệt) -> (driver riêng của session, target_id)
+
+        options chỉ được dùng khi Chrome chưa chạy.
+        """
+        with self.lock:
+            if self.driver is None:
+                self._launch(options)
+
+            # Browser context riêng để cookie/localStorage không lẫn giữa các account
+            context_id = self.driver.execute_cdp_cmd('Target.createBrowserContext', {})['browserContextId']
+            target_id = self.driver.execute_cdp_cmd('Target.createTarget', {
+                'url': 'about:blank',
+                'browserContextId': context_id,
+            })['targetId']
+
+            try:
+                driver = self._attach_session()
+                # ChromeDriver dùng targetId làm window handle - cửa sổ hiện tại chỉ của session này
+                driver.switch_to.window(target_id)
+            except Exception:
+                self._close_target(target_id, context_id)
+                raise
+
+            self.tabs[target_id] = (context_id, driver)
+            print(f"[BROWSER_POOL] ➕ Tab mới {target_id[:8]} ({len(self.tabs)} tab đang dùng)")
+            return driver, target_id
+
+    def _close_target(self, target_id, context_id):
+        """Đóng tab và browser context qua session gốc"""
+        try:
+            self.driver.execute_cdp_cmd('Target.closeTarget', {'targetId': target_id})
+            self.driver.execute_cdp_cmd('Target.disposeBrowserContext', {'browserContextId': context_id})
+        except Exception as e:
+            print(f"[BROWSER_POOL] ⚠️ Lỗi khi đóng tab {target_id[:8]}: {str(e)}")
+
+    def release_tab(self, target_id):
+        """Đóng tab và browser context của nó, giữ lại tiến trình Chrome"""
+        with self.lock:
+            tab = self.tabs.pop(target_id, None)
+            if self.driver is None or tab is None:
+                return
+            context_id, driver = tab
+            self._close_target(target_id, context_id)
+            # Session attach không tắt Chrome khi quit, chỉ đóng chromedriver của nó
+            try:
+                driver.quit()
+            except Exception:
+                pass
+            print(f"[BROWSER_POOL] ➖ Đã đóng tab {target_id[:8]} ({len(self.tabs)} tab đang dùng)")
+
+    def active_tabs(self):
+        """Số tab đang được sử dụng"""
+        with self.lock:
+            return len(self.tabs)
+
+    def shutdown(self):
+        """Tắt Chrome dùng chung và xóa temp profile"""
+        with self.lock:
+            for _, driver in self.tabs.values():
+                try:
+                    driver.quit()
+                except Exception:
+                    pass
+            self.tabs.clear()
+            if self.driver is not None:
+                try:
+                    self.driver.quit()
+                except Exception:
+                    pass
+                self.driver = None
+            if self.profile_dir and os.path.exists(self.profile_dir):
+                shutil.rmtree(self.profile_dir, ignore_errors=True)
+            self.profile_dir = None
+            self.debugger_address = None
+            print("[BROWSER_POOL] 🛑 Đã tắt Chrome dùng chung")
+
+
+# Singleton instance
+_browser_pool = None
+
+def get_browser_pool():
+    """Lấy instance singleton của BrowserPool"""
+    global _browser_pool
+    if _browser_pool is None:
+        _browser_pool = BrowserPool()
+    return _browser_pool
@@ -0,0 +1,35 @@
+import sys
+import logging
+from logging.handlers import MemoryHandler
+
+# Gom log vào buffer, chỉ ghi ra stdout khi đủ 100 dòng hoặc gặp WARNING trở lên
+BUFFER_CAPACITY = 100
+
+_root_logger = logging.getLogger("instachat")
+
+
+def _setup_root_logger():
+    """Gắn MemoryHandler -> StreamHandler cho logger 'instachat' (chỉ chạy một lần)"""
+    if _root_logger.handlers:
+        return
+    stream_handler = logging.StreamHandler(sys.stdout)
+    # Giữ nguyên định dạng như print cũ
+    stream_handler.setFormatter(logging.Formatter("%(message)s"))
+    _root_logger.addHandler(MemoryHandler(
+        capacity=BUFFER_CAPACITY, flushLevel=logging.WARNING, target=stream_handler
+    ))
+    _root_logger.setLevel(logging.INFO)
+    # Không đẩy lên root logger (error_handler đã gắn StreamHandler ở đó -> in 2 lần)
+    _root_logger.propagate = False
+
+
+def get_logger(name=None):
+    """Lấy logger con của 'instachat' có buffer"""
+    _setup_root_logger()
+    return _root_logger.getChild(name) if name else _root_logger
+
+
+def flush_logs():
+    """Ghi ngay những dòng log đang nằm trong buffer"""
+    for handler in _root_logger.handlers:
+        handler.flush()
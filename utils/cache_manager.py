@@ -6,6 +6,9 @@ import pickle
 from datetime import datetime, timedelta
 from collections import OrderedDict
 import threading
+import re
+import zlib
+import numpy as np
 
 
 class CacheManager:
@@ -291,13 +294,37 @@ class CacheManager:
         print(f"[CACHE] ===============================\n")
 
 
+# Semantic cache: vector trigram ký tự (hash vào _EMBED_DIM chiều), so bằng cosine similarity
+_EMBED_DIM = 1024
+_SEMANTIC_RING_SIZE = 200
+_SEMANTIC_THRESHOLD = 0.92
+_PUNCT_RE = re.compile(r'[^\w\s]')
+
+
+def embed_message(text):
+    """Chuỗi -> vector trigram ký tự đã chuẩn hóa (norm = 1)"""
+    # Bỏ dấu câu, gộp khoảng trắng để 'ok.' và 'ok' cho cùng vector
+    text = f" {' '.join(_PUNCT_RE.sub('', text.lower()).split())} "
+    vector = np.zeros(_EMBED_DIM, dtype=np.float32)
+    if len(text) < 3:
+        return vector
+    indices = [zlib.crc32(text[i:i + 3].encode('utf-8')) % _EMBED_DIM for i in range(len(text) - 2)]
+    np.add.at(vector, indices, 1.0)
+    vector /= np.linalg.norm(vector)
+    return vector
+
+
 # Specialized cache classes
 class ResponseCache(CacheManager):
     """Cache chuyên dụng cho AI responses"""
     
     def __init__(self):
         super().__init__(cache_dir="utils/cache/responses", max_memory_items=500)
-        self.response_patterns = {}
+        
+        # Ring buffer (vector, user_id, cache_key) của các message đã cache gần nhất
+        self.semantic_vectors = np.zeros((_SEMANTIC_RING_SIZE, _EMBED_DIM), dtype=np.float32)
+        self.semantic_entries = [None] * _SEMANTIC_RING_SIZE
+        self.semantic_index = 0
     
     def cache_response(self, user_message, response, user_id="default", ttl_seconds=7200):
         """Cache AI response"""
@@ -313,8 +340,8 @@ class ResponseCache(CacheManager):
         
         self.set(cache_key, response_data, ttl_seconds)
         
-        # Lưu pattern để tìm similar responses
-        self.save_response_pattern(user_message, cache_key)
+        # Lưu vector để tìm similar responses
+        self.save_semantic_entry(user_message, user_id, cache_key)
     
     def get_cached_response(self, user_message, user_id="default"):
         """Lấy cached response"""
@@ -325,7 +352,7 @@ class ResponseCache(CacheManager):
             return cached_data['response']
         
         # Tìm similar response
-        return self.find_similar_response(user_message, user_id)
+        return self.semantic_lookup(embed_message(user_message), user_id)
     
     def generate_response_key(self, message, user_id):
         """Tạo key cho response cache"""
@@ -333,32 +360,28 @@ class ResponseCache(CacheManager):
         normalized = message.lower().strip()
         return self.generate_cache_key(f"{normalized}_{user_id}")
     
-    def save_response_pattern(self, message, cache_key):
-        """Lưu pattern để tìm similar responses"""
-        words = set(message.lower().split())
-        for word in words:
-            if len(word) > 3:  # Chỉ lưu từ có ý nghĩa
-                if word not in self.response_patterns:
-                    self.response_patterns[word] = []
-                self.response_patterns[word].append(cache_key)
+    def save_semantic_entry(self, message, user_id, cache_key):
+        """Ghi vector của message vào ring buffer - slot cũ nhất tự bị ghi đè"""
+        with self.lock:
+            slot = self.semantic_index % _SEMANTIC_RING_SIZE
+            self.semantic_vectors[slot] = embed_message(message)
+            self.semantic_entries[slot] = (user_id, cache_key)
+            self.semantic_index += 1
     
-    def find_similar_response(self, message, user_id):
-        """Tìm response tương tự"""
-        words = set(message.lower().split())
-        candidate_keys = []
-        
-        for word in words:
-            if word in self.response_patterns:
-                candidate_keys.extend(self.response_patterns[word])
-        
-        # Tìm key xuất hiện nhiều nhất
-        if candidate_keys:
-            from collections import Counter
-            most_common_key = Counter(candidate_keys).most_common(1)[0][0]
-            cached_data = self.get(most_common_key)
-            
-            if cached_data:
-                return cached_data['response']
+    def semantic_lookup(self, query_vector, user_id, threshold=_SEMANTIC_THRESHOLD):
+        """Tìm response của message gần nghĩa nhất (cosine >= threshold) của cùng user"""
+        with self.lock:
+            # Vector đã chuẩn hóa nên dot product chính là cosine similarity
+            scores = self.semantic_vectors @ query_vector
+            for slot in np.argsort(scores)[::-1]:
+                if scores[slot] < threshold:
+                    break
+                entry = self.semantic_entries[slot]
+                if entry is None or entry[0] != user_id:
+                    continue
+                cached_data = self.get(entry[1])
+                if cached_data:
+                    return cached_data['response']
         
         return None
 
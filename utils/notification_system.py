@@ -42,10 +42,14 @@ class NotificationSystem:
         # Setup channels
         self.setup_channels()
         
-        # Background worker
+        # Background worker - gom notification thành batch, mỗi lần wake xử lý hết queue
         self.worker_active = False
         self.notification_queue = deque()
         self.queue_lock = threading.Lock()
+        self.queue_event = threading.Event()
+        
+        # Thời điểm các notification được nhận trong 60 giây gần nhất (cho rate limit)
+        self.recent_send_times = deque()
         
         print("[NOTIFY] 🔔 Notification System đã khởi tạo")
 
@@ -130,14 +134,15 @@ class NotificationSystem:
         if not self.should_send_notification(notification):
             return False
         
-        # Thêm vào queue
-        with self.queue_lock:
-            self.notification_queue.append(notification)
-        
         # Process ngay lập tức cho critical notifications
         if level == NotificationLevel.CRITICAL:
             self.process_notification(notification)
         else:
+            # Thêm vào queue, worker flush theo batch
+            with self.queue_lock:
+                self.notification_queue.append(notification)
+            self.queue_event.set()
+            
             # Start worker nếu chưa active
             if not self.worker_active:
                 self.start_worker()
@@ -169,13 +174,16 @@ class NotificationSystem:
         if rate_limit <= 0:
             return True
         
-        current_time = time.time()
-        recent_notifications = [
-            n for n in self.notifications
-            if current_time - time.mktime(datetime.fromisoformat(n['timestamp']).timetuple()) < 60
-        ]
-        
-        return len(recent_notifications) < rate_limit
+        # Bỏ các mốc thời gian quá 60 giây ở đầu deque thay vì parse lại toàn bộ history
+        current_time = time.monotonic()
+        with self.queue_lock:
+            while self.recent_send_times and current_time - self.recent_send_times[0] >= 60:
+                self.recent_send_times.popleft()
+            
+            if len(self.recent_send_times) >= rate_limit:
+                return False
+            self.recent_send_times.append(current_time)
+        return True
 
     def generate_notification_id(self):
         """Tạo notification ID unique"""
@@ -195,16 +203,16 @@ class NotificationSystem:
         """Worker loop xử lý notifications"""
         while self.worker_active:
             try:
+                # Chờ tới khi có notification mới thay vì poll mỗi 0.1s
+                self.queue_event.wait(timeout=1)
+                self.queue_event.clear()
+                
                 with self.queue_lock:
-                    if self.notification_queue:
-                        notification = self.notification_queue.popleft()
-                    else:
-                        notification = None
+                    batch = list(self.notification_queue)
+                    self.notification_queue.clear()
                 
-                if notification:
-                    self.process_notification(notification)
-                else:
-                    time.sleep(0.1)  # Short sleep when queue is empty
+                if batch:
+                    self.process_batch(batch)
                     
             except Exception as e:
                 print(f"[NOTIFY] ❌ Worker error: {str(e)}")
@@ -234,6 +242,35 @@ class NotificationSystem:
         except Exception as e:
             print(f"[NOTIFY] ❌ Error processing notification: {str(e)}")
 
+    def process_batch(self, batch):
+        """Xử lý một batch notification - mỗi channel chỉ flush một lần"""
+        try:
+            # Lưu vào history
+            self.notifications.extend(batch)
+            
+            # Gửi qua các channels
+            for channel_type, channel in self.channels.items():
+                try:
+                    if hasattr(channel, 'send_batch'):
+                        channel.send_batch(batch)
+                    else:
+                        for notification in batch:
+                            channel.send(notification)
+                    self.notification_stats['by_channel'][channel_type.value] += len(batch)
+                except Exception as e:
+                    print(f"[NOTIFY] ❌ Error sending to {channel_type.value}: {str(e)}")
+            
+            # Cập nhật stats
+            self.notification_stats['total_sent'] += len(batch)
+            for notification in batch:
+                self.notification_stats['by_level'][notification['level']] += 1
+                
+                # Notify subscribers
+                self.notify_subscribers(notification)
+            
+        except Exception as e:
+            print(f"[NOTIFY] ❌ Error processing batch: {str(e)}")
+
     def notify_subscribers(self, notification):
         """Thông báo cho subscribers"""
         level = notification['level']
@@ -313,6 +350,7 @@ class NotificationSystem:
     def stop(self):
         """Dừng notification system"""
         self.worker_active = False
+        self.queue_event.set()
         print("[NOTIFY] 🛑 Notification system stopped")
 
 
@@ -330,6 +368,14 @@ class ConsoleNotifier:
 
     def send(self, notification):
         """Gửi notification ra console"""
+        print(self.format(notification))
+
+    def send_batch(self, batch):
+        """Gửi cả batch ra console bằng một lần print"""
+        print("\n".join(self.format(notification) for notification in batch))
+
+    def format(self, notification):
+        """Format một notification thành dòng console"""
         level = notification['level']
         message = notification['message']
         context = notification['context']
@@ -351,7 +397,7 @@ class ConsoleNotifier:
         if context:
             output += f" ({context})"
         
-        print(output)
+        return output
 
 
 class FileNotifier:
@@ -364,17 +410,24 @@ class FileNotifier:
 
     def send(self, notification):
         """Gửi notification vào file"""
+        self.send_batch([notification])
+
+    def send_batch(self, batch):
+        """Ghi cả batch vào file bằng một lần mở file"""
         try:
-            log_entry = {
-                'timestamp': notification['timestamp'],
-                'level': notification['level'],
-                'message': notification['message'],
-                'context': notification['context'],
-                'metadata': notification.get('metadata', {})
-            }
+            lines = []
+            for notification in batch:
+                log_entry = {
+                    'timestamp': notification['timestamp'],
+                    'level': notification['level'],
+                    'message': notification['message'],
+                    'context': notification['context'],
+                    'metadata': notification.get('metadata', {})
+                }
+                lines.append(json.dumps(log_entry, ensure_ascii=False) + '\n')
             
             with open(self.log_file, 'a', encoding='utf-8') as f:
-                f.write(json.dumps(log_entry, ensure_ascii=False) + '\n')
+                f.writelines(lines)
             
             # Kiểm tra kích thước file
             self.rotate_log_if_needed()